@@ -0,0 +1,297 @@
+"""
+Benchmarks of the poker engine and the bot handlers.
+
+    python benchmark.py                   # run everything, compare with benchmark_baseline.json
+    python benchmark.py --quick           # fewer cases and repeats (e.g. for CI)
+    python benchmark.py --save-baseline   # store this run as the new baseline (with --only: those cases)
+    python benchmark.py --only montecarlo/flop --output results.json
+
+Every case reports its throughput (units per second, e.g. simulated hands, in the
+best of ROUNDS timed rounds of at least MIN_ROUND_SECONDS each), p50/p99 latency
+of one call and the peak memory of one call (Python and NumPy allocations, via
+tracemalloc). The run exits with status 1 if the throughput of any case is more
+than --threshold percent below the baseline. Baselines are machine specific: save
+one on the machine the comparison runs on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+
+from poker.card import CARDS, RANKS, SUITS, Card, canonicalize
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Allowed throughput drop against the baseline, in percent
+DEFAULT_THRESHOLD = 20.0
+
+HERO = [Card('A', '♠'), Card('K', '♠')]
+OMAHA_HERO = HERO + [Card('J', '♥'), Card('T', '♦')]
+BOARD = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('T', '♥'), Card('5', '♠')]
+STREETS = {'preflop': 0, 'flop': 3, 'turn': 4, 'river': 5}
+
+SIM_SAMPLES = 20000
+
+# Timed rounds per case and their minimum length; the best round is reported
+ROUNDS = 3
+MIN_ROUND_SECONDS = 0.2
+
+
+def measure(fn: Callable[[int], int], repeat: int, unit: str, warmup: int = 1, rounds: int = ROUNDS,
+            min_time: float = MIN_ROUND_SECONDS) -> Dict[str, float]:
+    """
+    Calls fn(i) (after `warmup` untimed calls) in `rounds` timed rounds, each lasting
+    at least min_time seconds and repeat / rounds calls; fn returns how many units
+    of work it did. The throughput is the best round's, the least disturbed by
+    whatever else the machine was doing, so sub-millisecond cases compare stably.
+    Memory is measured on one extra call, since tracing slows the calls down.
+    """
+    for i in range(warmup):
+        fn(i)
+
+    latencies = []
+    throughputs = []
+    calls_per_round = max(1, -(-repeat // rounds))
+    i = 0
+    for _ in range(rounds):
+        units, elapsed, calls = 0, 0.0, 0
+        while calls < calls_per_round or elapsed < min_time:
+            start = time.perf_counter()
+            units += fn(i)
+            latencies.append(time.perf_counter() - start)
+            elapsed += latencies[-1]
+            calls += 1
+            i += 1
+        throughputs.append(units / elapsed)
+
+    tracemalloc.start()
+    try:
+        fn(i)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'unit': unit,
+        'throughput': max(throughputs),
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+        'peak_kb': peak / 1024,
+        'calls': len(latencies),
+    }
+
+
+def montecarlo_cases(quick: bool) -> Dict[str, Callable[[int], Dict[str, float]]]:
+    from poker.montecarlo import MonteCarloSimulation
+    simulation = MonteCarloSimulation()
+    opponents = [1, 9] if quick else range(1, 10)
+
+    def case(street, num_opponents):
+        board = BOARD[:STREETS[street]]
+
+        def run(i):
+            # Sampling (not the table or exact enumeration) so every street does the same work
+            result = simulation.run(HERO, board, num_opponents, SIM_SAMPLES, exact=False, seed=i)
+            return result['samples']
+        return lambda repeat: measure(run, repeat, 'hands')
+
+    return {f"montecarlo/{street}/{n}opp": case(street, n) for street in STREETS for n in opponents}
+
+
+def analyzer_cases(quick: bool) -> Dict[str, Callable[[int], Dict[str, float]]]:
+    from poker.analysis import HandAnalyzer
+    analyzer = HandAnalyzer()
+
+    def case(street):
+        board = BOARD[:STREETS[street]]
+
+        def run(i):
+            analyzer._streets.clear()  # a fresh spot, not the previous street
+            analyzer.format_analysis(analyzer.analyze_stronger_hands(HERO, board))
+            return 1
+        return lambda repeat: measure(run, repeat, 'spots')
+
+    def street_by_street(i):
+        # Flop, then turn and river extending it, as a hand is played
+        analyzer._streets.clear()
+        for n in (3, 4, 5):
+            analyzer.format_analysis(analyzer.analyze_stronger_hands(HERO, BOARD[:n]))
+        return 3
+
+    cases = {f"analyzer/{street}": case(street) for street in ('flop', 'turn', 'river')}
+    cases['analyzer/street_by_street'] = lambda repeat: measure(street_by_street, repeat, 'spots')
+    return cases
+
+
+def omaha_cases(quick: bool) -> Dict[str, Callable[[int], Dict[str, float]]]:
+    from poker.omaha import OmahaAnalyzer, OmahaSimulation
+    simulation = OmahaSimulation()
+    analyzer = OmahaAnalyzer()
+    opponents = [1, 5] if quick else range(1, 6)
+
+    def sampling(street, num_opponents):
+        board = BOARD[:STREETS[street]]
+
+        def run(i):
+            result = simulation.run(OMAHA_HERO, board, num_opponents, SIM_SAMPLES, exact=False, seed=i)
+            return result['samples']
+        return lambda repeat: measure(run, repeat, 'hands')
+
+    def analysis(street):
+        board = BOARD[:STREETS[street]]
+
+        def run(i):
+            analyzer._streets.clear()
+            analyzer.format_analysis(analyzer.analyze_stronger_hands(OMAHA_HERO, board))
+            return 1
+        return lambda repeat: measure(run, repeat, 'spots')
+
+    cases = {f"omaha/{street}/{n}opp": sampling(street, n) for street in STREETS for n in opponents}
+    cases.update({f"omaha/analyzer/{street}": analysis(street) for street in ('flop', 'turn', 'river')})
+    return cases
+
+
+def card_cases(quick: bool) -> Dict[str, Callable[[int], Dict[str, float]]]:
+    callbacks = [f"rank:{r}:{s}" for r in RANKS for s in SUITS]
+
+    def convert(i):
+        # What a callback costs before any engine runs: parse, index, canonicalize
+        cards = [Card(*data.split(':')[1:]) for data in callbacks]
+        for start in range(0, 49, 7):
+            canonicalize(cards[start:start + 2], cards[start + 2:start + 7])
+        return len(cards)
+
+    return {'cards/convert': lambda repeat: measure(convert, repeat * 100, 'cards')}
+
+
+def _mock_update(data: str) -> MagicMock:
+    from telegram import Update
+    update = MagicMock(spec=Update)
+    update.callback_query = AsyncMock()
+    update.callback_query.data = data
+    return update
+
+
+def handler_cases(quick: bool) -> Dict[str, Callable[[int], Dict[str, float]]]:
+    def session(repeat):
+        from bot import handlers
+
+        async def play(i, context):
+            # A different spot every session, so the worker caches don't answer it
+            cards = random.Random(i).sample(CARDS, 7)
+            callbacks = ['action:reset']
+            for card in cards:
+                callbacks += [f"suit:{card.suit}", f"rank:{card.rank}:{card.suit}"]
+            for data in callbacks:
+                await handlers.handle_callback(_mock_update(data), context)
+            return len(callbacks)
+
+        # measure() is synchronous, so it drives each session to completion on its own loop
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(handlers.compute.start())
+
+            def run(i):
+                return loop.run_until_complete(play(i, MagicMock(user_data={})))
+            return measure(run, repeat, 'callbacks')
+        finally:
+            handlers.compute.shutdown()
+            loop.close()
+
+    return {'handlers/session': session}
+
+
+SUITES = [montecarlo_cases, analyzer_cases, omaha_cases, card_cases, handler_cases]
+
+
+def run_benchmarks(quick: bool = False, only: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    repeat = 3 if quick else 10
+    results = {}
+    for suite in SUITES:
+        for name, case in suite(quick).items():
+            if only and not name.startswith(only):
+                continue
+            results[name] = case(repeat)
+            r = results[name]
+            print(f"{name:32} {r['throughput']:12.0f} {r['unit']}/s  p50 {r['p50_ms']:8.2f} ms  "
+                  f"p99 {r['p99_ms']:8.2f} ms  peak {r['peak_kb']:9.0f} KB", flush=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Messages for every case whose throughput is more than threshold % below its baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, now = baseline[name]['throughput'], result['throughput']
+        drop = (before - now) / before * 100
+        if drop > threshold:
+            regressions.append(f"{name}: {now:.0f} {result['unit']}/s, {drop:.1f}% below baseline {before:.0f}")
+    return regressions
+
+
+def _metadata() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%d'),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the poker engine and bot handlers.")
+    parser.add_argument('--quick', action='store_true', help="fewer cases and repeats")
+    parser.add_argument('--only', help="run only cases whose name starts with this prefix")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed throughput drop in percent (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results to --baseline")
+    parser.add_argument('--output', help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.quick, args.only)
+    report = {'meta': _metadata(), 'cases': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        if args.only and os.path.exists(args.baseline):
+            # Only some cases ran: keep the baseline of the others
+            with open(args.baseline) as f:
+                report['cases'] = dict(json.load(f)['cases'], **results)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['cases']
+
+    regressions = compare(results, baseline, args.threshold)
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if not regressions:
+        print(f"No case regressed more than {args.threshold:g}% against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
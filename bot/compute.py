@@ -0,0 +1,335 @@
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from poker.card import Card
+from . import metrics
+
+# Engines live in each worker process; they are built on the first job a worker runs.
+_simulation = None
+_analyzer = None
+# PLO engines, built on a worker's first PLO spot
+_omaha = None
+# Worker side of the channel intermediate estimates (and metrics) are streamed back through
+_progress = None
+# Whether the parent process records metrics; workers then send their timings over _progress
+_report_metrics = False
+# Shared flags, one per job id modulo CANCEL_SLOTS, set by the parent to stop a job early
+_cancelled = None
+
+CANCEL_SLOTS = 4096
+
+# Seconds between checks of the profiling flag while the parent isn't profiling
+PROFILE_POLL_INTERVAL = 0.1
+
+
+def _init_worker(progress_queue, report_metrics=False, cancelled=None, profiling=None):
+    global _progress, _report_metrics, _cancelled
+    _progress = progress_queue
+    _report_metrics = report_metrics
+    _cancelled = cancelled
+    if report_metrics and profiling is not None:
+        threading.Thread(target=_profile_worker, args=(profiling,), name='worker-profiler', daemon=True).start()
+
+
+def _profile_worker(profiling):
+    """
+    Samples this worker's stacks while the parent's profiler runs (the shared
+    `profiling` flag is set) and sends them over _progress in batches.
+    """
+    profiler = metrics.SamplingProfiler(prefix=f"worker {os.getpid()};")
+    while True:
+        if not profiling.value:
+            time.sleep(PROFILE_POLL_INTERVAL)
+            continue
+        flushed = time.perf_counter()
+        while profiling.value:
+            profiler.sample()
+            time.sleep(profiler.interval)
+            if time.perf_counter() - flushed > metrics.WORKER_FLUSH_INTERVAL / 2:
+                _progress.put(('profile', dict(profiler.stacks)))
+                profiler.stacks.clear()
+                flushed = time.perf_counter()
+        _progress.put(('profile', dict(profiler.stacks)))
+        profiler.stacks.clear()
+
+
+def _is_cancelled(job_id: int) -> bool:
+    return _cancelled is not None and bool(_cancelled[job_id % CANCEL_SLOTS])
+
+
+def _engines():
+    global _simulation, _analyzer
+    if _simulation is None:
+        from poker.cache import CachedSimulation, CachedAnalyzer
+        from poker.store import store_from_env
+        cache_size = int(os.getenv('EQUITY_CACHE_SIZE', 4096))
+        # Results persisted in EQUITY_DB are shared by every worker and bot process
+        store = store_from_env()
+        _simulation = CachedSimulation(maxsize=cache_size, store=store)
+        _analyzer = CachedAnalyzer(maxsize=cache_size, store=store)
+    return _simulation, _analyzer
+
+
+def _engines_for(hero: List[Card]):
+    """Hold'em engines, or the PLO ones for a 4-card hand (they share the caches' store)."""
+    global _omaha
+    simulation, analyzer = _engines()
+    if len(hero) != 4:
+        return simulation, analyzer
+    if _omaha is None:
+        from poker.cache import CachedSimulation, CachedAnalyzer
+        from poker.omaha import OmahaSimulation, OmahaAnalyzer
+        # Keys hold the hero's cards, so PLO and Hold'em entries never collide
+        _omaha = (CachedSimulation(OmahaSimulation(), simulation.cache.memory.maxsize, simulation.cache.store),
+                  CachedAnalyzer(OmahaAnalyzer(), analyzer.cache.memory.maxsize, analyzer.cache.store))
+    return _omaha
+
+
+def _warm_up() -> int:
+    _engines()
+    return os.getpid()
+
+
+def compute_spot(hero: List[Card], board: List[Card], num_opponents: int = 1,
+                 iterations: int = 15000, **options) -> Tuple[Dict[str, float], str]:
+    """
+    Runs equity and stronger-hands analysis for one spot (PLO when `hero` has 4
+    cards); `options` go to MonteCarloSimulation.run (e.g. target_stderr, time_budget).
+    Returns (probs, analysis_text) ready to be stored in user_data.
+    """
+    simulation, analyzer = _engines_for(hero)
+    hits = simulation.cache.hits
+    start = time.perf_counter()
+    outs = None
+    if _wants_outs(hero, board, num_opponents, options):
+        probs, outs = simulation.run_with_outs(hero, board, num_opponents)
+    else:
+        probs = simulation.run(hero, board, num_opponents=num_opponents, iterations=iterations, **options)
+    simulated = time.perf_counter()
+    text = _analysis_text(analyzer, hero, board, outs)
+    _report_engine(board, probs, simulated - start, time.perf_counter() - simulated, simulation.cache.hits > hits)
+    return probs, text
+
+
+def stream_spot(job_id: int, hero: List[Card], board: List[Card], num_opponents: int = 1,
+                iterations: int = 15000, report_interval: float = 0.25, **options) -> Tuple[Dict[str, float], str]:
+    """
+    compute_spot that also pushes every intermediate estimate to the progress
+    channel as (job_id, probs). The final estimate is only returned.
+    Returns None if the job was cancelled (ComputeBackend.cancel) before it finished.
+    """
+    if _is_cancelled(job_id):
+        return None
+    simulation, analyzer = _engines_for(hero)
+    hits = simulation.cache.hits
+    start = time.perf_counter()
+    previous = outs = None
+    if _wants_outs(hero, board, num_opponents, options):
+        # Exact, so there are no intermediate estimates to stream; a built flop
+        # table shows the equity at once while the outs are enumerated
+        flop_table = simulation.simulation.flop_table
+        if len(board) == 3 and flop_table is not None:
+            quick = flop_table.lookup(hero, board)
+            if quick is not None:
+                _progress.put(('progress', job_id, quick))
+        previous, outs = simulation.run_with_outs(hero, board, num_opponents)
+    else:
+        for probs in simulation.iter_run(hero, board, num_opponents=num_opponents, iterations=iterations,
+                                         report_interval=report_interval, **options):
+            if previous is not None:
+                _progress.put(('progress', job_id, previous))
+            previous = probs
+            if _is_cancelled(job_id):
+                # Leaving the loop closes iter_run, so the partial result isn't cached
+                return None
+    simulated = time.perf_counter()
+    text = _analysis_text(analyzer, hero, board, outs)
+    _report_engine(board, previous, simulated - start, time.perf_counter() - simulated, simulation.cache.hits > hits)
+    return previous, text
+
+
+def _report_engine(board: List[Card], probs: Dict[str, float], simulation_seconds: float,
+                   analysis_seconds: float, cached: bool):
+    """Sends a job's timings to the parent's metrics registry (see metrics.apply)."""
+    if not _report_metrics:
+        return
+    labels = {'street': metrics.street_name(len(board))}
+    observations = [
+        ('engine_simulation_seconds', 'observe', labels, simulation_seconds),
+        ('engine_analysis_seconds', 'observe', labels, analysis_seconds),
+    ]
+    # Cached and preflop (table) results did no sampling work of their own
+    if not cached and board and simulation_seconds > 0:
+        observations.append(('engine_samples_total', 'inc', labels, probs['samples']))
+        observations.append(('engine_samples_per_second', 'set', labels, probs['samples'] / simulation_seconds))
+    _progress.put(('metrics', observations))
+
+
+def _wants_outs(hero: List[Card], board: List[Card], num_opponents: int, options: Dict) -> bool:
+    """
+    Heads-up Hold'em flop and turn spots against a random hand are enumerated exactly
+    anyway; the outs then come from the same enumeration at almost no extra cost.
+    """
+    return (len(hero) == 2 and len(board) in (3, 4) and num_opponents == 1 and options.get('opponent_ranges') is None
+            and options.get('exact') is not False)
+
+
+def _analysis_text(analyzer, hero: List[Card], board: List[Card], outs: Optional[Dict] = None) -> str:
+    stronger_hands = analyzer.analyze_stronger_hands(hero, board)
+    formatted = analyzer.format_analysis(stronger_hands)
+
+    # If board is present but no stronger hands found -> Hero has Nuts
+    if not formatted and len(board) >= 3:
+         formatted = "\n<b>💪 У вас сильнейшая рука! (Nuts)</b>\n"
+
+    if outs is not None:
+        formatted += analyzer.format_outs(outs)
+        formatted += analyzer.format_distribution(outs['distribution'])
+    return formatted
+
+
+class ComputeBusy(Exception):
+    """Raised when the compute queue is full; the user should retry later."""
+
+
+class ComputeBackend:
+    """
+    Awaitable front for CPU-bound jobs, backed by a ProcessPoolExecutor so the
+    event loop (and every other user) never waits on a simulation.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        # Jobs running or waiting for a worker; beyond this callers get ComputeBusy
+        self.max_pending = max_pending or self.workers * 4
+        self.pending = 0
+        self._executor = None
+        self._progress = None
+        self._dispatcher = None
+        self._streams = {}
+        self._job_ids = itertools.count()
+        self._cancelled = None
+        self._profiling = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking from inside a running event loop is unsafe, so workers are spawned
+            ctx = multiprocessing.get_context('spawn')
+            self._progress = ctx.Queue()
+            self._cancelled = ctx.Array('b', CANCEL_SLOTS, lock=False)
+            self._profiling = ctx.Value('b', 0, lock=False)
+            if metrics.enabled:
+                metrics.profiler.worker_flags.append(self._profiling)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker,
+                                                 initargs=(self._progress, metrics.enabled, self._cancelled,
+                                                           self._profiling))
+            self._dispatcher = threading.Thread(target=self._dispatch_progress, args=(self._progress,), daemon=True)
+            self._dispatcher.start()
+        return self._executor
+
+    def _dispatch_progress(self, progress):
+        """Forwards streamed estimates from the workers to the waiting stream_spot calls."""
+        while True:
+            item = progress.get()
+            if item is None:
+                return
+            if item[0] == 'metrics':
+                metrics.apply(item[1])
+                continue
+            if item[0] == 'profile':
+                metrics.profiler.merge(item[1])
+                continue
+            _, job_id, probs = item
+            stream = self._streams.get(job_id)
+            if stream is not None:
+                loop, updates = stream
+                loop.call_soon_threadsafe(updates.put_nowait, probs)
+
+    async def start(self):
+        """Spawns the workers and builds their engines so the first user doesn't wait for it."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _warm_up) for _ in range(self.workers)))
+
+    async def submit(self, fn, *args):
+        """Runs fn(*args) in a worker process; raises ComputeBusy if too many jobs are queued."""
+        if self.pending >= self.max_pending:
+            metrics.COMPUTE_BUSY.inc()
+            raise ComputeBusy()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def compute_spot(self, hero: List[Card], board: List[Card], num_opponents: int = 1,
+                           iterations: int = 15000, **options) -> Tuple[Dict[str, float], str]:
+        return await self.submit(functools.partial(compute_spot, hero, board, num_opponents, iterations, **options))
+
+    def new_job_id(self) -> int:
+        job_id = next(self._job_ids)
+        if self._cancelled is not None:
+            self._cancelled[job_id % CANCEL_SLOTS] = 0
+        return job_id
+
+    def cancel(self, job_id: int):
+        """
+        Asks a stream_spot job to stop: a queued job returns at once, a sampling one
+        at its next progress report. Its stream then ends with ('done', None).
+        """
+        if self._cancelled is not None:
+            self._cancelled[job_id % CANCEL_SLOTS] = 1
+
+    async def stream_spot(self, hero: List[Card], board: List[Card], num_opponents: int = 1,
+                          iterations: int = 15000, report_interval: float = 0.25, job_id: Optional[int] = None,
+                          **options) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Yields ('progress', probs) for every intermediate estimate, then
+        ('done', (probs, analysis_text)). Raises ComputeBusy like submit().
+        job_id (from new_job_id) lets the caller cancel() the job meanwhile.
+        """
+        if job_id is None:
+            job_id = self.new_job_id()
+        updates = asyncio.Queue()
+        self._streams[job_id] = (asyncio.get_running_loop(), updates)
+        job = asyncio.ensure_future(self.submit(functools.partial(
+            stream_spot, job_id, hero, board, num_opponents, iterations, report_interval, **options)))
+        try:
+            while True:
+                update = asyncio.ensure_future(updates.get())
+                await asyncio.wait({job, update}, return_when=asyncio.FIRST_COMPLETED)
+                if update.done():
+                    yield 'progress', update.result()
+                    continue
+                update.cancel()
+                # Estimates still in flight are older than the final result; drop them
+                yield 'done', job.result()
+                return
+        finally:
+            self._streams.pop(job_id, None)
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+            if self._profiling in metrics.profiler.worker_flags:
+                metrics.profiler.worker_flags.remove(self._profiling)
+            self._progress.put(None)  # stops the dispatcher thread
+            # Wait for it, or it may still be reading when the queue is torn down at exit
+            self._dispatcher.join()
+            self._progress = None
+
+
+def backend_from_env() -> ComputeBackend:
+    """Backend sized by COMPUTE_WORKERS / COMPUTE_MAX_PENDING (defaults: all cores, 4 jobs per worker)."""
+    workers = int(os.getenv('COMPUTE_WORKERS', 0)) or None
+    max_pending = int(os.getenv('COMPUTE_MAX_PENDING', 0)) or None
+    return ComputeBackend(workers=workers, max_pending=max_pending)
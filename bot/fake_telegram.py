@@ -0,0 +1,156 @@
+"""
+A stand-in for Telegram to exercise webhook mode locally: a fake Bot API that
+accepts every call (and records it), and an update source that plays card-picking
+sessions of many users against the webhook.
+
+    python -m bot.fake_telegram --api-port 8081 --webhook http://127.0.0.1:8443/telegram --users 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+from poker.card import CARDS
+from .webhook import SECRET_HEADER, read_request, write_response
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Poker', 'username': 'fake_poker_bot'}
+
+
+class FakeBotAPI:
+    """Answers Bot API calls as a successful no-op; calls[] holds (method, params) in arrival order."""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, Dict[str, str]]] = []
+        self._server = None
+        self._connections = {}
+        self.port = None
+
+    @property
+    def url(self) -> str:
+        """Base URL for ApplicationBuilder.base_url / bot.webhook --api-url."""
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self, port: int = 0):
+        self._server = await asyncio.start_server(self._serve, '127.0.0.1', port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stops the server and ends the bot's open (keep-alive) connections."""
+        self._server.close()
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def calls_for(self, chat_id: int, method: str = 'editMessageText') -> List[Dict[str, str]]:
+        return [params for name, params in self.calls if name == method and params.get('chat_id') == str(chat_id)]
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                _, path, headers, body = request
+                method = path.rsplit('/', 1)[-1]
+                if headers.get('content-type', '').startswith('application/json'):
+                    params = {k: str(v) for k, v in json.loads(body or b'{}').items()}
+                else:
+                    params = dict(parse_qsl(body.decode()))
+                self.calls.append((method, params))
+                result = BOT_USER if method == 'getMe' else True
+                write_response(writer, "200 OK", json.dumps({'ok': True, 'result': result}).encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            self._connections.pop(asyncio.current_task(), None)
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Dict:
+    """A callback query update, as Telegram posts it when the user taps an inline button."""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Player {user_id}'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user,
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'},
+                        'from': BOT_USER, 'text': '🃏'},
+        },
+    }
+
+
+def session_taps(seed: int) -> List[str]:
+    """Callback data of one hand: reset, then suit and rank taps for 2 hero cards and a full board."""
+    taps = ['action:reset']
+    for card in random.Random(seed).sample(CARDS, 7):
+        taps += [f"suit:{card.suit}", f"rank:{card.rank}:{card.suit}"]
+    return taps
+
+
+async def play(webhook_url: str, users: int, secret: Optional[str] = None, seed: int = 0,
+               first_user: int = 1000) -> List[float]:
+    """
+    Every user plays one hand concurrently, each waiting for an update to be
+    acknowledged before tapping again. Returns the per-update latencies.
+    """
+    headers = {SECRET_HEADER: secret} if secret else {}
+    update_ids = iter(range(1, 10 ** 9))
+    latencies = []
+
+    async def user(client, user_id):
+        for data in session_taps(seed + user_id):
+            start = time.perf_counter()
+            response = await client.post(webhook_url, json=callback_update(next(update_ids), user_id, data),
+                                         headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        await asyncio.gather(*(user(client, first_user + i) for i in range(users)))
+    return latencies
+
+
+async def _main(args):
+    api = FakeBotAPI()
+    await api.start(args.api_port)
+    print(f"Fake Bot API at {api.url}")
+    # Wait for the webhook to come up
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(args.webhook)
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.5)
+
+    start = time.perf_counter()
+    latencies = sorted(await play(args.webhook, args.users, args.secret, args.seed))
+    elapsed = time.perf_counter() - start
+    print(f"{len(latencies)} updates in {elapsed:.1f}s ({len(latencies) / elapsed:.0f}/s), "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms, "
+          f"{len(api.calls)} Bot API calls")
+    await api.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fake Telegram: a Bot API stub and simulated users.")
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--webhook', default='http://127.0.0.1:8443/telegram')
+    parser.add_argument('--secret', default=None)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(_main(parser.parse_args(argv)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,54 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram.error import BadRequest, RetryAfter
+from poker.cache import TieredCache
 from poker.card import Card
-from poker.montecarlo import MonteCarloSimulation
+from poker.ranges import parse_range
 from .keyboards import get_suit_keyboard, get_rank_keyboard
-from poker.analysis import HandAnalyzer
+from .compute import backend_from_env, ComputeBusy
+from .scheduler import ComputeScheduler, Superseded
+from .settings import MAX_ITERATIONS, TARGET_STDERR, TIME_BUDGET
+from . import metrics, session
+import html
 import time
 
-# Initialize Simulation Engine and Analyzer
-simulation = MonteCarloSimulation()
-analyzer = HandAnalyzer()
+# Simulation and analysis run in worker processes (engines and their caches live there),
+# so the event loop stays free for other users while a spot is computed.
+compute = backend_from_env()
+# One spot per chat at a time: quick taps replace the chat's queued or running spot
+# instead of piling up, identical spots are computed once, and chats take turns.
+scheduler = ComputeScheduler(compute)
+metrics.COMPUTE_PENDING.function = lambda: scheduler.pending
 
-async def format_game_state(user_data):
-    """Formats the current game state into a message string."""
-    hero = user_data.get('hero', [])
-    board = user_data.get('board', [])
-    probs = user_data.get('probs', None)
-    analysis_text = user_data.get('analysis_text', "")
+# Webhook front-ends (bot.webhook) replace the scheduler with the shared compute server's
+# client and keep sessions in this store, so any front-end process can serve any user.
+session_store = None
+
+# Results by hand (see _hand), kept out of the sessions: a session holds its cards and the
+# message is rebuilt from here. Webhook front-ends back it with the shared session store.
+RESULT_CACHE_SIZE = 4096
+results = TieredCache(RESULT_CACHE_SIZE, namespace='result')
+
+# Telegram throttles frequent edits of one message; stay well below its limit
+EDIT_INTERVAL = 1.0
+
+BUSY_TEXT = "\n<b>⏳ Сервер перегружен, нажмите «Повторить расчет» через пару секунд.</b>\n"
+
+async def format_game_state(user_data, progress=None, busy=False):
+    """
+    Formats the current game state into a message string, with the hand's latest
+    result, or an intermediate estimate (`progress`), or the busy notice.
+    """
+    hero = session.hero(user_data)
+    board = session.board(user_data)
+    if progress is not None:
+        probs, analysis_text = progress, ""
+    elif busy:
+        probs, analysis_text = None, BUSY_TEXT
+    else:
+        probs, analysis_text = latest_result(user_data) or (None, "")
     
-    hero_str = " ".join([str(c) for c in hero]) if hero else "Выберите 2 карты"
+    hero_str = " ".join([str(c) for c in hero]) if hero else f"Выберите {session.hole_cards(user_data)} карты"
     
     board_str = ""
     if board:
@@ -30,29 +61,40 @@ async def format_game_state(user_data):
     else:
         board_str = "Ожидание..."
 
+    title = "Помощник для Покера (Омаха PLO)" if session.game(user_data) == 'plo' else "Помощник для Покера"
     msg = (
-        f"<b>🃏 Помощник для Покера</b>\n\n"
+        f"<b>🃏 {title}</b>\n\n"
         f"<b>👤 Рука Героя:</b> {hero_str}\n"
         f"<b>🎴 Борд:</b> {board_str}\n\n"
     )
     
     if probs:
+        # Half-width of the 95% interval; exact (enumerated) results have none
+        margin = (probs.get('ci_high', probs['equity']) - probs.get('ci_low', probs['equity'])) / 2
+        precision = f" ±{margin:.1f}%" if margin >= 0.05 else ""
+        opponent_range = _opponent_range(user_data)
+        against = f"против диапазона {html.escape(opponent_range)}" if opponent_range else "против 1 случайного оппонента"
         msg += (
-            f"<b>📊 Вероятности (против 1 случайного оппонента):</b>\n"
+            f"<b>📊 Вероятности ({against}):</b>\n"
             f"🏆 Победа: <code>{probs['win']:.1f}%</code>\n"
             f"🤝 Ничья: <code>{probs['tie']:.1f}%</code>\n"
             f"💀 Поражение: <code>{probs['lose']:.1f}%</code>\n"
-            f"📈 Эквити (Equity): <code>{probs['equity']:.1f}%</code>\n\n"
+            f"📈 Эквити (Equity): <code>{probs['equity']:.1f}%{precision}</code>\n\n"
         )
 
     if analysis_text:
         msg += analysis_text + "\n"
+
+    if progress is not None:
+        msg += "<i>⏳ Уточнение расчета...</i>\n"
     
     stage = get_current_stage(user_data)
     # Translate stage names
     stage_map = {
         "Hero Card 1": "Карту Героя 1",
         "Hero Card 2": "Карту Героя 2",
+        "Hero Card 3": "Карту Героя 3",
+        "Hero Card 4": "Карту Героя 4",
         "Flop Card": "Карту Флопа",
         "Turn Card": "Карту Терна",
         "River Card": "Карту Ривера",
@@ -65,23 +107,52 @@ async def format_game_state(user_data):
     return msg
 
 def get_current_stage(user_data):
-    hero = user_data.get('hero', [])
-    board = user_data.get('board', [])
-    
-    if len(hero) < 2:
-        return "Hero Card 1" if len(hero) == 0 else "Hero Card 2"
-    elif len(board) < 3:
+    selected = len(user_data.get('cards', []))
+    hole_cards = session.hole_cards(user_data)
+
+    if selected < hole_cards:
+        return f"Hero Card {selected + 1}"
+    elif selected < hole_cards + 3:
         return "Flop Card"
-    elif len(board) < 4:
+    elif selected < hole_cards + 4:
         return "Turn Card"
-    elif len(board) < 5:
+    elif selected < hole_cards + 5:
         return "River Card"
     else:
         return "Result (Game Over)"
 
-async def refresh_message(update: Update, context: ContextTypes.DEFAULT_TYPE, markup=None):
+def _opponent_range(user_data):
+    """The /range range, which only applies to Hold'em (ranges are 2-card hands)."""
+    return user_data.get('opponent_range') if session.game(user_data) == 'holdem' else None
+
+def _hand(user_data):
+    """What a result belongs to: the selected cards, the game and the /range range."""
+    return tuple(user_data.get('cards', [])), session.game(user_data), _opponent_range(user_data)
+
+def latest_result(user_data):
+    """(probs, analysis text) of the hand's last computed street, e.g. preflop's until the flop is complete."""
+    cards, game, opponent_range = _hand(user_data)
+    hole_cards = session.hole_cards(user_data)
+    for selected in (hole_cards + 5, hole_cards + 4, hole_cards + 3, hole_cards):
+        if selected <= len(cards):
+            result = results.get((cards[:selected], game, opponent_range))
+            if result is not None:
+                return result
+    return None
+
+async def _drop_calculation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    The hand changed without a new calculation (reset, undo, another game): the chat's
+    running one is superseded so its result never lands next to the new hand.
+    """
+    # Saved first: the front-end that was calculating reloads the session once superseded
+    await save_session(update, context)
+    if update.effective_chat is not None:
+        scheduler.supersede(update.effective_chat.id)
+
+async def refresh_message(update: Update, context: ContextTypes.DEFAULT_TYPE, markup=None, busy=False):
     """Updates the message with the current state."""
-    text = await format_game_state(context.user_data)
+    text = await format_game_state(context.user_data, busy=busy)
     if markup is None:
         # If no markup provided, default to suit selection (unless game over)
         if get_current_stage(context.user_data) == "Result (Game Over)":
@@ -90,18 +161,18 @@ async def refresh_message(update: Update, context: ContextTypes.DEFAULT_TYPE, ma
              markup = get_suit_keyboard()
 
     if update.callback_query:
-        await update.callback_query.edit_message_text(text=text, reply_markup=markup, parse_mode='HTML')
+        with metrics.TELEGRAM_EDIT_SECONDS.time(kind='refresh'):
+            await update.callback_query.edit_message_text(text=text, reply_markup=markup, parse_mode='HTML')
     else:
         await update.message.reply_text(text=text, reply_markup=markup, parse_mode='HTML')
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Starts a new session."""
+    """Starts a new session (the opponent range set with /range and the game are kept)."""
+    kept = {k: context.user_data[k] for k in ('opponent_range', 'game') if context.user_data.get(k)}
     context.user_data.clear()
-    context.user_data['hero'] = []
-    context.user_data['board'] = []
-    context.user_data['used_cards'] = [] # Strings like 'As'
-    context.user_data['probs'] = None
-    context.user_data['analysis_text'] = ""
+    context.user_data.update(kept)
+    session.reset(context.user_data)
+    await _drop_calculation(update, context)
     
     await refresh_message(update, context)
 
@@ -109,23 +180,72 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sends a help message."""
     msg = (
         "<b>ℹ️ Справка по боту</b>\n\n"
-        "Этот бот помогает рассчитывать вероятности в Техасском Холдеме.\n\n"
+        "Этот бот помогает рассчитывать вероятности в Техасском Холдеме и Омахе (PLO).\n\n"
         "<b>Как пользоваться:</b>\n"
-        "1. Выберите 2 свои карты (Hero).\n"
+        "1. Выберите 2 свои карты (Hero), в Омахе - 4.\n"
         "2. Выбирайте карты борда (Флоп, Терн, Ривер).\n"
         "3. Бот автоматически рассчитает ваши шансы на победу против случайной руки.\n\n"
         "<b>Функции:</b>\n"
         "📊 <b>Вероятности</b>: Победа, Ничья, Поражение, Эквити.\n"
         "⚠️ <b>Анализ силы</b>: Бот покажет, какие руки сильнее вашей на текущем борде.\n"
+        "📊 <b>Разброс эквити</b>: На флопе и терне - как изменятся шансы со следующей картой.\n"
         "🔄 <b>Управление</b>: Кнопки ОТМЕНА (удалить последнюю карту) и СБРОС (начать заново).\n\n"
         "<b>Команды:</b>\n"
         "/start - Начать новую игру\n"
+        "/range QQ+, AKs, ATo+ - Задать диапазон оппонента (или top 15%), /range без аргументов - случайная рука\n"
+        "/plo - Играть в Омаху (4 карты), /holdem - вернуться в Холдем\n"
         "/help - Показать это сообщение"
     )
     await update.message.reply_text(msg, parse_mode='HTML')
 
+async def range_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sets the opponent's range, e.g. /range QQ+, AKs, top 15%; /range alone goes back to a random hand."""
+    text = " ".join(context.args or [])
+    if not text:
+        context.user_data.pop('opponent_range', None)
+        reply = "🎲 Оппонент: случайная рука"
+    else:
+        try:
+            hand_range = parse_range(text)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ Не удалось разобрать диапазон: {html.escape(str(e))}", parse_mode='HTML')
+            return
+        context.user_data['opponent_range'] = text
+        reply = f"🎯 Диапазон оппонента: <b>{html.escape(text)}</b> ({len(hand_range)} комбинаций)"
+    await update.message.reply_text(reply, parse_mode='HTML')
+
+    if session.game(context.user_data) != 'holdem':
+        await update.message.reply_text("ℹ️ Диапазон будет учтен в Холдеме (/holdem), в Омахе оппонент - случайная рука")
+        return
+    # Show the current hand against the new range right away
+    if session.hero_complete(context.user_data):
+        await recalculate(update, context)
+
+async def plo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switches to Pot Limit Omaha (4 hero cards) with a new hand."""
+    session.set_game(context.user_data, 'plo')
+    await _drop_calculation(update, context)
+    await refresh_message(update, context)
+
+async def holdem_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Switches back to Hold'em with a new hand."""
+    session.set_game(context.user_data, 'holdem')
+    await _drop_calculation(update, context)
+    await refresh_message(update, context)
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Main state machine handler."""
+    """Main state machine handler, timed per action (e.g. 'rank', 'action:undo')."""
+    data = update.callback_query.data or ""
+    action = data if data.startswith("action:") else data.split(":")[0]
+    metrics.CALLBACKS.inc(action=action)
+    metrics.CALLBACKS_IN_PROGRESS.inc()
+    try:
+        with metrics.CALLBACK_SECONDS.time(action=action):
+            await _handle_callback(update, context)
+    finally:
+        metrics.CALLBACKS_IN_PROGRESS.dec()
+
+async def _handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
@@ -133,23 +253,15 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_data = context.user_data
     
     # Initialize if empty (in case of restart after long time)
-    if 'hero' not in user_data:
-        user_data['hero'] = []
-        user_data['board'] = []
-        user_data['used_cards'] = []
+    session.ensure(user_data)
 
     if data == "ignore":
         return
 
     if data.startswith("suit:"):
         suit = data.split(":")[1]
-        used = user_data.get('used_cards', [])
-        # Provide used cards visually to rank keyboard
-        # Our used_cards format in user_data matches str(Card)
-        # e.g., 'A♠'.
-        # But get_rank_keyboard expects checks. The logic needs alignment.
-        # Let's align used_cards to store "RankSuit" string (e.g. "A♠")
-        await query.edit_message_reply_markup(reply_markup=get_rank_keyboard(suit, used))
+        # Used cards are shown blank on the rank keyboard
+        await query.edit_message_reply_markup(reply_markup=get_rank_keyboard(suit, session.used_mask(user_data)))
         return
 
     elif data == "action:back_to_suits":
@@ -162,79 +274,138 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data == "action:undo":
         # Remove last added card
-        board = user_data['board']
-        hero = user_data['hero']
-        used = user_data['used_cards']
-        
-        if board:
-            popped = board.pop()
-            if str(popped) in used: used.remove(str(popped))
-        elif hero:
-            popped = hero.pop()
-            if str(popped) in used: used.remove(str(popped))
-        
+        session.undo(user_data)
+
         # Recalculate if possible
-        if len(hero) == 2:
-             await run_simulation(user_data)
+        if session.hero_complete(user_data):
+             await recalculate(update, context)
         else:
-             user_data['probs'] = None
-             
-        await refresh_message(update, context)
+             await _drop_calculation(update, context)
+             await refresh_message(update, context)
+        return
+
+    elif data == "action:retry":
+        await query.edit_message_text("⏳ Расчет вероятностей...", parse_mode='HTML')
+        await recalculate(update, context)
         return
 
     elif data.startswith("rank:"):
         _, rank, suit = data.split(":")
         new_card = Card(rank, suit)
-        
-        # Determine where to add
-        hero = user_data['hero']
-        board = user_data['board']
-        
-        if len(hero) < 2:
-            hero.append(new_card)
-        elif len(board) < 5:
-            # Enforce stage rules? 
-            # Request says: Hero(2) -> Flop(3) -> Turn(1) -> River(1)
-            # Logic: If 0 in board, need 3? Or just add 1 by 1?
-            # User requirement: "Automatically move to the next stage when required cards are selected."
-            # "Flop – select 3 cards"
-            # It implies we add cards one by one. I will just append to board.
-            board.append(new_card)
-        else:
+
+        # Cards go to the hero first, then one by one to the board:
+        # Hero(2, PLO: 4) -> Flop(3) -> Turn(1) -> River(1)
+        if len(user_data['cards']) >= session.max_cards(user_data):
             await query.answer("Все карты выбраны!", show_alert=True)
             return
+        if not session.add_card(user_data, new_card):
+            return  # Tapped on a stale keyboard: the card is already selected
+        hero = session.hero(user_data)
+        board = session.board(user_data)
 
-        user_data['used_cards'].append(str(new_card))
-        
         # Trigger Simulation if stage complete
         # Stages: Hero(2), Flop(3 cards on board), Turn(4 cards), River(5 cards)
         # Optimization: Only calculate when a stage is fully complete (0, 3, 4, 5 board cards)
-        if len(hero) == 2 and len(board) in [0, 3, 4, 5]:
+        if len(hero) == session.hole_cards(user_data) and len(board) in [0, 3, 4, 5]:
             await query.edit_message_text("⏳ Расчет вероятностей...", parse_mode='HTML')
-            await run_simulation(user_data)
+            await recalculate(update, context)
+            return
             
         await refresh_message(update, context)
 
-async def run_simulation(user_data):
-    """Runs the simulation and updates user_data['probs']."""
-    hero = user_data.get('hero', [])
-    board = user_data.get('board', [])
-    
-    # Needs at least 2 hero cards for any meaningful equity
-    if len(hero) < 2:
+async def recalculate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Runs the simulation, editing the message with improving estimates (at most once
+    per EDIT_INTERVAL), then shows the result, or a retry button if the workers are overloaded.
+    """
+    user_data = context.user_data
+    last_edit = None
+
+    async def show_progress(probs):
+        nonlocal last_edit
+        now = time.monotonic()
+        if last_edit is not None and now - last_edit < EDIT_INTERVAL:
+            return
+        last_edit = now
+        try:
+            with metrics.TELEGRAM_EDIT_SECONDS.time(kind='progress'):
+                await update.callback_query.edit_message_text(
+                    text=await format_game_state(user_data, progress=probs), parse_mode='HTML')
+        except (BadRequest, RetryAfter):
+            pass  # Unchanged text or rate limited: skip this update, the final one follows
+
+    await save_session(update, context)
+    try:
+        await run_simulation(user_data, on_progress=show_progress if update.callback_query else None,
+                             owner=update.effective_chat.id)
+    except Superseded:
+        # A newer tap of this chat changed the hand and updates the message. Its session
+        # replaces ours (a no-op unless another front-end handled it), so saving ours
+        # after this handler doesn't bring the old cards back.
+        await load_session(update, context)
+        return
+    except ComputeBusy:
+        await refresh_message(update, context, markup=get_suit_keyboard(retry=True), busy=True)
         return
+    await refresh_message(update, context)
 
-    # Run Monte Carlo
-    # Reduced iterations to prevent timeout/freeze (15k ~ 0.7s)
-    probs = simulation.run(hero, board, num_opponents=1, iterations=15000)
-    user_data['probs'] = probs
+async def start_compute(application):
+    """post_init hook: spawns the compute workers (or connects to them) before the first update arrives."""
+    await scheduler.start()
 
-    # Run Stronger Hand Analysis
-    stronger_hands = analyzer.analyze_stronger_hands(hero, board)
-    formatted = analyzer.format_analysis(stronger_hands)
-    
-    # If board is present but no stronger hands found -> Hero has Nuts
-    if not formatted and len(board) >= 3:
-         formatted = "\n<b>💪 У вас сильнейшая рука! (Nuts)</b>\n"
-         
-    user_data['analysis_text'] = formatted
+async def stop_compute(application):
+    """post_shutdown hook: stops the compute workers."""
+    scheduler.shutdown()
+
+async def load_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before the handlers: the user's session from the shared store, if there is one."""
+    if session_store is not None and update.effective_user is not None:
+        session_store.load(update.effective_user.id, context.user_data)
+
+async def save_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs after the handlers, and before long calculations so the user's next tap sees the new cards."""
+    if session_store is not None and update.effective_user is not None:
+        session_store.save(update.effective_user.id, context.user_data)
+
+def register_handlers(application):
+    application.add_handler(CommandHandler('start', start_command))
+    application.add_handler(CommandHandler('help', help_command))
+    application.add_handler(CommandHandler('range', range_command))
+    application.add_handler(CommandHandler('plo', plo_command))
+    application.add_handler(CommandHandler('holdem', holdem_command))
+    application.add_handler(CallbackQueryHandler(handle_callback))
+
+async def run_simulation(user_data, on_progress=None, owner=None):
+    """
+    Runs the simulation and stores its (probs, analysis text) in `results`.
+    on_progress, if given, is awaited with every intermediate estimate.
+    owner (the chat id) identifies whose earlier request this one supersedes;
+    Superseded is raised if a later request of the same owner replaces it, or
+    if the hand changed meanwhile (the result is then not stored).
+    """
+    hero = session.hero(user_data)
+    board = session.board(user_data)
+    hand = _hand(user_data)
+
+    # Needs the full hero hand (2 cards, 4 in PLO) for any meaningful equity
+    if not session.hero_complete(user_data):
+        return
+
+    # Monte Carlo + stronger hand analysis in a worker process (raises ComputeBusy when overloaded).
+    # Turn and river are enumerated exactly since that is cheaper than sampling there,
+    # preflop comes straight from the precomputed table. Against a /range range every street is sampled.
+    # PLO hands (4 cards) are sampled, except heads-up rivers, which are enumerated.
+    with metrics.SIMULATION_SECONDS.time(street=metrics.street_name(len(board))):
+        async for kind, payload in scheduler.stream_spot(owner if owner is not None else object(), hero, board,
+                                                         num_opponents=1, iterations=MAX_ITERATIONS,
+                                                         target_stderr=TARGET_STDERR, time_budget=TIME_BUDGET,
+                                                         opponent_ranges=_opponent_range(user_data)):
+            if kind == 'progress':
+                # Not next to another hand; a changed hand supersedes the stream shortly
+                if on_progress is not None and _hand(user_data) == hand:
+                    await on_progress(payload)
+            else:
+                probs, formatted = payload
+    if _hand(user_data) != hand:
+        raise Superseded()
+    results.put(hand, (probs, formatted))
@@ -1,40 +1,62 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from poker.cache import LRUCache
 from poker.card import SUITS, RANKS
 
-def get_suit_keyboard():
-    """Returns a keyboard with 4 suit buttons."""
-    keyboard = [
-        [
-            InlineKeyboardButton(suit, callback_data=f"suit:{suit}") for suit in SUITS
-        ],
-        [InlineKeyboardButton("ОТМЕНА", callback_data="action:undo"), InlineKeyboardButton("СБРОС", callback_data="action:reset")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+# Bits of each suit's 13 cards in a 52-bit used-cards mask (card index = rank * 4 + suit)
+SUIT_MASKS = {suit: sum(1 << (rank * 4 + s) for rank in range(13)) for s, suit in enumerate(SUITS)}
+
+# Keyboards are immutable, so one markup serves every chat in the same state:
+# at most 2^13 used-card patterns per suit
+_rank_keyboards = LRUCache(4 * 8192)
+_suit_keyboards = {}
+
+def get_suit_keyboard(retry: bool = False):
+    """Returns a keyboard with 4 suit buttons (and a retry button after an overloaded calculation)."""
+    markup = _suit_keyboards.get(retry)
+    if markup is None:
+        keyboard = [
+            [
+                InlineKeyboardButton(suit, callback_data=f"suit:{suit}") for suit in SUITS
+            ],
+            [InlineKeyboardButton("ОТМЕНА", callback_data="action:undo"), InlineKeyboardButton("СБРОС", callback_data="action:reset")]
+        ]
+        if retry:
+            keyboard.insert(0, [InlineKeyboardButton("🔄 Повторить расчет", callback_data="action:retry")])
+        markup = _suit_keyboards[retry] = InlineKeyboardMarkup(keyboard)
+    return markup
 
-def get_rank_keyboard(suit: str, used_cards: list):
-    """Returns a keyboard with 13 rank buttons for the selected suit."""
+def get_rank_keyboard(suit: str, used_mask: int):
+    """Returns a keyboard with 13 rank buttons for the selected suit; used_mask is the 52-bit mask of selected cards."""
+    key = (suit, used_mask & SUIT_MASKS[suit])
+    markup = _rank_keyboards.get(key)
+    if markup is None:
+        markup = _build_rank_keyboard(suit, key[1])
+        _rank_keyboards.put(key, markup)
+    return markup
+
+def _build_rank_keyboard(suit: str, used_mask: int):
     keyboard = []
     row = []
-    for rank in RANKS:
-        card_str = f"{rank}{suit}"
+    s = SUITS.index(suit)
+    for r, rank in enumerate(RANKS):
         # detailed callback: rank:RANK:SUIT
         callback_data = f"rank:{rank}:{suit}"
-        
+
         # Check if card is already used
-        if card_str in used_cards:
+        if used_mask >> (r * 4 + s) & 1:
             text = " "  # Invisible/Used
             callback_data = "ignore"
         else:
             text = f"{rank}{suit}"
-            
+
         row.append(InlineKeyboardButton(text, callback_data=callback_data))
-        
+
         if len(row) == 4: # 4 buttons per row
             keyboard.append(row)
             row = []
-    
+
     if row:
         keyboard.append(row)
-        
+
     keyboard.append([InlineKeyboardButton("🔙 Назад к мастям", callback_data="action:back_to_suits")])
     return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,340 @@
+"""
+In-process metrics and a sampling profiler, served on a local HTTP port.
+
+Disabled by default: every timer and counter call is a flag check until
+enable() is called (main.py does so when METRICS_PORT is set). Then
+
+    GET /metrics                  Prometheus text format
+    GET /profile?seconds=10       samples the bot's threads for 10 s, returns collapsed stacks
+    GET /profile/start            starts sampling until /profile/stop returns the stacks
+
+The compute workers sample themselves while the profiler runs and send their stacks
+back over the progress queue (rooted at "worker <pid>"), like their timings.
+Collapsed stacks ("frame;frame;frame count" lines) load into flamegraph.pl or speedscope.
+"""
+import bisect
+import collections
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+enabled = False
+
+# Seconds between a profiling worker's batches of stacks; /profile/stop waits this long for the last one
+WORKER_FLUSH_INTERVAL = 0.5
+
+# Upper bounds in seconds, from a Telegram edit to a full flop enumeration
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = '') -> str:
+        parts = [f'{n}="{v}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> List[str]:
+        return [f"{self.name}{self._label_str(key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if not enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        # Read at scrape time instead of being kept up to date
+        self.function = function
+
+    def set(self, value: float, **labels):
+        if not enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        if not enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            with self._lock:
+                self._values[()] = self.function()
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> '_Timer':
+        """Context manager observing its duration; a shared no-op while disabled."""
+        if not enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def _render_value(self, key, value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+            lines.append(f"{self.name}_bucket{self._label_str(key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_number(total)}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+REGISTRY: List[_Metric] = []
+
+CALLBACKS = Counter('bot_callbacks_total', "Callback queries handled.", ('action',))
+CALLBACK_SECONDS = Histogram('bot_callback_seconds', "Time to handle a callback query.", ('action',))
+CALLBACKS_IN_PROGRESS = Gauge('bot_callbacks_in_progress', "Callback queries being handled or waiting on compute.")
+SIMULATION_SECONDS = Histogram('bot_simulation_seconds',
+                               "run_simulation wall time, including waiting for a worker.", ('street',))
+TELEGRAM_EDIT_SECONDS = Histogram('bot_telegram_edit_seconds', "Time spent in Telegram message edits.", ('kind',))
+COMPUTE_PENDING = Gauge('compute_pending_jobs', "Compute jobs running or queued for a worker.")
+COMPUTE_BUSY = Counter('compute_busy_total', "Jobs rejected because the compute queue was full.")
+COMPUTE_SUPERSEDED = Counter('compute_superseded_total', "Requests replaced by a newer one from the same chat.")
+COMPUTE_COALESCED = Counter('compute_coalesced_total', "Requests served by an identical job already queued or running.")
+ENGINE_SIMULATION_SECONDS = Histogram('engine_simulation_seconds', "Equity computation time in a worker.",
+                                      ('street',))
+ENGINE_SAMPLES = Counter('engine_samples_total', "Deals evaluated (sampled or enumerated) by the workers.",
+                         ('street',))
+ENGINE_SAMPLES_PER_SECOND = Gauge('engine_samples_per_second', "Throughput of the last computed spot.",
+                                  ('street',))
+ENGINE_ANALYSIS_SECONDS = Histogram('engine_analysis_seconds', "Stronger-hands analysis time in a worker.",
+                                    ('street',))
+
+_METRICS = {m.name: m for m in REGISTRY}
+
+
+def street_name(board_size: int) -> str:
+    return {0: 'preflop', 3: 'flop', 4: 'turn', 5: 'river'}.get(board_size, 'partial')
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def apply(observations: List[Tuple[str, str, Dict[str, str], float]]):
+    """
+    Records observations made in another process (the compute workers can't
+    reach this registry): (metric name, method, labels, value) tuples.
+    """
+    for name, method, labels, value in observations:
+        getattr(_METRICS[name], method)(value, **labels)
+
+
+class SamplingProfiler:
+    """
+    Periodically records the stack of every other thread. Nothing is hooked into
+    the interpreter, so there is no cost while it isn't running. `prefix` roots
+    every stack (e.g. at the worker process it was sampled in).
+    """
+
+    def __init__(self, interval: float = 0.005, prefix: str = ''):
+        self.interval = interval
+        self.prefix = prefix
+        self.stacks = collections.Counter()
+        # Shared flags of the compute backends (see bot.compute): their workers sample themselves while set
+        self.worker_flags = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        for flag in self.worker_flags:
+            flag.value = 1
+
+    def stop(self) -> str:
+        """Stops sampling; returns the collapsed stacks."""
+        if self.running:
+            for flag in self.worker_flags:
+                flag.value = 0
+            if self.worker_flags:
+                time.sleep(WORKER_FLUSH_INTERVAL)  # the workers' last batch
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def merge(self, stacks: Dict[str, int]):
+        """Adds stacks sampled in another process (a compute worker) while running."""
+        if self.running:
+            with self._lock:
+                self.stacks.update(stacks)
+
+    def sample(self):
+        """Records the stack of every thread but the calling one."""
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            with self._lock:
+                self.stacks[self.prefix + ';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+profiler = SamplingProfiler()
+
+
+def _handler_class():
+    # http.server is imported on first use: worker processes load this module but never serve
+    from http.server import BaseHTTPRequestHandler
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/metrics':
+                self._reply(render(), 'text/plain; version=0.0.4')
+            elif url.path == '/profile/start':
+                profiler.start()
+                self._reply("profiling\n")
+            elif url.path == '/profile/stop':
+                self._reply(profiler.stop())
+            elif url.path == '/profile':
+                seconds = float(parse_qs(url.query).get('seconds', ['10'])[0])
+                profiler.start()
+                time.sleep(seconds)
+                self._reply(profiler.stop())
+            else:
+                self.send_error(404)
+
+        def _reply(self, body: str, content_type: str = 'text/plain'):
+            data = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the bot's log
+
+    return _Handler
+
+
+def serve(port: int, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+    """Enables metrics and serves them (and the profiler) from a background thread."""
+    from http.server import ThreadingHTTPServer
+    enable()
+    server = ThreadingHTTPServer((host, port), _handler_class())
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,285 @@
+"""
+The compute pool as a local service shared by several bot front-end processes
+(see bot.webhook). One process owns the ComputeBackend workers and the
+ComputeScheduler, so superseding, coalescing and fair ordering hold across every
+front-end; front-ends send it spots over a Unix socket with RemoteScheduler.
+
+Frames are a 4-byte length and a JSON array; cards travel as their indices and
+errors as their type name and message. The socket is created 0600 (bot.webhook
+puts it in a private directory by default). A frame that can't be decoded drops the
+connection; a decoded but malformed one is answered with an error frame.
+
+A front-end that loses the connection reconnects on its next request; while the
+server stays unreachable, requests fail at once with ConnectionError.
+"""
+import asyncio
+import itertools
+import json
+import os
+import signal
+import struct
+from typing import AsyncIterator, Hashable, List, Optional, Tuple
+
+from poker.card import CARDS, Card
+from . import metrics
+from .compute import ComputeBackend, ComputeBusy
+from .scheduler import ComputeScheduler, Superseded
+
+_LENGTH = struct.Struct('>I')
+# A spot or a result is well under a KB; the analysis text is a Telegram message
+MAX_FRAME = 1 << 20
+
+# Errors re-raised with their own type on the front-end; any other becomes a RuntimeError
+_ERRORS = {'ValueError': ValueError}
+
+# Seconds the server waits for front-ends to disconnect before stopping the workers
+DRAIN_TIMEOUT = 30.0
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    header = await reader.readexactly(_LENGTH.size)
+    length = _LENGTH.unpack(header)[0]
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes")
+    return json.loads(await reader.readexactly(length))
+
+
+def _write_frame(writer: asyncio.StreamWriter, frame):
+    if writer.is_closing():
+        return
+    data = json.dumps(frame, ensure_ascii=False).encode()
+    writer.write(_LENGTH.pack(len(data)) + data)
+
+
+def _cards(indices) -> List[Card]:
+    if not all(isinstance(i, int) and 0 <= i < len(CARDS) for i in indices):
+        raise ValueError(f"Bad card indices: {indices!r}")
+    return [CARDS[i] for i in indices]
+
+
+def _spot(owner, args, options) -> Tuple[Hashable, tuple, dict]:
+    """Checks a spot frame's fields and rebuilds the cards."""
+    hero, board, num_opponents, iterations = args
+    if not isinstance(owner, (int, str)) or not isinstance(options, dict):
+        raise ValueError("Bad spot frame")
+    return owner, (_cards(hero), _cards(board), int(num_opponents), int(iterations)), options
+
+
+class ComputeServer:
+    """
+    Serves ('spot', request_id, owner, args, options), ('cancel', request_id) and
+    ('supersede', owner) frames; answers with (request_id, kind, payload) for every
+    stream_spot event.
+    """
+
+    def __init__(self, scheduler: ComputeScheduler, path: str):
+        self.scheduler = scheduler
+        self.path = path
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        # The socket is 0600 from the moment it exists, not after a chmod
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._serve, path=self.path)
+        finally:
+            os.umask(umask)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Stops accepting front-ends and waits (up to timeout) for the connected ones to leave."""
+        self._server.close()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=timeout)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(asyncio.current_task())
+        streams = {}
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                try:
+                    self._dispatch(writer, streams, frame)
+                except (ValueError, TypeError, KeyError, IndexError) as e:
+                    # The request fails, not the front-end's other requests
+                    request_id = frame[1] if isinstance(frame, list) and len(frame) > 1 else None
+                    _write_frame(writer, (request_id if isinstance(request_id, int) else None,
+                                          'error', ('ValueError', f"Bad frame: {e}")))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # The front-end went away
+        except ValueError:
+            pass  # Not one of our front-ends (oversized or not JSON): drop it
+        finally:
+            for task in streams.values():
+                task.cancel()
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    def _dispatch(self, writer, streams, frame):
+        if frame[0] == 'cancel':
+            task = streams.pop(frame[1], None)
+            if task is not None:
+                task.cancel()
+        elif frame[0] == 'supersede':
+            if not isinstance(frame[1], (int, str)):
+                raise ValueError("Bad supersede frame")
+            self.scheduler.supersede(frame[1])
+        elif frame[0] == 'spot':
+            _, request_id, *spot = frame
+            if not isinstance(request_id, int) or request_id in streams:
+                raise ValueError("Bad request id")
+            owner, args, options = _spot(*spot)
+            streams[request_id] = asyncio.ensure_future(
+                self._stream(writer, streams, request_id, owner, args, options))
+        else:
+            raise ValueError(f"Unknown frame {frame[0]!r}")
+
+    async def _stream(self, writer, streams, request_id, owner, args, options):
+        try:
+            async for kind, payload in self.scheduler.stream_spot(owner, *args, **options):
+                _write_frame(writer, (request_id, kind, payload))
+        except Superseded:
+            _write_frame(writer, (request_id, 'superseded', None))
+        except ComputeBusy:
+            _write_frame(writer, (request_id, 'busy', None))
+        except Exception as e:
+            _write_frame(writer, (request_id, 'error', (type(e).__name__, str(e))))
+        finally:
+            streams.pop(request_id, None)
+
+
+class RemoteScheduler:
+    """ComputeScheduler's interface, served by a ComputeServer at `path` over one connection."""
+
+    def __init__(self, path: str, connect_timeout: float = 60.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._writer = None
+        self._reader_task = None
+        self._streams = {}
+        self._request_ids = itertools.count()
+        self._connect_lock = asyncio.Lock()
+        self._connected_once = False
+
+    @property
+    def pending(self) -> int:
+        """This front-end's requests waiting on the server."""
+        return len(self._streams)
+
+    async def start(self):
+        """
+        Connects, waiting for the server to come up (it spawns its workers first).
+        A reconnect after a lost connection tries once and raises ConnectionError.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (0 if self._connected_once else self.connect_timeout)
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if loop.time() >= deadline:
+                    raise ConnectionError(f"Compute server unreachable at {self.path}") from e
+                await asyncio.sleep(0.1)
+        self._writer = writer
+        self._connected_once = True
+        self._reader_task = asyncio.ensure_future(self._read(reader, writer))
+
+    async def _read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_id, kind, payload = await _read_frame(reader)
+                if kind == 'done' and payload is not None:
+                    payload = tuple(payload)
+                elif kind == 'error':
+                    name, message = payload
+                    payload = _ERRORS.get(name, RuntimeError)(message)
+                updates = self._streams.get(request_id)
+                if updates is not None:
+                    updates.put_nowait((kind, payload))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, TypeError):
+            # The next request reconnects; this connection's requests are lost
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            for updates in self._streams.values():
+                updates.put_nowait(('error', ConnectionError("Compute server closed the connection")))
+
+    async def stream_spot(self, owner: Hashable, hero: List[Card], board: List[Card], num_opponents: int = 1,
+                          iterations: int = 15000, **options) -> AsyncIterator[Tuple[str, object]]:
+        """Same as ComputeScheduler.stream_spot; leaving early cancels the request on the server."""
+        async with self._connect_lock:
+            if self._writer is None:
+                await self.start()
+        writer = self._writer
+        request_id = next(self._request_ids)
+        if not isinstance(owner, (int, str)):
+            # An anonymous owner (run_simulation's object()) only has to be unique
+            owner = f'{os.getpid()}-{request_id}'
+        updates = asyncio.Queue()
+        self._streams[request_id] = updates
+        _write_frame(writer, ('spot', request_id, owner,
+                                    ([c.index for c in hero], [c.index for c in board], num_opponents, iterations),
+                                    options))
+        finished = False
+        try:
+            while True:
+                kind, payload = await updates.get()
+                if kind != 'progress':
+                    finished = True
+                if kind == 'superseded':
+                    raise Superseded()
+                if kind == 'busy':
+                    raise ComputeBusy()
+                if kind == 'error':
+                    raise payload
+                yield kind, payload
+                if kind == 'done':
+                    return
+        finally:
+            del self._streams[request_id]
+            if not finished:
+                _write_frame(writer, ('cancel', request_id))
+
+    def supersede(self, owner: Hashable):
+        """Same as ComputeScheduler.supersede, for the owner's request from any front-end."""
+        if self._writer is not None and isinstance(owner, (int, str)):
+            _write_frame(self._writer, ('supersede', owner))
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader_task.cancel()
+            self._writer = None
+
+
+def run_compute_server(path: str, workers: Optional[int] = None, max_pending: Optional[int] = None,
+                       metrics_port: Optional[int] = None):
+    """
+    Process entry point: serves the compute pool at `path` until SIGTERM, then drains.
+    With metrics_port, also serves the scheduler's and the workers' metrics and profiles.
+    """
+    # Ctrl-C reaches the whole process group; the parent stops us once the front-ends have drained
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if metrics_port:
+        # Before the backend exists: its workers report metrics only if enabled at spawn
+        metrics.serve(metrics_port)
+
+    async def serve():
+        backend = ComputeBackend(workers=workers, max_pending=max_pending)
+        server = ComputeServer(ComputeScheduler(backend), path)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await backend.start()
+        await server.start()
+        try:
+            await stop.wait()
+            await server.drain()
+        finally:
+            backend.shutdown()
+            if os.path.exists(path):
+                os.unlink(path)
+
+    asyncio.run(serve())
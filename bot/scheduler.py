@@ -0,0 +1,166 @@
+"""
+Per-chat scheduling of equity jobs in front of the ComputeBackend.
+
+- A chat waits on one spot at a time: a new request from the same chat supersedes
+  its previous one, which is dropped if still queued or cancelled in the worker.
+- Identical concurrent requests (same cards and options, from any chats) share one
+  computation; every waiter gets its progress and result.
+- Queued jobs are started round-robin across chats, at most one per worker, so a
+  chat mashing buttons only ever replaces its own queued job.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+from poker.card import Card
+from . import metrics
+from .compute import ComputeBackend, ComputeBusy
+
+
+class Superseded(Exception):
+    """Raised to a waiter whose request was replaced by a newer one from the same chat."""
+
+
+class _Job:
+    def __init__(self, key: Tuple, owner: Hashable, args: Tuple, options: Dict):
+        self.key = key
+        self.owner = owner
+        self.args = args
+        self.options = options
+        # Waiters' queues of ('progress' | 'done' | 'error' | 'superseded', payload)
+        self.waiters: List[asyncio.Queue] = []
+        self.job_id = None
+        self.task = None
+
+
+class ComputeScheduler:
+    """Runs stream_spot requests on a ComputeBackend with superseding, coalescing and fair ordering."""
+
+    def __init__(self, backend: ComputeBackend, max_running: Optional[int] = None):
+        self.backend = backend
+        # Jobs handed to the backend at once; the rest wait here, where they can still be reordered or dropped
+        self.max_running = max_running or backend.workers
+        self.running = 0
+        self._jobs: Dict[Tuple, _Job] = {}
+        self._queued: 'OrderedDict[Hashable, deque]' = OrderedDict()
+        self._latest: Dict[Hashable, Tuple[_Job, asyncio.Queue]] = {}
+
+    async def start(self):
+        await self.backend.start()
+
+    def shutdown(self):
+        self.backend.shutdown()
+
+    @property
+    def pending(self) -> int:
+        """Jobs running or queued."""
+        return self.running + sum(len(jobs) for jobs in self._queued.values())
+
+    @staticmethod
+    def _key(hero: List[Card], board: List[Card], num_opponents: int, iterations: int, options: Dict) -> Tuple:
+        # Exact cards, not suit-canonical: the analysis text names concrete cards
+        return (tuple(sorted(c.index for c in hero)), tuple(c.index for c in board), num_opponents, iterations,
+                tuple(sorted((name, repr(value)) for name, value in options.items())))
+
+    async def stream_spot(self, owner: Hashable, hero: List[Card], board: List[Card], num_opponents: int = 1,
+                          iterations: int = 15000, **options) -> AsyncIterator[Tuple[str, object]]:
+        """
+        ComputeBackend.stream_spot on behalf of `owner` (a chat id). Raises Superseded
+        once the same owner asks for another spot, ComputeBusy when the queue is full.
+        """
+        key = self._key(hero, board, num_opponents, iterations, options)
+        job = self._jobs.get(key)
+        previous = self._latest.pop(owner, None)
+        if previous is not None and previous[0] is not job:
+            # Frees the previous job's queue slot before the capacity check
+            self._leave(*previous, superseded=True)
+        if job is None:
+            if self.pending >= self.backend.max_pending:
+                metrics.COMPUTE_BUSY.inc()
+                raise ComputeBusy()
+            job = _Job(key, owner, (hero, board, num_opponents, iterations), options)
+            self._jobs[key] = job
+            self._queued.setdefault(owner, deque()).append(job)
+        else:
+            metrics.COMPUTE_COALESCED.inc()
+        updates = asyncio.Queue()
+        job.waiters.append(updates)
+        self._latest[owner] = (job, updates)
+        if previous is not None and previous[0] is job:
+            # Asked again for the same spot: the new waiter takes over the running job
+            self._leave(*previous, superseded=True)
+        self._pump()
+
+        try:
+            while True:
+                kind, payload = await updates.get()
+                if kind == 'superseded':
+                    raise Superseded()
+                if kind == 'error':
+                    raise payload
+                yield kind, payload
+                if kind == 'done':
+                    return
+        finally:
+            if self._latest.get(owner, (None, None))[1] is updates:
+                del self._latest[owner]
+            self._leave(job, updates)
+
+    def supersede(self, owner: Hashable):
+        """
+        Drops the owner's pending request without making a new one (e.g. its hand was
+        reset): its waiter gets Superseded, and a job nobody else waits for is dropped.
+        """
+        previous = self._latest.pop(owner, None)
+        if previous is not None:
+            self._leave(*previous, superseded=True)
+
+    def _leave(self, job: _Job, updates: asyncio.Queue, superseded: bool = False):
+        """Detaches a waiter; a job nobody waits for any more is dropped or cancelled."""
+        if updates not in job.waiters:
+            return
+        job.waiters.remove(updates)
+        if superseded:
+            metrics.COMPUTE_SUPERSEDED.inc()
+            updates.put_nowait(('superseded', None))
+        if job.waiters:
+            return
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+        if job.task is None:
+            queue = self._queued[job.owner]
+            queue.remove(job)
+            if not queue:
+                del self._queued[job.owner]
+        else:
+            self.backend.cancel(job.job_id)
+
+    def _pump(self):
+        """Starts queued jobs, one chat at a time in turn, while workers are free."""
+        while self.running < self.max_running and self._queued:
+            owner, queue = self._queued.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                # The chat's next job goes behind every other waiting chat
+                self._queued[owner] = queue
+            self.running += 1
+            job.job_id = self.backend.new_job_id()
+            job.task = asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job: _Job):
+        hero, board, num_opponents, iterations = job.args
+        try:
+            async for kind, payload in self.backend.stream_spot(hero, board, num_opponents, iterations,
+                                                                job_id=job.job_id, **job.options):
+                if payload is None:
+                    break  # cancelled
+                for updates in job.waiters:
+                    updates.put_nowait((kind, payload))
+        except Exception as e:
+            for updates in job.waiters:
+                updates.put_nowait(('error', e))
+        finally:
+            self.running -= 1
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            self._pump()
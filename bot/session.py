@@ -0,0 +1,110 @@
+"""
+A chat's hand in context.user_data, kept to small integers so sessions are cheap
+to hold and to persist: 'cards' is the selected card indices in selection order
+(the hero's cards, then the board) and 'used' the 52-bit mask of the same cards.
+'game' is 'plo' for Pot Limit Omaha (4 hero cards); absent means Hold'em (2).
+'opponent_range' is the /range text. Results are not kept here (see
+bot.handlers.results): the message is rebuilt from the cards.
+"""
+from typing import List, Optional
+
+from poker.card import CARDS, Card
+from poker.store import DiskCache
+
+BOARD_CARDS = 5
+
+# Hero cards per game
+HOLE_CARDS = {'holdem': 2, 'plo': 4}
+
+# Everything a session holds; SessionStore saves nothing else
+SESSION_KEYS = ('cards', 'used', 'game', 'opponent_range')
+# Kept in sessions by earlier versions (the last result and its rendered analysis)
+_STALE_KEYS = ('probs', 'analysis_text', 'calculating')
+
+
+def reset(user_data):
+    user_data['cards'] = []
+    user_data['used'] = 0
+
+
+def ensure(user_data):
+    """Starts an empty hand if the chat has none (new chat, or state lost on a restart)."""
+    if 'cards' not in user_data:
+        reset(user_data)
+    for key in _STALE_KEYS:
+        user_data.pop(key, None)
+
+
+def set_game(user_data, name: str):
+    """Switches the chat to another game ('holdem' or 'plo') with an empty hand."""
+    if name == 'holdem':
+        user_data.pop('game', None)
+    else:
+        user_data['game'] = name
+    reset(user_data)
+
+
+def game(user_data) -> str:
+    return user_data.get('game', 'holdem')
+
+
+def hole_cards(user_data) -> int:
+    return HOLE_CARDS[game(user_data)]
+
+
+def max_cards(user_data) -> int:
+    return hole_cards(user_data) + BOARD_CARDS
+
+
+def hero(user_data) -> List[Card]:
+    return [CARDS[i] for i in user_data.get('cards', [])[:hole_cards(user_data)]]
+
+
+def board(user_data) -> List[Card]:
+    return [CARDS[i] for i in user_data.get('cards', [])[hole_cards(user_data):]]
+
+
+def hero_complete(user_data) -> bool:
+    return len(user_data.get('cards', [])) >= hole_cards(user_data)
+
+
+def used_mask(user_data) -> int:
+    return user_data.get('used', 0)
+
+
+def add_card(user_data, card: Card) -> bool:
+    """Adds the next card; False if it is already selected or the hand is complete."""
+    if user_data['used'] & card.bit or len(user_data['cards']) >= max_cards(user_data):
+        return False
+    user_data['cards'].append(card.index)
+    user_data['used'] |= card.bit
+    return True
+
+
+def undo(user_data) -> Optional[Card]:
+    """Removes the last selected card and returns it (None if there was none)."""
+    if not user_data['cards']:
+        return None
+    card = CARDS[user_data['cards'].pop()]
+    user_data['used'] &= ~card.bit
+    return card
+
+
+class SessionStore:
+    """
+    Sessions in a SQLite file shared by several bot processes, so any of them can
+    serve any user. The least recently used sessions beyond max_sessions are dropped.
+    """
+
+    def __init__(self, path: str, max_sessions: int = 1000000):
+        self.cache = DiskCache(path, max_entries=max_sessions)
+
+    def load(self, user_id: int, user_data):
+        user_data.clear()
+        user_data.update(self.cache.get(('session', user_id)) or {})
+
+    def save(self, user_id: int, user_data):
+        self.cache.put(('session', user_id), {k: user_data[k] for k in SESSION_KEYS if k in user_data})
+
+    def close(self):
+        self.cache.close()
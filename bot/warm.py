@@ -0,0 +1,78 @@
+"""
+Pre-populates the persistent equity cache with flop spots, so the first users
+to see them don't wait:
+
+    python -m bot.warm --db equity.db --hands "top 10%" --flops 300 --workers 8
+
+Every spot is computed exactly as the bot computes it (same worker function and
+parameters), so the bot's lookups hit the stored entries.
+"""
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from poker.card import CARDS, Card, canonicalize
+from poker.preflop import hand_class, representative_hand
+from poker.ranges import parse_range
+from .settings import MAX_ITERATIONS, TARGET_STDERR, TIME_BUDGET
+
+
+def flop_spots(hands: str, flops_per_hand: int, seed: int = 0) -> List[Tuple[List[Card], List[Card]]]:
+    """
+    (hero, flop) spots for every hand class of the `hands` range: up to
+    `flops_per_hand` suit-distinct flops each (0 = all of them).
+    """
+    classes = sorted({hand_class([Card.from_index(a), Card.from_index(b)])
+                      for a, b in parse_range(hands).combos.tolist()})
+    rng = random.Random(seed)
+    spots = []
+    for index in classes:
+        hero = representative_hand(index)
+        deck = [c for c in CARDS if c not in hero]
+        flops = {}
+        for flop in itertools.combinations(deck, 3):
+            flops.setdefault(canonicalize(hero, list(flop))[0], list(flop))
+        flops = sorted(flops.values(), key=lambda f: [c.index for c in f])
+        if flops_per_hand and len(flops) > flops_per_hand:
+            flops = rng.sample(flops, flops_per_hand)
+        spots.extend((hero, flop) for flop in flops)
+    return spots
+
+
+def _warm_spot(spot) -> None:
+    from .compute import compute_spot
+    hero, board = spot
+    # Same call as handlers.run_simulation makes, so the cache keys match
+    compute_spot(hero, board, 1, MAX_ITERATIONS, target_stderr=TARGET_STDERR, time_budget=TIME_BUDGET,
+                 opponent_ranges=None)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fill the persistent equity cache with flop spots.")
+    parser.add_argument('--db', default=os.getenv('EQUITY_DB'), help="cache file (default: $EQUITY_DB)")
+    parser.add_argument('--hands', default='top 10%', help="starting hands to warm, in range notation")
+    parser.add_argument('--flops', type=int, default=300, help="flops per starting hand (0 = all)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0, help="picks which flops are warmed")
+    args = parser.parse_args(argv)
+    if not args.db:
+        parser.error("--db or EQUITY_DB is required")
+
+    # Workers open the store from the environment, like the bot's compute workers
+    os.environ['EQUITY_DB'] = args.db
+    spots = flop_spots(args.hands, args.flops, args.seed)
+    print(f"Warming {len(spots)} spots into {args.db}")
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for done, _ in enumerate(pool.map(_warm_spot, spots, chunksize=8), 1):
+            if done % 100 == 0 or done == len(spots):
+                print(f"{done}/{len(spots)} spots, {done / (time.time() - start):.1f}/s")
+
+
+if __name__ == '__main__':
+    main()
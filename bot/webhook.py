@@ -0,0 +1,308 @@
+"""
+Webhook mode: several front-end processes serve Telegram's webhook on one port
+(SO_REUSEPORT, the kernel spreads connections between them) and send equity jobs
+to one shared compute server process (bot.remote). Sessions live in a shared
+SQLite store (SESSION_DB), so any front-end can serve any user.
+
+    python -m bot.webhook --url https://bot.example.com --port 8443 --frontends 4
+    # or via main.py with WEBHOOK_URL (and WEBHOOK_PORT, WEBHOOK_FRONTENDS, ...) set
+
+An update is acknowledged once it has been handled; on SIGTERM (or Ctrl-C) the
+front-ends stop accepting connections, finish the updates in progress and exit,
+then the compute server stops its workers. Telegram redelivers anything that was
+not acknowledged.
+
+With --metrics-port (or METRICS_PORT) the compute server serves bot.metrics there,
+its workers' timings and profiles included, and front-end i on the port + 1 + i.
+
+Locally, without Telegram (see bot.fake_telegram):
+
+    python -m bot.fake_telegram --api-port 8081 --webhook http://127.0.0.1:8443/telegram
+    TELEGRAM_BOT_TOKEN=123:fake python -m bot.webhook --port 8443 --api-url http://127.0.0.1:8081/bot
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from . import metrics
+from .remote import run_compute_server
+
+# Seconds a front-end waits for updates in progress when asked to stop
+DRAIN_TIMEOUT = 30.0
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+# Telegram's updates are a few KB; anything near this is not Telegram
+MAX_BODY = 1 << 20
+MAX_HEADER_LINES = 100
+
+
+async def read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+    """
+    (method, path, headers) of the next HTTP/1.1 request, or None at the end of the
+    connection. Raises ValueError for more than MAX_HEADER_LINES header lines (and,
+    from the reader, for a line over its 64 KB limit).
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, _ = line.decode('latin-1').split(' ', 2)
+    headers = {}
+    for _ in range(MAX_HEADER_LINES + 1):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return method, path, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise ValueError("Too many header lines")
+
+
+def content_length(headers: Dict[str, str]) -> int:
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"Bad Content-Length: {length}")
+    return length
+
+
+async def read_request(reader: asyncio.StreamReader,
+                       max_body: int = MAX_BODY) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """(method, path, headers, body) of the next request; ValueError if the body is over max_body."""
+    head = await read_head(reader)
+    if head is None:
+        return None
+    length = content_length(head[2])
+    if length > max_body:
+        raise ValueError(f"Body of {length} bytes")
+    return head + (await reader.readexactly(length),)
+
+
+def write_response(writer: asyncio.StreamWriter, status: str, body: bytes = b'', close: bool = False,
+                   content_type: str = 'application/json'):
+    head = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+    if close:
+        head += "Connection: close\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+
+
+def reuse_port_socket(host: str, port: int) -> socket.socket:
+    """A listening socket that other processes can bind to the same port as well."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.setblocking(False)
+    return sock
+
+
+class WebhookServer:
+    """Feeds POSTs to `path` (with the right secret token) to the application, answering once handled."""
+
+    def __init__(self, application, path: str, secret: Optional[str] = None):
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self._server = None
+        self._draining = False
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writers = set()
+
+    async def start(self, sock: socket.socket):
+        self._server = await asyncio.start_server(self._serve, sock=sock)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Stops accepting connections and waits (up to timeout) for the updates in progress."""
+        self._draining = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Stopping with %d updates still in progress", self._in_flight)
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while not self._draining:
+                head = await read_head(reader)
+                if head is None:
+                    break
+                status = self._refuse(*head)
+                if status is not None:
+                    # The body is never read (it may be huge), so the connection can't carry another request
+                    write_response(writer, status, close=True)
+                    await writer.drain()
+                    break
+                status = await self._handle(await reader.readexactly(content_length(head[2])))
+                write_response(writer, status, close=self._draining)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _refuse(self, method: str, path: str, headers: Dict[str, str]) -> Optional[str]:
+        """The status of a request refused on its head alone, before anything else is read; None if accepted."""
+        if self._draining:
+            return "503 Service Unavailable"  # Telegram retries, reaching a running front-end
+        if method != 'POST' or path != self.path:
+            return "404 Not Found"
+        if self.secret and headers.get(SECRET_HEADER) != self.secret:
+            return "403 Forbidden"
+        if content_length(headers) > MAX_BODY:
+            return "413 Payload Too Large"
+        return None
+
+    async def _handle(self, body: bytes) -> str:
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+            await self.application.process_update(update)
+        except Exception:
+            logging.exception("Update failed")
+        finally:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.set()
+        return "200 OK"
+
+
+def run_frontend(config: Dict, metrics_port: Optional[int] = None):
+    """Process entry point of one front-end; serves until SIGTERM or SIGINT, then drains."""
+    logging.basicConfig(format='%(asctime)s - %(process)d - %(levelname)s - %(message)s', level=logging.INFO)
+    if metrics_port:
+        metrics.serve(metrics_port)
+    asyncio.run(_frontend(config))
+
+
+async def _frontend(config: Dict):
+    from . import handlers
+    from poker.cache import TieredCache
+    from .remote import RemoteScheduler
+    from .session import SessionStore
+
+    handlers.scheduler = RemoteScheduler(config['compute_socket'])
+    handlers.session_store = SessionStore(config['session_db'])
+    # Results next to the sessions, so any front-end can render any user's message
+    handlers.results = TieredCache(handlers.RESULT_CACHE_SIZE, handlers.session_store.cache, namespace='result')
+    builder = ApplicationBuilder().token(config['token']).updater(None).concurrent_updates(True)
+    if config.get('api_url'):
+        builder = builder.base_url(config['api_url'])
+    application = builder.build()
+    handlers.register_handlers(application)
+    application.add_handler(TypeHandler(Update, handlers.load_session), group=-1)
+    application.add_handler(TypeHandler(Update, handlers.save_session), group=1)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    await handlers.scheduler.start()
+    await application.start()
+    server = WebhookServer(application, config['path'], config.get('secret'))
+    await server.start(reuse_port_socket(config['host'], config['port']))
+    logging.info("Front-end serving %s on port %d", config['path'], config['port'])
+    try:
+        await stop.wait()
+        await server.drain()
+    finally:
+        await application.stop()
+        await application.shutdown()
+        handlers.scheduler.shutdown()
+        handlers.session_store.close()
+
+
+async def _set_webhook(token: str, url: str, secret: Optional[str], api_url: Optional[str]):
+    bot = Bot(token, base_url=api_url) if api_url else Bot(token)
+    async with bot:
+        await bot.set_webhook(url, secret_token=secret, max_connections=100)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the bot behind a webhook with several front-end processes.")
+    parser.add_argument('--url', default=os.getenv('WEBHOOK_URL'),
+                        help="public base URL to register with Telegram (default: $WEBHOOK_URL; none = don't register)")
+    parser.add_argument('--host', default=os.getenv('WEBHOOK_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('WEBHOOK_PORT', 8443)))
+    parser.add_argument('--path', default=os.getenv('WEBHOOK_PATH', '/telegram'))
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'), help="secret token Telegram sends along")
+    parser.add_argument('--frontends', type=int, default=int(os.getenv('WEBHOOK_FRONTENDS', 2)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('COMPUTE_WORKERS', 0)) or None,
+                        help="compute worker processes (default: all cores)")
+    parser.add_argument('--compute-socket', default=os.getenv('COMPUTE_SOCKET'),
+                        help="Unix socket of the compute server (default: in a private temp dir)")
+    parser.add_argument('--session-db', default=os.getenv('SESSION_DB', 'sessions.db'))
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('METRICS_PORT', 0)),
+                        help="serve the compute server's metrics (with the workers' profiles) on this local port "
+                             "and front-end i's on the port + 1 + i (default: $METRICS_PORT; 0 = off)")
+    parser.add_argument('--api-url', default=os.getenv('TELEGRAM_API_URL'),
+                        help="Bot API base URL, e.g. a local fake (bot.fake_telegram)")
+    args = parser.parse_args(argv)
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        parser.error("TELEGRAM_BOT_TOKEN is required")
+    # Only this user may reach the default socket: mkdtemp makes the directory 0700
+    socket_dir = None if args.compute_socket else tempfile.mkdtemp(prefix='poker-compute-')
+    compute_socket = args.compute_socket or os.path.join(socket_dir, 'compute.sock')
+
+    config = {'token': token, 'host': args.host, 'port': args.port, 'path': args.path, 'secret': args.secret,
+              'compute_socket': compute_socket, 'session_db': args.session_db, 'api_url': args.api_url}
+    ctx = multiprocessing.get_context('spawn')
+    compute = ctx.Process(target=run_compute_server, args=(compute_socket, args.workers, None, args.metrics_port),
+                          name='compute')
+    compute.start()
+    frontends = [ctx.Process(target=run_frontend, args=(config, args.metrics_port and args.metrics_port + 1 + i),
+                             name=f'frontend-{i}')
+                 for i in range(args.frontends)]
+    for process in frontends:
+        process.start()
+    if args.url:
+        asyncio.run(_set_webhook(token, args.url.rstrip('/') + args.path, args.secret, args.api_url))
+    print(f"Webhook on port {args.port}: {args.frontends} front-ends, compute server at {compute_socket}")
+    if args.metrics_port:
+        print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics (compute), "
+              f"ports {args.metrics_port + 1}-{args.metrics_port + args.frontends} (front-ends)")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    while not stop.wait(0.5):
+        if not compute.is_alive() or not all(p.is_alive() for p in frontends):
+            print("A bot process exited; stopping")
+            break
+
+    # Front-ends drain first (their updates still need the compute server), then the workers stop
+    for process in frontends:
+        if process.is_alive():
+            process.terminate()
+    for process in frontends:
+        process.join(DRAIN_TIMEOUT + 5)
+    if compute.is_alive():
+        compute.terminate()
+    compute.join()
+    if socket_dir is not None:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+    print("Stopped")
+
+
+if __name__ == '__main__':
+    main()
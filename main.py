@@ -1,12 +1,14 @@
 import os
 import logging
 from dotenv import load_dotenv
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler
-from bot.handlers import start_command, help_command, handle_callback
 
-# Load environment variables
+# Load environment variables (before the handlers read their compute settings)
 load_dotenv()
 
+from telegram.ext import ApplicationBuilder, PicklePersistence, PersistenceInput
+from bot.handlers import register_handlers, start_compute, stop_compute
+from bot import metrics
+
 # Enable logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -19,11 +21,37 @@ if __name__ == '__main__':
         print("Error: TELEGRAM_BOT_TOKEN not found in .env file.")
         exit(1)
 
-    application = ApplicationBuilder().token(token).build()
+    # Webhook mode: several front-end processes behind one port sharing one compute pool
+    # (each process serves its own metrics from METRICS_PORT on, see bot.webhook)
+    if os.getenv('WEBHOOK_URL'):
+        from bot.webhook import main as run_webhook
+        run_webhook([])
+        exit(0)
+
+    # Local Prometheus endpoint and profiler (off unless a port is configured)
+    metrics_port = int(os.getenv('METRICS_PORT', 0))
+    if metrics_port:
+        metrics.serve(metrics_port)
+        print(f"Metrics on http://127.0.0.1:{metrics_port}/metrics")
+
+    # Updates are handled concurrently: equity runs in the compute workers, so one
+    # user's calculation never delays another user's commands.
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(True)
+        .post_init(start_compute)
+        .post_shutdown(stop_compute)
+    )
+    # Sessions (selected cards as ints, the game and range) survive restarts if a file is configured
+    session_file = os.getenv('SESSION_FILE')
+    if session_file:
+        builder = builder.persistence(PicklePersistence(
+            session_file, store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=30))
+    application = builder.build()
     
-    application.add_handler(CommandHandler('start', start_command))
-    application.add_handler(CommandHandler('help', help_command))
-    application.add_handler(CallbackQueryHandler(handle_callback))
+    register_handlers(application)
     
     print("Bot is running...")
     application.run_polling()
@@ -1,75 +1,155 @@
-from treys import Evaluator, Card as TreysCard, Deck as TreysDeck
 from .card import Card
-from typing import List, Dict, Tuple
+from .cache import LRUCache
+from .evaluator import BatchEvaluator, HandState, RANK_CLASS_MAX, index_to_str
+from typing import List, Dict, Iterator, Optional, Tuple
+from collections.abc import Mapping
 import itertools
+import numpy as np
+
+# Previous streets kept per analyzer, so adding the turn or river extends them
+STREET_CACHE_SIZE = 64
+
+# What the next card is, for the equity distribution heading
+STREET_TRANSLATION = {"turn": " на терне", "river": " на ривере"}
+
+# Translation map for hand ranks
+RANK_TRANSLATION = {
+    "Royal Flush": "Роял Флеш",
+    "Straight Flush": "Стрит Флеш",
+    "Four of a Kind": "Каре",
+    "Full House": "Фулл Хаус",
+    "Flush": "Флеш",
+    "Straight": "Стрит",
+    "Three of a Kind": "Сет/Тройка",
+    "Two Pair": "Две Пары",
+    "Pair": "Пара",
+    "High Card": "Старшая Карта"
+}
+
+
+class StrongerHands(Mapping):
+    """
+    Opponent hands beating the hero, grouped by rank class.
+
+    Works as a read-only {rank name: [hand strings]} mapping, but only holds card
+    index arrays: per-class counts are available up front and the strings of a
+    class are built when that class is read. Hands are sorted strongest first,
+    ties in deck order.
+    """
+
+    def __init__(self, hands: np.ndarray, scores: np.ndarray):
+        # One int64 key (score, then the cards as base-52 digits) sorts faster than a lexsort
+        key = scores.astype(np.int64)
+        for column in hands.T:
+            key = key * 52 + column
+        order = np.argsort(key, kind='stable')
+        self.hands = hands[order]
+        self.scores = scores[order]
+        classes = BatchEvaluator.get_rank_class(self.scores)
+        # Sorted by score, so every class is one contiguous slice
+        names = [BatchEvaluator.class_to_string(c) for c in range(len(RANK_CLASS_MAX))]
+        bounds = np.searchsorted(classes, np.arange(len(names) + 1))
+        self._slices = {
+            names[c]: slice(int(bounds[c]), int(bounds[c + 1]))
+            for c in range(len(names)) if bounds[c + 1] > bounds[c]
+        }
+        self._strings = {}
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """Number of stronger hands per rank class, strongest class first."""
+        return {name: sl.stop - sl.start for name, sl in self._slices.items()}
+
+    def examples(self, rank_name: str, n: int = 3) -> List[str]:
+        """The n strongest hands of a class, without materializing the rest."""
+        sl = self._slices[rank_name]
+        return [self._hand_str(h) for h in self.hands[sl.start:min(sl.stop, sl.start + n)].tolist()]
+
+    def map_cards(self, card_map: np.ndarray) -> 'StrongerHands':
+        """The same result with every card index c replaced by card_map[c] (e.g. a suit relabelling)."""
+        return StrongerHands(np.sort(card_map[self.hands], axis=1), self.scores)
+
+    @staticmethod
+    def _hand_str(hand: List[int]) -> str:
+        return "".join(index_to_str(c) for c in hand)
+
+    def __getitem__(self, rank_name: str) -> List[str]:
+        if rank_name not in self._strings:
+            sl = self._slices[rank_name]
+            self._strings[rank_name] = [self._hand_str(h) for h in self.hands[sl].tolist()]
+        return self._strings[rank_name]
+
+    def __contains__(self, rank_name) -> bool:
+        return rank_name in self._slices
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slices)
+
+    def __len__(self):
+        return len(self._slices)
+
 
 class HandAnalyzer:
+    # Cards in an opponent's hand (PLO: poker.omaha.OmahaAnalyzer)
+    hole_cards = 2
+
     def __init__(self):
-        self.evaluator = Evaluator()
+        self.evaluator = BatchEvaluator()
+        # (hero, board) -> (opponent hands, their HandState, hero HandState)
+        self._streets = LRUCache(STREET_CACHE_SIZE)
 
-    def analyze_stronger_hands(self, hero_hand: List[Card], board: List[Card]) -> Dict[str, List[str]]:
+    def analyze_stronger_hands(self, hero_hand: List[Card], board: List[Card]) -> StrongerHands:
         """
         Identifies opponent hands that are stronger than the hero's hand.
-        Returns a dictionary grouping stronger hands by their rank class (e.g., 'Flush': ['AhKh', ...]).
+        Returns them grouped by rank class (e.g., 'Flush': ['A♥K♥', ...]), see StrongerHands.
         """
         if not board or len(board) < 3:
-            return {}
+            return StrongerHands(np.empty((0, self.hole_cards), dtype=np.int64), np.empty(0, dtype=np.int16))
 
-        # Convert to treys format
-        hero_treys = [TreysCard.new(c.to_treys_str()) for c in hero_hand]
-        board_treys = [TreysCard.new(c.to_treys_str()) for c in board]
+        return self.analyze_indices([c.index for c in hero_hand], [c.index for c in board])
 
-        hero_score = self.evaluator.evaluate(board_treys, hero_treys)
-        
-        # Get all remaining cards
-        all_cards = TreysDeck.GetFullDeck()
-        removed_cards = hero_treys + board_treys
-        remaining_cards = [c for c in all_cards if c not in removed_cards]
-
-        stronger_hands = {}
+    def analyze_indices(self, hero_idx: List[int], board_idx: List[int]) -> StrongerHands:
+        """Same as analyze_stronger_hands, on card indices (board in dealing order)."""
+        opp_hands, opp_state, hero_state = self._street(tuple(hero_idx), tuple(board_idx))
+        hero_score = self.evaluator.score(hero_state)[0]
+        opp_scores = self.evaluator.score(opp_state)
 
-        # Iterate through all possible 2-card opponent hands
-        for opp_hand_treys in itertools.combinations(remaining_cards, 2):
-            opp_hand_list = list(opp_hand_treys)
-            opp_score = self.evaluator.evaluate(board_treys, opp_hand_list)
+        stronger = opp_scores < hero_score  # Lower score is better in treys
+        return StrongerHands(opp_hands[stronger], opp_scores[stronger])
 
-            if opp_score < hero_score: # Lower score is better in treys
-                rank_class = self.evaluator.get_rank_class(opp_score)
-                rank_name = self.evaluator.class_to_string(rank_class)
-                
-                # Convert back to readable string
-                c1 = TreysCard.int_to_str(opp_hand_list[0])
-                c2 = TreysCard.int_to_str(opp_hand_list[1])
-                # Fix suit chars for display (treys uses lowercase letters)
-                c1 = c1.replace('s', '♠').replace('h', '♥').replace('d', '♦').replace('c', '♣')
-                c2 = c2.replace('s', '♠').replace('h', '♥').replace('d', '♦').replace('c', '♣')
-                hand_str = f"{c1}{c2}"
+    def _street(self, hero: Tuple[int, ...], board: Tuple[int, ...]):
+        """
+        Opponent hands and partial evaluations for a street. When the previous street
+        of the same hand was analyzed, only its new card is folded in.
+        """
+        key = (hero, board)
+        street = self._streets.get(key)
+        if street is not None:
+            return street
 
-                if rank_name not in stronger_hands:
-                    stronger_hands[rank_name] = []
-                stronger_hands[rank_name].append(hand_str)
+        previous = self._streets.get((hero, board[:-1])) if len(board) > 3 else None
+        if previous is not None:
+            card = board[-1]
+            prev_hands, prev_state, prev_hero = previous
+            keep = (prev_hands != card).all(axis=1)
+            street = (prev_hands[keep], prev_state[keep].add(card), prev_hero.add(card))
+        else:
+            removed = set(hero) | set(board)
+            remaining = [c for c in range(52) if c not in removed]
+            opp_hands = np.array(list(itertools.combinations(remaining, 2)), dtype=np.int64)
+            board_block = np.tile(np.array(board, dtype=np.int64), (len(opp_hands), 1))
+            opp_state = HandState.from_cards(np.hstack([opp_hands, board_block]))
+            hero_state = HandState.from_cards(np.array([list(hero) + list(board)]))
+            street = (opp_hands, opp_state, hero_state)
 
-        return stronger_hands
+        self._streets.put(key, street)
+        return street
 
-    def format_analysis(self, stronger_hands: Dict[str, List[str]]) -> str:
+    def format_analysis(self, stronger_hands: Mapping) -> str:
         """Formats the analysis result into a readable string (Russian)."""
         if not stronger_hands:
             return ""
 
-        # Translation map for hand ranks
-        rank_translation = {
-            "Royal Flush": "Роял Флеш",
-            "Straight Flush": "Стрит Флеш",
-            "Four of a Kind": "Каре",
-            "Full House": "Фулл Хаус",
-            "Flush": "Флеш",
-            "Straight": "Стрит",
-            "Three of a Kind": "Сет/Тройка",
-            "Two Pair": "Две Пары",
-            "Pair": "Пара",
-            "High Card": "Старшая Карта"
-        }
-
         msg = "\n<b>⚠️ Руки сильнее вашей:</b>\n"
         
         # Sort by rank strength (Treys doesn't strictly order keys, but usually we want strongest first)
@@ -79,12 +159,16 @@ class HandAnalyzer:
         count = 0
         for rank_name in order:
             if rank_name in stronger_hands:
-                hands = stronger_hands[rank_name]
-                ru_rank = rank_translation.get(rank_name, rank_name)
+                ru_rank = RANK_TRANSLATION.get(rank_name, rank_name)
                 
-                # Limit examples to keep message short
-                examples = ", ".join(hands[:3]) 
-                remaining = len(hands) - 3
+                # Limit examples to keep message short (StrongerHands builds only these strings)
+                if isinstance(stronger_hands, StrongerHands):
+                    examples = ", ".join(stronger_hands.examples(rank_name, 3))
+                    remaining = stronger_hands.counts[rank_name] - 3
+                else:
+                    hands = stronger_hands[rank_name]
+                    examples = ", ".join(hands[:3])
+                    remaining = len(hands) - 3
                 if remaining > 0:
                     examples += f" и еще {remaining}"
                 
@@ -95,3 +179,54 @@ class HandAnalyzer:
                     break
         
         return msg
+
+    def format_outs(self, outs: Dict) -> str:
+        """Formats MonteCarloSimulation.run_with_outs outs into a readable string (Russian)."""
+        if not outs or not outs['next_cards']:
+            return ""
+
+        msg = "\n<b>🎯 Ауты (улучшение на следующей карте):</b>\n"
+        if not outs['outs']:
+            msg += "Нет карт, улучшающих вашу комбинацию\n"
+        for rank_name, cards in outs['outs'].items():
+            ru_rank = RANK_TRANSLATION.get(rank_name, rank_name)
+            examples = ", ".join(str(c) for c in cards[:6])
+            if len(cards) > 6:
+                examples += f" и еще {len(cards) - 6}"
+            msg += f"• <b>{ru_rank}</b>: {len(cards)} карт ({examples})\n"
+
+        # Flop only: the river is still to come after the next card
+        if outs['by_river']:
+            chances = ", ".join(f"{RANK_TRANSLATION.get(name, name)} {pct:.1f}%"
+                                for name, pct in outs['by_river'].items())
+            msg += f"<i>К риверу: {chances}</i>\n"
+
+        best = ", ".join(f"{card} ({equity:.0f}%)" for card, _, equity in outs['next_cards'][:3])
+        worst = ", ".join(f"{card} ({equity:.0f}%)" for card, _, equity in outs['next_cards'][-3:][::-1])
+        msg += f"📈 Лучшие карты: {best}\n📉 Худшие карты: {worst}\n"
+        return msg
+
+    def format_distribution(self, distribution: Optional[Dict], width: int = 12) -> str:
+        """Formats run_with_outs' outs['distribution'] as a compact text histogram (Russian)."""
+        if not distribution:
+            return ""
+
+        street = STREET_TRANSLATION.get(distribution.get('street'), "")
+        percentiles = distribution['percentiles']
+        msg = (f"\n<b>📊 Разброс эквити{street}:</b>\n"
+               f"среднее {distribution['mean']:.0f}%, σ {distribution['std']:.0f}%, "
+               f"медиана {percentiles[50]:.0f}%, 10-90%: {percentiles[10]:.0f}-{percentiles[90]:.0f}%\n")
+
+        # Only the bins between the lowest and the highest equity, bars scaled to the largest bin
+        shares = distribution['histogram']
+        filled = [i for i, share in enumerate(shares) if share > 0]
+        step = 100 // len(shares)
+        top = max(shares)
+        lines = []
+        for i in range(filled[0], filled[-1] + 1):
+            eighths = round(shares[i] / top * width * 8)
+            bar = "█" * (eighths // 8) + ("▏▎▍▌▋▊▉"[eighths % 8 - 1] if eighths % 8 else "")
+            label = f"{i * step}-{(i + 1) * step}%"
+            lines.append(f"{label:>7} {bar:<{width}} {shares[i]:3.0f}%")
+        msg += "<pre>" + "\n".join(lines) + "</pre>\n"
+        return msg
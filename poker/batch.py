@@ -0,0 +1,231 @@
+"""
+Bulk equity for hand histories, streamed from CSV or JSONL:
+
+    python -m poker.batch hands.jsonl -o results.jsonl --workers 8
+    python -m poker.batch hands.csv -o results.csv --checkpoint results.ckpt
+
+Every input record is one situation with the fields hero ('AsKs'), board
+('2h7dQc', may be empty), opponents (default 1) and range (optional opponent
+range, see poker.ranges). CSV input needs a header row with these names.
+
+Records are read lazily and computed in chunks on a process pool with a bounded
+number of chunks in flight; results are written in input order as they complete,
+so memory stays flat for inputs of any size. With --checkpoint, progress is saved
+every few seconds and a rerun continues after the last saved record.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .card import parse_cards
+
+# Columns of CSV output; JSONL output also carries the per-class counts
+CSV_FIELDS = ['line', 'hero', 'board', 'opponents', 'range', 'win', 'tie', 'lose', 'equity', 'stderr',
+              'samples', 'stronger_hands', 'error']
+
+# Key read_records puts a line's parse error under, instead of its fields
+INVALID = '__invalid__'
+
+CHECKPOINT_INTERVAL = 5.0
+REPORT_INTERVAL = 10.0
+
+# Engines of a pool worker, built on its first chunk
+_simulation = None
+_analyzer = None
+
+
+def read_records(path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    (line number, record) of every situation in a CSV or JSONL file, read lazily.
+    A line that isn't a JSON object gives a record with just INVALID set to the reason.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            # Line 1 is the header
+            for line, row in enumerate(csv.DictReader(f), 2):
+                yield line, row
+        else:
+            for line, text in enumerate(f, 1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except json.JSONDecodeError as e:
+                    record = {INVALID: f"invalid JSON: {e}"}
+                if not isinstance(record, dict):
+                    record = {INVALID: "expected a JSON object"}
+                yield line, record
+
+
+def _compute_chunk(chunk: List[Tuple[int, Dict]], options: Dict) -> List[Dict]:
+    global _simulation, _analyzer
+    if _simulation is None:
+        from .cache import CachedSimulation
+        from .analysis import HandAnalyzer
+        _simulation = CachedSimulation(maxsize=options['cache_size'])
+        _analyzer = HandAnalyzer()
+    return [_compute_record(line, record, options) for line, record in chunk]
+
+
+def _compute_record(line: int, record: Dict, options: Dict) -> Dict:
+    hand_range = record.get('range') or None
+    result = {'line': line, 'hero': record.get('hero') or '', 'board': record.get('board') or '',
+              'opponents': record.get('opponents') or 1, 'range': hand_range}
+    try:
+        if INVALID in record:
+            raise ValueError(record[INVALID])
+        # Every field is checked here, so a bad value only fails its own record
+        if not all(isinstance(result[k], str) for k in ('hero', 'board')):
+            raise ValueError("hero and board must be card strings")
+        if hand_range is not None and not isinstance(hand_range, str):
+            raise ValueError("range must be a string")
+        try:
+            opponents = int(result['opponents'])
+        except (TypeError, ValueError):
+            raise ValueError(f"opponents must be a whole number, got {result['opponents']!r}")
+        if opponents < 1:
+            raise ValueError("opponents must be at least 1")
+        result['opponents'] = opponents
+        hero = parse_cards(result['hero'])
+        board = parse_cards(result['board'])
+        if len(hero) != 2 or len(board) not in (0, 3, 4, 5) or set(hero) & set(board):
+            raise ValueError("need 2 hero cards and a 0, 3, 4 or 5 card board without shared cards")
+
+        seed = options['seed'] + line if options['seed'] is not None else None
+        probs = _simulation.run(hero, board, opponents, options['iterations'], seed=seed,
+                                target_stderr=options['target_stderr'], opponent_ranges=hand_range)
+        result.update(probs)
+        if options['analysis'] and len(board) >= 3:
+            counts = _analyzer.analyze_stronger_hands(hero, board).counts
+            result['stronger'] = counts
+            result['stronger_hands'] = sum(counts.values())
+    except ValueError as e:
+        result['error'] = str(e)
+    return result
+
+
+class _Writer:
+    """Appends results to a JSONL or CSV file, flushing after every chunk."""
+
+    def __init__(self, path: str, offset: int):
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+' if exists else 'w', newline='')
+        # Drop anything written after the last checkpoint
+        self.file.seek(offset)
+        self.file.truncate()
+        self.csv = None
+        if path.endswith('.csv'):
+            self.csv = csv.DictWriter(self.file, CSV_FIELDS, extrasaction='ignore')
+            if offset == 0:
+                self.csv.writeheader()
+
+    def write(self, results: List[Dict]):
+        for result in results:
+            if self.csv is not None:
+                self.csv.writerow(result)
+            else:
+                self.file.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _load_checkpoint(path: Optional[str]) -> Tuple[int, int]:
+    """(records done, output size) saved by a previous run, or (0, 0)."""
+    if not path or not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        state = json.load(f)
+    return state['records'], state['output_size']
+
+
+def _save_checkpoint(path: str, records: int, output_size: int):
+    # Written aside and renamed, so a crash never leaves a half-written checkpoint
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'records': records, 'output_size': output_size}, f)
+    os.replace(path + '.tmp', path)
+
+
+def run_batch(input_path: str, output_path: str, workers: Optional[int] = None, chunk_size: int = 64,
+              checkpoint: Optional[str] = None, iterations: int = 20000, target_stderr: Optional[float] = None,
+              seed: Optional[int] = None, analysis: bool = True, cache_size: int = 4096,
+              log=sys.stderr) -> int:
+    """
+    Computes every record of input_path into output_path; returns the number of
+    records computed in this run.
+    """
+    done, offset = _load_checkpoint(checkpoint)
+    if done:
+        print(f"Resuming after {done} records", file=log)
+    options = {'iterations': iterations, 'target_stderr': target_stderr, 'seed': seed,
+               'analysis': analysis, 'cache_size': cache_size}
+
+    records = itertools.islice(read_records(input_path), done, None)
+    chunks = iter(lambda: list(itertools.islice(records, chunk_size)), [])
+    writer = _Writer(output_path, offset)
+    workers = workers or os.cpu_count() or 1
+
+    start = last_report = last_checkpoint = time.perf_counter()
+    computed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Bounded in-flight work: at most two chunks per worker are queued or running
+            in_flight = deque(pool.submit(_compute_chunk, chunk, options)
+                              for chunk in itertools.islice(chunks, workers * 2))
+            while in_flight:
+                results = in_flight.popleft().result()
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    in_flight.append(pool.submit(_compute_chunk, chunk, options))
+
+                writer.write(results)
+                computed += len(results)
+                now = time.perf_counter()
+                if checkpoint and now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    _save_checkpoint(checkpoint, done + computed, writer.tell())
+                    last_checkpoint = now
+                if now - last_report >= REPORT_INTERVAL:
+                    print(f"{done + computed} records, {computed / (now - start):.0f}/s", file=log)
+                    last_report = now
+        if checkpoint:
+            _save_checkpoint(checkpoint, done + computed, writer.tell())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {computed} records in {elapsed:.1f}s ({computed / max(elapsed, 1e-9):.0f}/s)", file=log)
+    return computed
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compute equity for every situation of a CSV or JSONL file.")
+    parser.add_argument('input', help="CSV (with header) or JSONL file of hero/board/opponents/range records")
+    parser.add_argument('-o', '--output', required=True, help="results file, .csv or .jsonl")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="records per worker task")
+    parser.add_argument('--checkpoint', help="progress file; rerunning with it resumes an interrupted run")
+    parser.add_argument('--iterations', type=int, default=20000, help="maximum deals per situation")
+    parser.add_argument('--target-stderr', type=float, default=None,
+                        help="stop sampling a situation at this equity standard error (percentage points)")
+    parser.add_argument('--seed', type=int, default=None, help="makes the results reproducible")
+    parser.add_argument('--no-analysis', action='store_true', help="skip the stronger-hands counts")
+    args = parser.parse_args(argv)
+
+    run_batch(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+              checkpoint=args.checkpoint, iterations=args.iterations, target_stderr=args.target_stderr,
+              seed=args.seed, analysis=not args.no_analysis)
+
+
+if __name__ == '__main__':
+    main()
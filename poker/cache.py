@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+import numpy as np
+from .card import Card, canonicalize
+
+
+def _suit_map(suit_perm) -> np.ndarray:
+    """Card index permutation taking canonical suits back to the user's suits."""
+    inverse = np.empty(4, dtype=np.int64)
+    inverse[list(suit_perm)] = np.arange(4)
+    cards = np.arange(52)
+    return (cards & ~3) | inverse[cards & 3]
+
+
+def _canonical_map(suit_perm) -> np.ndarray:
+    """Card index permutation taking the user's suits to canonical ones (the inverse of _suit_map)."""
+    cards = np.arange(52)
+    return (cards & ~3) | np.asarray(suit_perm, dtype=np.int64)[cards & 3]
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry, with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    An LRUCache in front of an optional persistent store (poker.store.DiskCache):
+    misses fall through to the store, and store hits are kept in memory.
+    Counts a hit when either level answers.
+    """
+
+    def __init__(self, maxsize: int = 4096, store=None, namespace: str = ''):
+        self.memory = LRUCache(maxsize)
+        self.store = store
+        self.namespace = namespace
+
+    @property
+    def hits(self) -> int:
+        return self.memory.hits + (self.store.hits if self.store is not None else 0)
+
+    @property
+    def misses(self) -> int:
+        return self.store.misses if self.store is not None else self.memory.misses
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = self.store.get((self.namespace, key))
+            if value is not None:
+                self.memory.put(key, value)
+        return default if value is None else value
+
+    def put(self, key: Hashable, value: Any):
+        self.memory.put(key, value)
+        if self.store is not None:
+            self.store.put((self.namespace, key), value)
+
+    def clear(self):
+        """Clears the in-memory level; the persistent store is shared and left alone."""
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        if self.store is not None:
+            stats['store'] = self.store.stats()
+        return stats
+
+    def __len__(self):
+        return len(self.memory)
+
+
+class CachedSimulation:
+    """
+    MonteCarloSimulation.run behind an LRU cache keyed by the suit-canonical state,
+    so every suit-isomorphic spot is computed once. With a store (poker.store.DiskCache)
+    results also persist and are shared between processes.
+    """
+
+    def __init__(self, simulation: Optional['MonteCarloSimulation'] = None, maxsize: int = 4096, store=None):
+        from .montecarlo import MonteCarloSimulation
+        self.simulation = simulation or MonteCarloSimulation()
+        self.cache = TieredCache(maxsize, store, namespace='equity')
+
+    def run(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1, iterations: int = 10000,
+            **options) -> Dict[str, float]:
+        """Same arguments as MonteCarloSimulation.run; every option is part of the cache key."""
+        if not hero_hand:
+            return self.simulation.run(hero_hand, board, num_opponents, iterations, **options)
+
+        key = self._key(hero_hand, board, num_opponents, iterations, options)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.simulation.run(hero_hand, board, num_opponents, iterations, **options)
+            self.cache.put(key, result)
+        return dict(result)
+
+    def iter_run(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1, iterations: int = 10000,
+                 report_every: Optional[int] = None, report_interval: Optional[float] = 0.25,
+                 **options) -> Iterator[Dict[str, float]]:
+        """MonteCarloSimulation.iter_run; a cached spot yields its final result at once."""
+        if not hero_hand:
+            yield self.simulation.run(hero_hand, board, num_opponents, iterations, **options)
+            return
+
+        key = self._key(hero_hand, board, num_opponents, iterations, options)
+        result = self.cache.get(key)
+        if result is not None:
+            yield dict(result)
+            return
+        for result in self.simulation.iter_run(hero_hand, board, num_opponents, iterations,
+                                               report_every=report_every, report_interval=report_interval, **options):
+            yield result
+        self.cache.put(key, result)
+
+    def run_with_outs(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1):
+        """MonteCarloSimulation.run_with_outs; cached in canonical suits, cards mapped back on every call."""
+        key, suit_perm = canonicalize(hero_hand, board)
+        cache_key = (key, num_opponents, 'outs')
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            cached = self.simulation.run_with_outs([Card.from_index(i) for i in key[0]],
+                                                   [Card.from_index(i) for i in key[1]], num_opponents)
+            self.cache.put(cache_key, cached)
+
+        result, outs = cached
+        to_user = _suit_map(suit_perm)
+        user_card = lambda card: Card.from_index(int(to_user[card.index]))
+        next_cards = [(user_card(card), rank_class, equity) for card, rank_class, equity in outs['next_cards']]
+        return dict(result), {
+            'current': outs['current'],
+            'next_cards': next_cards,
+            'outs': {name: sorted(map(user_card, cards), key=lambda c: c.index) for name, cards in outs['outs'].items()},
+            'by_river': dict(outs['by_river']),
+            'distribution': outs['distribution'],
+        }
+
+    @staticmethod
+    def _key(hero_hand, board: List[Card], num_opponents: int, iterations: int, options: Dict) -> Hashable:
+        ranges = options.get('opponent_ranges')
+        if ranges is None and isinstance(hero_hand, list):
+            spot, _ = canonicalize(hero_hand, board)
+        else:
+            # Ranges may name specific suits, so suit-isomorphic spots aren't the same spot.
+            # They are keyed by their combos, so equal ranges written differently share entries
+            # (imported here: poker.ranges caches its parses in an LRUCache)
+            from .ranges import as_range
+            hero = tuple(c.index for c in hero_hand) if isinstance(hero_hand, list) else as_range(hero_hand).key
+            spot = (hero, tuple(c.index for c in board))
+            if isinstance(ranges, (list, tuple)):
+                ranges = tuple(None if r is None else as_range(r).key for r in ranges)
+            elif ranges is not None:
+                ranges = as_range(ranges).key
+            options = dict(options, opponent_ranges=ranges)
+        return spot, num_opponents, iterations, tuple(sorted(options.items()))
+
+
+class CachedAnalyzer:
+    """
+    HandAnalyzer.analyze_stronger_hands behind an LRU cache keyed by the suit-canonical
+    state. Cached hand lists are stored in canonical suits and mapped back to the
+    user's suits on every hit. Takes the same optional persistent store as CachedSimulation.
+    """
+
+    def __init__(self, analyzer: Optional['HandAnalyzer'] = None, maxsize: int = 4096, store=None):
+        # Imported here: the analyzer itself uses LRUCache for its street states
+        from .analysis import HandAnalyzer
+        self.analyzer = analyzer or HandAnalyzer()
+        self.cache = TieredCache(maxsize, store, namespace='stronger')
+
+    def analyze_stronger_hands(self, hero_hand: List[Card], board: List[Card]) -> 'StrongerHands':
+        if not board or len(board) < 3:
+            return self.analyzer.analyze_stronger_hands(hero_hand, board)
+
+        key, suit_perm = canonicalize(hero_hand, board)
+        stronger = self.cache.get(key)
+        if stronger is None:
+            # The user's own cards, not canonical ones: the canonical suits of a flop and
+            # its turn may differ, and the analyzer extends its previous street by the cards
+            stronger = self.analyzer.analyze_indices([c.index for c in hero_hand], [c.index for c in board])
+            self.cache.put(key, stronger.map_cards(_canonical_map(suit_perm)))
+            return stronger
+
+        return stronger.map_cards(_suit_map(suit_perm))
+
+    def format_analysis(self, stronger_hands) -> str:
+        return self.analyzer.format_analysis(stronger_hands)
+
+    def format_outs(self, outs) -> str:
+        return self.analyzer.format_outs(outs)
+
+    def format_distribution(self, distribution) -> str:
+        return self.analyzer.format_distribution(distribution)
@@ -1,55 +1,176 @@
 import random
-from typing import List, Optional
+import itertools
+import re
+from typing import List, Optional, Tuple
+
+from treys import Card as TreysCard
 
 # Constants for suits and ranks
 SUITS = ['♠', '♥', '♦', '♣']
 RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
 RANK_VALUES = {r: i for i, r in enumerate(RANKS, 2)}
 
+# All 24 ways to relabel suits; equity never depends on which suit is which
+SUIT_PERMUTATIONS = list(itertools.permutations(range(4)))
+
+# Treys string suit letters for our suits
+TREYS_SUITS = {'♠': 's', '♥': 'h', '♦': 'd', '♣': 'c'}
+
+# Card text in treys ('As') or display ('A♠') form
+_CARD_RE = re.compile(r'([2-9tjqka])\s*([shdc♠♥♦♣])', re.IGNORECASE)
+_SUIT_BY_LETTER = {letter: suit for suit, letter in TREYS_SUITS.items()}
+
+# Deck bitmask with all 52 cards; bit i is the card with index i
+FULL_MASK = (1 << 52) - 1
+
+
 class Card:
-    def __init__(self, rank: str, suit: str):
-        if rank not in RANKS:
-            raise ValueError(f"Invalid rank: {rank}")
-        if suit not in SUITS:
-            raise ValueError(f"Invalid suit: {suit}")
-        self.rank = rank
-        self.suit = suit
+    """
+    A playing card. There are exactly 52 instances: Card('A', '♠') returns the
+    shared one, which carries its index, deck bit and treys integer precomputed.
+    """
+    __slots__ = ('rank', 'suit', 'index', 'bit', 'treys')
+
+    _interned = {}
+
+    def __new__(cls, rank: str, suit: str):
+        card = cls._interned.get((rank, suit))
+        if card is None:
+            if rank not in RANKS:
+                raise ValueError(f"Invalid rank: {rank}")
+            if suit not in SUITS:
+                raise ValueError(f"Invalid suit: {suit}")
+            raise ValueError(f"Invalid card: {rank}{suit}")
+        return card
+
+    @classmethod
+    def _create(cls, rank: str, suit: str) -> 'Card':
+        card = object.__new__(cls)
+        card.rank = rank
+        card.suit = suit
+        card.index = RANKS.index(rank) * 4 + SUITS.index(suit)
+        card.bit = 1 << card.index
+        card.treys = TreysCard.new(card.to_treys_str())
+        cls._interned[(rank, suit)] = card
+        return card
+
+    @staticmethod
+    def from_index(index: int) -> 'Card':
+        return CARDS[index]
+
+    def __reduce__(self):
+        # Unpickles (e.g. in a worker process) to that process' shared instance
+        return Card, (self.rank, self.suit)
 
     def __repr__(self):
         return f"{self.rank}{self.suit}"
 
     def __eq__(self, other):
-        return isinstance(other, Card) and self.rank == other.rank and self.suit == other.suit
+        return isinstance(other, Card) and self.index == other.index
 
     def __hash__(self):
-        return hash((self.rank, self.suit))
-    
+        return self.index
+
     def to_treys_str(self) -> str:
         """Converts to treys string format (e.g., 'Ah' for Ace of Hearts)."""
-        # Treys expects: '2c', 'As', 'Th', 'Kd'
-        # Our suits: ♠ -> s, ♥ -> h, ♦ -> d, ♣ -> c
-        suit_map = {'♠': 's', '♥': 'h', '♦': 'd', '♣': 'c'}
-        return f"{self.rank}{suit_map[self.suit]}"
+        return f"{self.rank}{TREYS_SUITS[self.suit]}"
+
+    def to_index(self) -> int:
+        """Card index 0-51 (rank * 4 + suit), as used by poker.evaluator."""
+        return self.index
+
+
+# Every card, by index (same order as treys.Deck.GetFullDeck())
+CARDS = [Card._create(r, s) for r in RANKS for s in SUITS]
+
+
+def cards_mask(cards: List[Card]) -> int:
+    """Bitmask of a set of cards."""
+    mask = 0
+    for card in cards:
+        mask |= card.bit
+    return mask
+
+
+def mask_cards(mask: int) -> List[Card]:
+    """The cards of a bitmask, in index order."""
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(CARDS[low.bit_length() - 1])
+        mask ^= low
+    return cards
+
+
+def parse_cards(text: str) -> List[Card]:
+    """
+    Cards from text such as 'AsKs', 'A♠ K♠' or '2h,7d,Qc'. Raises ValueError on
+    anything else or on a repeated card.
+    """
+    cards = []
+    pos = 0
+    for match in _CARD_RE.finditer(text):
+        if text[pos:match.start()].strip(' ,;'):
+            break
+        rank, suit = match.group(1).upper(), match.group(2).lower()
+        cards.append(Card(rank, _SUIT_BY_LETTER.get(suit, suit)))
+        pos = match.end()
+    if text[pos:].strip(' ,;') or len(set(cards)) != len(cards):
+        raise ValueError(f"Invalid cards: '{text}'")
+    return cards
+
 
 class Deck:
+    """The cards left to deal, as a 52-bit mask."""
+
     def __init__(self):
-        self.cards: List[Card] = [Card(r, s) for s in SUITS for r in RANKS]
+        self.mask = FULL_MASK
         self.shuffled = False
 
+    @property
+    def cards(self) -> List[Card]:
+        return mask_cards(self.mask)
+
     def shuffle(self):
-        random.shuffle(self.cards)
         self.shuffled = True
 
     def deal(self, n: int = 1) -> List[Card]:
-        if n > len(self.cards):
+        if n > len(self):
             raise ValueError("Not enough cards in deck")
-        dealt = self.cards[:n]
-        self.cards = self.cards[n:]
+        # A shuffled deck deals a random sample; drawing without order needs no permutation
+        dealt = random.sample(self.cards, n) if self.shuffled else self.cards[:n]
+        self.mask &= ~cards_mask(dealt)
         return dealt
 
     def remove(self, cards_to_remove: List[Card]):
         """Removes specific cards from the deck (e.g., user selected cards)."""
-        self.cards = [c for c in self.cards if c not in cards_to_remove]
+        self.mask &= ~cards_mask(cards_to_remove)
+
+    def __contains__(self, card: Card) -> bool:
+        return bool(self.mask & card.bit)
 
     def __len__(self):
-        return len(self.cards)
+        return bin(self.mask).count('1')
+
+
+def canonicalize(hero_hand: List[Card], board: List[Card]) -> Tuple[Tuple[Tuple[int, ...], Tuple[int, ...]], Tuple[int, ...]]:
+    """
+    Maps a (hero, board) state to a key shared by every suit-isomorphic state,
+    e.g. A♠K♠ on 2♥7♦Q♣ and A♥K♥ on 2♠7♦Q♣ get the same key.
+
+    Returns:
+        (key, suit_perm): key is (sorted hero card indices, sorted board card indices)
+        after relabelling suits, suit_perm[s] is the canonical suit of the user's suit s.
+    """
+    hero_idx = [c.index for c in hero_hand]
+    board_idx = [c.index for c in board]
+
+    best_key, best_perm = None, None
+    for perm in SUIT_PERMUTATIONS:
+        key = (
+            tuple(sorted((i & ~3) | perm[i & 3] for i in hero_idx)),
+            tuple(sorted((i & ~3) | perm[i & 3] for i in board_idx)),
+        )
+        if best_key is None or key < best_key:
+            best_key, best_perm = key, perm
+    return best_key, best_perm
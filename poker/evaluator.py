@@ -0,0 +1,263 @@
+"""
+Vectorized hand evaluation. The lookup tables are built from treys' once and
+stored next to this module in evaluator_tables.bin; every process maps that file
+read-only, so the pages are shared instead of each process (and each engine in it)
+rebuilding ~750 KB of tables. Rebuild with:
+
+    python -m poker.evaluator
+"""
+import argparse
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+from treys import Card as TreysCard
+from treys.lookup import LookupTable
+from .card import RANKS, SUITS
+from typing import List, Optional, Tuple
+
+TABLES_PATH = os.path.join(os.path.dirname(__file__), 'evaluator_tables.bin')
+TABLES_MAGIC = b'PKEV'
+TABLES_VERSION = 1
+# magic, version, reserved, unsuited entries, crc32 of the payload; 16 bytes keep the int64 keys aligned
+TABLES_HEADER = struct.Struct('<4sHHII')
+
+# Cards are plain integers 0-51: rank * 4 + suit, with ranks 2..A and suits in
+# SUITS order. This is exactly the order of treys.Deck.GetFullDeck().
+PRIMES = np.array(TreysCard.PRIMES, dtype=np.int64)
+
+# Upper score bound of every rank class, strongest class first (as in treys)
+RANK_CLASS_MAX = np.array([
+    LookupTable.MAX_ROYAL_FLUSH,
+    LookupTable.MAX_STRAIGHT_FLUSH,
+    LookupTable.MAX_FOUR_OF_A_KIND,
+    LookupTable.MAX_FULL_HOUSE,
+    LookupTable.MAX_FLUSH,
+    LookupTable.MAX_STRAIGHT,
+    LookupTable.MAX_THREE_OF_A_KIND,
+    LookupTable.MAX_TWO_PAIR,
+    LookupTable.MAX_PAIR,
+    LookupTable.MAX_HIGH_CARD,
+])
+
+_TREYS_SUIT_INDEX = {1: 0, 2: 1, 4: 2, 8: 3}
+
+# Number of set bits of every 13-bit rank mask
+POPCOUNT = np.array([bin(m).count('1') for m in range(1 << 13)], dtype=np.int8)
+
+
+def treys_to_index(card: int) -> int:
+    """Converts a treys card integer into a 0-51 card index."""
+    return TreysCard.get_rank_int(card) * 4 + _TREYS_SUIT_INDEX[TreysCard.get_suit_int(card)]
+
+
+def index_to_str(index: int) -> str:
+    """Display string of a card index (e.g. 'A♥'), same as str(Card)."""
+    return f"{RANKS[index >> 2]}{SUITS[index & 3]}"
+
+
+class HandState:
+    """
+    Partially evaluated hands that can be extended one card at a time: the rank
+    prime product and the per-suit rank bits of each of N rows. Adding a street's
+    card updates these in place of re-reading every card of every row.
+    """
+
+    def __init__(self, products: np.ndarray, suit_bits: np.ndarray):
+        self.products = products
+        self.suit_bits = suit_bits
+
+    @classmethod
+    def from_cards(cls, cards: np.ndarray) -> 'HandState':
+        cards = np.asarray(cards)
+        ranks = cards >> 2
+        suits = cards & 3
+        products = PRIMES[ranks].prod(axis=1)
+        suit_bits = np.stack([np.where(suits == s, 1 << ranks, 0).sum(axis=1) for s in range(4)], axis=1)
+        return cls(products, suit_bits)
+
+    def add(self, card: int) -> 'HandState':
+        """The same rows with one more (shared) card."""
+        suit_bits = self.suit_bits.copy()
+        suit_bits[:, card & 3] |= 1 << (card >> 2)
+        return HandState(self.products * PRIMES[card >> 2], suit_bits)
+
+    def __getitem__(self, rows) -> 'HandState':
+        return HandState(self.products[rows], self.suit_bits[rows])
+
+    def __len__(self):
+        return len(self.products)
+
+
+class BatchEvaluator:
+    """
+    Evaluates many 5, 6 or 7 card hands at once with NumPy lookup tables.
+
+    Scores are identical to treys.Evaluator.evaluate: 1 (royal flush) to 7462
+    (7-5-4-3-2 offsuit), lower is better.
+    """
+
+    def __init__(self):
+        # Read-only views of the process-wide tables
+        self.flush_table, self.unsuited_keys, self.unsuited_values = shared_tables()
+
+    @classmethod
+    def build_tables(cls) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(flush table, unsuited keys, unsuited values) computed from treys' lookup table."""
+        table = LookupTable()
+        return (cls._build_flush_table(table),) + cls._build_unsuited_table(table)
+
+    @staticmethod
+    def _build_flush_table(table: LookupTable) -> np.ndarray:
+        """Best flush score for every 13-bit rank mask with at least 5 bits set."""
+        flush_table = np.full(1 << 13, LookupTable.MAX_HIGH_CARD + 1, dtype=np.int16)
+        masks = sorted(range(1 << 13), key=lambda m: bin(m).count('1'))
+        for mask in masks:
+            bits = bin(mask).count('1')
+            if bits == 5:
+                flush_table[mask] = table.flush_lookup[TreysCard.prime_product_from_rankbits(mask)]
+            elif bits > 5:
+                # Best 5 of n: best over every (n - 1)-card subset
+                flush_table[mask] = min(flush_table[mask & ~(1 << r)] for r in range(13) if mask & (1 << r))
+        return flush_table
+
+    @staticmethod
+    def _build_unsuited_table(table: LookupTable):
+        """
+        Sorted prime products of every 5, 6 and 7 card rank multiset and the best
+        non-flush score each one makes.
+        """
+        primes = TreysCard.PRIMES
+        level = dict(table.unsuited_lookup)
+        scores = dict(level)
+        for _ in range(2):
+            # Grow every multiset by one card (at most four of a rank)
+            bigger = {}
+            for product, score in level.items():
+                for p in primes:
+                    if product % (p ** 4):
+                        key = product * p
+                        if score < bigger.get(key, LookupTable.MAX_HIGH_CARD + 1):
+                            bigger[key] = score
+            scores.update(bigger)
+            level = bigger
+        keys = np.array(sorted(scores), dtype=np.int64)
+        values = np.array([scores[k] for k in keys.tolist()], dtype=np.int16)
+        return keys, values
+
+    def evaluate(self, cards: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            cards: (N, k) integer array of card indices, 5 <= k <= 7.
+
+        Returns:
+            (N,) array of treys scores.
+        """
+        cards = np.asarray(cards)
+        ranks = cards >> 2
+        suits = cards & 3
+
+        products = PRIMES[ranks].prod(axis=1)
+        scores = self.unsuited_values[np.searchsorted(self.unsuited_keys, products)]
+
+        # With at most 7 cards a flush can't coexist with quads or a full house,
+        # so any 5-suited row simply takes its best flush.
+        suit_counts = np.stack([(suits == s).sum(axis=1) for s in range(4)], axis=1)
+        flush_rows = np.nonzero(suit_counts.max(axis=1) >= 5)[0]
+        if len(flush_rows):
+            flush_suit = suit_counts[flush_rows].argmax(axis=1)
+            in_suit = suits[flush_rows] == flush_suit[:, None]
+            rank_bits = np.where(in_suit, 1 << ranks[flush_rows], 0).sum(axis=1)
+            scores[flush_rows] = self.flush_table[rank_bits]
+        return scores
+
+    def score(self, state: HandState) -> np.ndarray:
+        """Scores of partially evaluated hands (5 to 7 cards per row)."""
+        scores = self.unsuited_values[np.searchsorted(self.unsuited_keys, state.products)]
+        suit_counts = POPCOUNT[state.suit_bits]
+        flush_rows = np.nonzero(suit_counts.max(axis=1) >= 5)[0]
+        if len(flush_rows):
+            flush_suit = suit_counts[flush_rows].argmax(axis=1)
+            scores[flush_rows] = self.flush_table[state.suit_bits[flush_rows, flush_suit]]
+        return scores
+
+    @staticmethod
+    def get_rank_class(scores: np.ndarray) -> np.ndarray:
+        """Vectorized treys Evaluator.get_rank_class (0 = royal flush ... 9 = high card)."""
+        return np.searchsorted(RANK_CLASS_MAX, scores)
+
+    @staticmethod
+    def class_to_string(class_int: int) -> str:
+        return LookupTable.RANK_CLASS_TO_STRING[class_int]
+
+    @staticmethod
+    def to_indices(treys_cards: List[int]) -> List[int]:
+        return [treys_to_index(c) for c in treys_cards]
+
+
+def save_tables(path: str = TABLES_PATH):
+    """Builds the tables and writes them as a versioned, checksummed file."""
+    flush_table, keys, values = BatchEvaluator.build_tables()
+    payload = keys.astype('<i8').tobytes() + values.astype('<i2').tobytes() + flush_table.astype('<i2').tobytes()
+    header = TABLES_HEADER.pack(TABLES_MAGIC, TABLES_VERSION, 0, len(keys), zlib.crc32(payload))
+    # Written aside and renamed: processes starting meanwhile never map a partial file
+    with open(path + '.tmp', 'wb') as f:
+        f.write(header + payload)
+    os.replace(path + '.tmp', path)
+
+
+def load_tables(path: str = TABLES_PATH) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Maps a tables file read-only, raising ValueError if it is foreign, outdated or corrupt."""
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(data) < TABLES_HEADER.size:
+        raise ValueError(f"{path}: truncated evaluator tables")
+    magic, version, _, entries, checksum = TABLES_HEADER.unpack_from(data)
+    if magic != TABLES_MAGIC:
+        raise ValueError(f"{path}: not an evaluator tables file")
+    if version != TABLES_VERSION:
+        raise ValueError(f"{path}: tables version {version}, expected {TABLES_VERSION}")
+    if len(data) != TABLES_HEADER.size + entries * 10 + (1 << 13) * 2:
+        raise ValueError(f"{path}: unexpected tables size")
+    if zlib.crc32(memoryview(data)[TABLES_HEADER.size:]) != checksum:
+        raise ValueError(f"{path}: checksum mismatch")
+    offset = TABLES_HEADER.size
+    keys = np.frombuffer(data, dtype='<i8', count=entries, offset=offset)
+    values = np.frombuffer(data, dtype='<i2', count=entries, offset=offset + entries * 8)
+    flush_table = np.frombuffer(data, dtype='<i2', count=1 << 13, offset=offset + entries * 10)
+    return flush_table, keys, values
+
+
+_tables: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+
+def shared_tables() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The tables every BatchEvaluator of this process uses: mapped from TABLES_PATH,
+    or built (and saved there, if possible) when the file is missing or outdated.
+    """
+    global _tables
+    if _tables is None:
+        try:
+            _tables = load_tables(TABLES_PATH)
+        except (OSError, ValueError):
+            try:
+                save_tables(TABLES_PATH)
+                _tables = load_tables(TABLES_PATH)
+            except OSError:
+                # Read-only install: keep them in this process only
+                _tables = BatchEvaluator.build_tables()
+    return _tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the evaluator lookup tables file.")
+    parser.add_argument('--out', default=TABLES_PATH)
+    args = parser.parse_args()
+    save_tables(args.out)
+    print(f"Saved {args.out} ({os.path.getsize(args.out)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
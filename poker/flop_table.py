@@ -0,0 +1,232 @@
+"""
+Precomputed heads-up flop equity of every starting hand on every suit-distinct
+flop (1,286,792 spots), memory-mapped at runtime.
+
+Built offline, in parallel and resumably:
+
+    python -m poker.flop_table --workers 32
+    python -m poker.flop_table --hands "top 20%" --samples 50000   # a partial, sampled table
+
+Finished chunks are kept next to the output in <out>.parts/, so an interrupted
+build continues where it stopped. Spots missing from a partial table fall back
+to simulation.
+
+The file is an open-addressing hash table of 8-byte slots (packed canonical
+spot, win and tie in 1/65535 units). It is mapped read-only, so every worker
+process shares the same page-cache copy and a lookup touches one or two slots.
+"""
+import argparse
+import itertools
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .card import SUIT_PERMUTATIONS, Card, canonicalize
+
+TABLE_PATH = os.getenv('FLOP_TABLE', os.path.join(os.path.dirname(__file__), 'flop_equity.bin'))
+
+MAGIC = b'PKFL'
+VERSION = 1
+# magic, version, log2 of the slot count, entries, samples per entry (0 = exact)
+HEADER = struct.Struct('<4sHHII')
+SLOT = np.dtype([('key', '<u4'), ('win', '<u2'), ('tie', '<u2')])
+
+# Spots computed per build task (and per checkpointed part file)
+CHUNK_SIZE = 256
+# Slots per entry at most; keeps probe sequences short
+MAX_LOAD = 0.7
+SCALE = 65535
+# Deals an exact heads-up flop enumeration covers: C(47, 2) runouts x C(45, 2) opponent hands
+EXACT_DEALS = 1081 * 990
+
+
+def pack_key(hero: Tuple[int, ...], flop: Tuple[int, ...]) -> int:
+    """Canonical (hero, flop) card indices as one integer; never 0, which marks an empty slot."""
+    h1, h2 = hero
+    f1, f2, f3 = flop
+    return ((h1 << 24) | (h2 << 18) | (f1 << 12) | (f2 << 6) | f3) + 1
+
+
+def _slot_hash(keys: np.ndarray, bits: int) -> np.ndarray:
+    # Fibonacci hashing: multiply, keep the top bits
+    return ((keys.astype(np.uint64) * np.uint64(0x9E3779B1)) & np.uint64(0xFFFFFFFF)) >> np.uint64(32 - bits)
+
+
+class FlopTable:
+    """Read-only view of a flop table file."""
+
+    def __init__(self, slots: np.ndarray, bits: int, entries: int, samples: int):
+        self.slots = slots
+        self.bits = bits
+        self.entries = entries
+        self.samples = samples
+        self._mask = (1 << bits) - 1
+
+    @classmethod
+    def load(cls, path: str = TABLE_PATH) -> 'FlopTable':
+        """Maps a table file, raising ValueError if it is foreign, outdated or truncated."""
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path}: truncated flop table")
+        magic, version, bits, entries, samples = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a flop table")
+        if version != VERSION:
+            raise ValueError(f"{path}: table version {version}, expected {VERSION}")
+        if os.path.getsize(path) != HEADER.size + (1 << bits) * SLOT.itemsize:
+            raise ValueError(f"{path}: unexpected table size")
+        slots = np.memmap(path, dtype=SLOT, mode='r', offset=HEADER.size, shape=(1 << bits,))
+        return cls(slots, bits, entries, samples)
+
+    def lookup(self, hero_hand: List[Card], board: List[Card]) -> Optional[Dict[str, float]]:
+        """Same dict as MonteCarloSimulation.run against one random hand, or None if not in the table."""
+        if len(hero_hand) != 2 or len(board) != 3:
+            return None
+        from .montecarlo import make_result
+        (hero, flop), _ = canonicalize(hero_hand, board)
+        key = pack_key(hero, flop)
+        slot = int(_slot_hash(np.array([key]), self.bits)[0])
+        while True:
+            entry = self.slots[slot]
+            stored = int(entry['key'])
+            if stored == key:
+                return make_result(int(entry['win']) / SCALE, int(entry['tie']) / SCALE,
+                                   self.samples or EXACT_DEALS, exact=self.samples == 0)
+            if stored == 0:
+                return None
+            slot = (slot + 1) & self._mask
+
+    def __len__(self):
+        return self.entries
+
+
+def load_default_table() -> Optional[FlopTable]:
+    """The table at FLOP_TABLE (or next to this module), or None if it is missing or unusable."""
+    try:
+        return FlopTable.load(TABLE_PATH)
+    except (OSError, ValueError):
+        return None
+
+
+def write_table(path: str, keys: np.ndarray, win: np.ndarray, tie: np.ndarray, samples: int):
+    """Writes (packed key, win fraction, tie fraction) entries as a table file."""
+    bits = max(4, int(np.ceil(np.log2(max(len(keys), 1) / MAX_LOAD))))
+    slots = np.zeros(1 << bits, dtype=SLOT)
+    mask = (1 << bits) - 1
+    for key, w, t, slot in zip(keys.tolist(), win.tolist(), tie.tolist(), _slot_hash(keys, bits).tolist()):
+        while slots['key'][slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = (key, round(w * SCALE), round(t * SCALE))
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, bits, len(keys), samples))
+        f.write(slots.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def canonical_flops(hero: List[Card]) -> np.ndarray:
+    """
+    One flop (as (N, 3) sorted card indices) for every suit-distinct flop of this
+    hero hand, found by relabelling suits of all flops at once.
+    """
+    hero_idx = np.array([c.index for c in hero])
+    deck = np.array([i for i in range(52) if i not in hero_idx])
+    flops = deck[np.array(list(itertools.combinations(range(len(deck)), 3)))]
+
+    best = None
+    for perm in SUIT_PERMUTATIONS:
+        perm = np.array(perm)
+        h = np.sort((hero_idx & ~3) | perm[hero_idx & 3])
+        f = np.sort((flops & ~3) | perm[flops & 3], axis=1)
+        keys = (h[0] << 24) | (h[1] << 18) | (f[:, 0] << 12) | (f[:, 1] << 6) | f[:, 2]
+        best = keys if best is None else np.minimum(best, keys)
+    _, first = np.unique(best, return_index=True)
+    return flops[np.sort(first)]
+
+
+def _hand_classes(hands: str) -> List[int]:
+    from .preflop import hand_class
+    from .ranges import parse_range
+    return sorted({hand_class([Card.from_index(a), Card.from_index(b)]) for a, b in parse_range(hands).combos.tolist()})
+
+
+def _compute_chunk(args) -> Tuple[str, int]:
+    index, chunk, samples, parts_dir = args
+    from .montecarlo import MonteCarloSimulation
+    from .preflop import representative_hand
+    global _simulation
+    if _simulation is None:
+        _simulation = MonteCarloSimulation()
+
+    hero = representative_hand(index)
+    flops = canonical_flops(hero)[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]
+    keys, win, tie = [], [], []
+    for flop in flops.tolist():
+        board = [Card.from_index(c) for c in flop]
+        if samples:
+            result = _simulation.run(hero, board, 1, samples, exact=False, seed=flop[0] * 52 * 52 + flop[1] * 52 + flop[2])
+        else:
+            result = _simulation.run(hero, board, 1, exact=True)
+        (h, f), _ = canonicalize(hero, board)
+        keys.append(pack_key(h, f))
+        win.append(result['win'] / 100)
+        tie.append(result['tie'] / 100)
+
+    part = os.path.join(parts_dir, f"{index:03d}-{chunk:03d}.npz")
+    # Saved aside and renamed: a part file that exists is complete
+    np.savez(part + '.tmp.npz', keys=np.array(keys, dtype=np.uint32), win=np.array(win), tie=np.array(tie))
+    os.replace(part + '.tmp.npz', part)
+    return part, len(keys)
+
+
+_simulation = None
+
+
+def build(out: str = TABLE_PATH, hands: str = 'random', samples: int = 0, workers: Optional[int] = None):
+    """
+    Computes every suit-distinct flop of the given starting hands (exactly, or with
+    `samples` deals each) and writes the table. Reruns skip finished parts.
+    """
+    from .preflop import representative_hand
+    parts_dir = out + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+
+    tasks = []
+    for index in _hand_classes(hands):
+        chunks = -(-len(canonical_flops(representative_hand(index))) // CHUNK_SIZE)
+        tasks += [(index, chunk, samples, parts_dir) for chunk in range(chunks)]
+    parts = [os.path.join(parts_dir, f"{index:03d}-{chunk:03d}.npz") for index, chunk, _, _ in tasks]
+    todo = [task for task, part in zip(tasks, parts) if not os.path.exists(part)]
+    print(f"{len(tasks)} chunks, {len(tasks) - len(todo)} already done")
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, _ in enumerate(pool.map(_compute_chunk, todo), 1):
+            if done % 10 == 0 or done == len(todo):
+                print(f"{done}/{len(todo)} chunks, {time.time() - start:.0f}s")
+
+    loaded = [np.load(part) for part in parts]
+    keys = np.concatenate([p['keys'] for p in loaded])
+    win = np.concatenate([p['win'] for p in loaded])
+    tie = np.concatenate([p['tie'] for p in loaded])
+    write_table(out, keys, win, tie, samples)
+    print(f"Saved {out}: {len(keys)} spots")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the flop equity table.")
+    parser.add_argument('--out', default=TABLE_PATH)
+    parser.add_argument('--hands', default='random', help="starting hands to cover, in range notation")
+    parser.add_argument('--samples', type=int, default=0, help="deals per spot (default: exact enumeration)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    build(args.out, args.hands, args.samples, args.workers)
+
+
+if __name__ == '__main__':
+    main()
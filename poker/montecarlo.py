@@ -1,102 +1,598 @@
-from treys import Deck as TreysDeck, Evaluator, Card as TreysCard
-from .card import Card, Deck
-from typing import List, Dict
+import numpy as np
+from .card import Card
+from .evaluator import BatchEvaluator
+from .flop_table import load_default_table as load_flop_table
+from .preflop import load_default_table
+from .ranges import HandRange, as_range
+from typing import List, Dict, Iterator, Optional, Tuple, Union
+from math import comb, factorial
+import itertools
+import time
+
+# Scoring a deal from an already computed score table is roughly this many times
+# cheaper than one hand evaluation; used to weigh enumeration cost against sampling.
+DEAL_COST_RATIO = 4
+
+# Rows evaluated per NumPy batch; keeps memory flat for large iteration counts
+# and is the granularity at which adaptive runs check their stopping rule.
+BATCH_SIZE = 4096
+
+# z-score of the reported equity confidence interval (95%)
+CI_Z = 1.96
+
+# Largest exact_cost an exact enumeration may take on (a 3-way flop is ~1.2e8);
+# beyond it, e.g. any preflop spot, it would need minutes and gigabytes
+MAX_EXACT_COST = 2 * 10 ** 8
+
+# Redraw rounds for deals whose range combos overlap before giving up
+MAX_REDRAWS = 100
+
+# Equity percentiles and histogram bins (over 0-100%) of equity_distribution
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+
+
+def make_result(win: float, tie: float, samples: int, exact: bool = False) -> Dict[str, float]:
+    """
+    Builds the result dict from win/tie fractions over `samples` deals.
+
+    Besides the percentages it carries 'stderr' (standard error of the equity),
+    'ci_low'/'ci_high' (95% interval) and 'samples'; exact results have zero error.
+    """
+    equity = win + tie / 2
+    stderr = 0.0
+    if not exact and samples > 0:
+        # Each deal scores 1 (win), 0.5 (tie) or 0 (loss)
+        variance = max(win + tie / 4 - equity ** 2, 0.0)
+        stderr = (variance / samples) ** 0.5 * 100
+    return {
+        'win': win * 100,
+        'tie': tie * 100,
+        'lose': (1 - win - tie) * 100,
+        'equity': equity * 100,
+        'stderr': stderr,
+        'ci_low': max(equity * 100 - CI_Z * stderr, 0.0),
+        'ci_high': min(equity * 100 + CI_Z * stderr, 100.0),
+        'samples': samples
+    }
+
+
+def equity_distribution(equities: np.ndarray) -> Dict:
+    """
+    Summary of the hero's equity (in %) over equally likely scenarios, e.g. every
+    possible next card: 'mean', 'std', 'percentiles' ({p: equity} for PERCENTILES),
+    'histogram' (% of scenarios in each of HISTOGRAM_BINS equal equity bins) and 'count'.
+    """
+    equities = np.asarray(equities, dtype=np.float64)
+    counts, _ = np.histogram(equities, bins=HISTOGRAM_BINS, range=(0, 100))
+    return {
+        'mean': float(equities.mean()),
+        'std': float(equities.std()),
+        'percentiles': dict(zip(PERCENTILES, np.percentile(equities, PERCENTILES).tolist())),
+        'histogram': (counts / len(equities) * 100).tolist(),
+        'count': len(equities),
+    }
+
+
+def _combinations(n: int, k: int) -> np.ndarray:
+    """All k-subsets of range(n) as a (C(n, k), k) array, in lexicographic order."""
+    flat = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(n), k)), dtype=np.int64)
+    return flat.reshape(comb(n, k), k)
+
+
+def _block_rng(entropy: int, block: int) -> np.random.Generator:
+    """Independent RNG stream of one sampling block, derived from the run's seed."""
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(block,)))
+
+
+# Simulations used by parallel sampling workers, one per engine class, built once per process
+_worker_simulations = {}
+
+
+def _sample_blocks(args) -> Tuple[int, int, int]:
+    """Worker entry point: samples a contiguous range of blocks and returns their counts."""
+    cls, args = args
+    if cls not in _worker_simulations:
+        _worker_simulations[cls] = cls()
+    return _worker_simulations[cls]._sample_range(*args)
+
+
+def _colex_rank(subsets: np.ndarray, binom: np.ndarray) -> np.ndarray:
+    """Colexicographic rank of each row of ascending-sorted subsets (a dense 0..C(n, k)-1 index)."""
+    k = subsets.shape[1]
+    return binom[subsets, np.arange(1, k + 1)].sum(axis=1)
+
 
 class MonteCarloSimulation:
     def __init__(self):
-        self.evaluator = Evaluator()
+        self.evaluator = BatchEvaluator()
+        # Preflop spots are served from the bundled table when it is present
+        self.preflop_table = load_default_table()
+        # Heads-up flop spots likewise from the flop table, if one was built (poker.flop_table)
+        self.flop_table = load_flop_table()
 
-    def run(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1, iterations: int = 10000) -> Dict[str, float]:
+    def run(self, hero_hand: Union[List[Card], HandRange], board: List[Card], num_opponents: int = 1,
+            iterations: int = 10000, exact: Optional[bool] = None, seed: Optional[int] = None, workers: int = 1,
+            target_stderr: Optional[float] = None, time_budget: Optional[float] = None,
+            opponent_ranges=None) -> Dict[str, float]:
         """
         Runs a Monte Carlo simulation to calculate equity.
-        
+
         Args:
-            hero_hand: List of 2 Card objects for the player.
+            hero_hand: List of 2 Card objects for the player, or a HandRange for
+                range-vs-range equity.
             board: List of 0, 3, 4, or 5 Card objects.
             num_opponents: Number of opponents (default 1).
             iterations: Number of simulations to run (default 10000).
-            
+            exact: True forces exact enumeration of every runout and opponent holding
+                (ValueError beyond MAX_EXACT_COST, e.g. preflop), False forces sampling. None (default) enumerates whenever that is
+                cheaper than drawing `iterations` samples (river, turn heads-up),
+                and answers preflop and heads-up flop spots from the precomputed
+                tables when they cover them.
+            seed: Makes sampling reproducible. The same seed gives bit-identical
+                results for any number of workers.
+            workers: Processes to split sampling across (worth it for large iteration
+                counts, e.g. 1M-sample offline runs; 1 samples in-process).
+            target_stderr: Stop sampling once the equity standard error (in percentage
+                points) drops to this value; `iterations` becomes the upper limit.
+            time_budget: Stop sampling after this many seconds (at least one batch
+                is always drawn). Adaptive runs sample in-process.
+            opponent_ranges: What the opponents hold instead of random hands: one range
+                for all of them, or a list with one per opponent (None entries are random).
+                Ranges are notation strings ("QQ+, AKs, top 10%") or HandRange objects,
+                see poker.ranges. Ranges are always sampled.
+
         Returns:
-            Dictionary with 'win', 'tie', 'lose', 'equity' percentages.
+            Dictionary with 'win', 'tie', 'lose', 'equity' percentages, plus 'stderr',
+            'ci_low'/'ci_high' (95% equity interval) and 'samples' used.
         """
         if not hero_hand:
-             return {'win': 0, 'tie': 0, 'lose': 0, 'equity': 0}
-
-        wins = 0
-        ties = 0
-        losses = 0
-
-        # Convert our Card objects to treys integers once
-        hero_treys = [TreysCard.new(c.to_treys_str()) for c in hero_hand]
-        board_treys_orig = [TreysCard.new(c.to_treys_str()) for c in board]
-
-        # Calculate removed cards for deck generation
-        removed_treys = hero_treys + board_treys_orig
-        
-        for _ in range(iterations):
-            # Create a fresh treys deck and remove known cards
-            deck = TreysDeck()
-            # The 'GetDeck' method in treys returns all cards, we need to manually remove known ones
-            # But the most efficient way with treys is usually to draw from the deck, 
-            # or just shuffle the remaining cards.
-            # Treys 'Deck' object has a 'cards' attribute.
-            
-            # Optimization: Creating a new Deck object every iteration is slow.
-            # Instead, we should shuffle a pre-calculated list of remaining cards.
-            # For simplicity in this v1, we'll rely on treys.Deck's shuffle mechanids 
-            # but getting a "clean" deck and removing cards is expensive.
-            # Let's interact with the deck directly.
-            
-            # Efficient simulation loop:
-            # 1. Get remaining cards from a master list
-            # 2. Shuffle them
-            # 3. Deal to opponents and board
-            
-            # Re-implementing simplified deck logic for speed
-            all_cards = TreysDeck.GetFullDeck()
-            remaining_cards = [c for c in all_cards if c not in removed_treys]
-            import random
-            random.shuffle(remaining_cards)
-            
-            deck_idx = 0
-            
-            # Deal opponent hands
-            opponents_hands = []
-            for _ in range(num_opponents):
-                opp_hand = remaining_cards[deck_idx:deck_idx+2]
-                deck_idx += 2
-                opponents_hands.append(opp_hand)
-            
-            # Deal remaining board
-            current_board = board_treys_orig[:]
-            cards_needed = 5 - len(current_board)
-            if cards_needed > 0:
-                current_board.extend(remaining_cards[deck_idx:deck_idx+cards_needed])
-            
-            # Evaluate
-            hero_score = self.evaluator.evaluate(current_board, hero_treys)
-            
-            outcome = 'win'
-            for opp_hand in opponents_hands:
-                opp_score = self.evaluator.evaluate(current_board, opp_hand)
-                if opp_score < hero_score:
-                    outcome = 'lose'
-                    break # Hero lost to at least one opponent
-                elif opp_score == hero_score:
-                    if outcome != 'lose':
-                        outcome = 'tie'
-            
-            if outcome == 'win':
-                wins += 1
-            elif outcome == 'tie':
-                ties += 1
-            else:
-                losses += 1
+             return {'win': 0, 'tie': 0, 'lose': 0, 'equity': 0, 'stderr': 0, 'ci_low': 0, 'ci_high': 0, 'samples': 0}
 
+        ranges = self._players(hero_hand, board, num_opponents, opponent_ranges, exact)
+        if ranges is not None:
+            # Everyone's cards come from their ranges; only the board is fixed
+            hero_idx, board_idx, exact = [], [c.index for c in board], False
+        else:
+            table_result, hero_idx, board_idx, exact = self._plan(hero_hand, board, num_opponents, iterations, exact)
+            if table_result is not None:
+                return table_result
+
+        if exact:
+            wins, ties, losses = self._enumerate(hero_idx, board_idx, num_opponents)
+        elif target_stderr is not None or time_budget is not None:
+            for wins, ties, losses in self._iter_sample(hero_idx, board_idx, num_opponents, iterations, seed,
+                                                        target_stderr, time_budget, ranges):
+                pass
+        else:
+            wins, ties, losses = self._sample(hero_idx, board_idx, num_opponents, iterations, seed, workers, ranges)
+
+        total = wins + ties + losses
+        return make_result(wins / total, ties / total, total, exact=exact)
+
+    def iter_run(self, hero_hand: Union[List[Card], HandRange], board: List[Card], num_opponents: int = 1,
+                 iterations: int = 10000, exact: Optional[bool] = None, seed: Optional[int] = None,
+                 target_stderr: Optional[float] = None, time_budget: Optional[float] = None,
+                 report_every: Optional[int] = None, report_interval: Optional[float] = 0.25,
+                 opponent_ranges=None) -> Iterator[Dict[str, float]]:
+        """
+        Like run(), but yields intermediate estimates while sampling, the first one
+        after a single batch. The last yielded result is final and equals what run()
+        would return for the same seed.
+
+        Args:
+            report_every: Yield after at least this many new samples.
+            report_interval: Yield at most once per this many seconds (default 0.25).
+            Other arguments are the same as run(). Exact and table results are
+            yielded once.
+        """
+        if not hero_hand:
+            yield self.run(hero_hand, board, num_opponents, iterations)
+            return
+
+        ranges = self._players(hero_hand, board, num_opponents, opponent_ranges, exact)
+        if ranges is not None:
+            hero_idx, board_idx = [], [c.index for c in board]
+        else:
+            table_result, hero_idx, board_idx, exact = self._plan(hero_hand, board, num_opponents, iterations, exact)
+            if table_result is not None:
+                yield table_result
+                return
+            if exact:
+                yield self.run(hero_hand, board, num_opponents, iterations, exact=True)
+                return
+
+        reported_at = reported_samples = None
+        latest = None
+        for wins, ties, losses in self._iter_sample(hero_idx, board_idx, num_opponents, iterations, seed,
+                                                    target_stderr, time_budget, ranges):
+            total = wins + ties + losses
+            latest = make_result(wins / total, ties / total, total)
+            now = time.perf_counter()
+            due = reported_at is None
+            if not due:
+                due = ((report_every is None or total - reported_samples >= report_every) and
+                       (report_interval is None or now - reported_at >= report_interval))
+            if due:
+                reported_at, reported_samples = now, total
+                yield latest
+        if reported_samples != latest['samples']:
+            yield latest
+
+    @staticmethod
+    def _players(hero_hand: Union[List[Card], HandRange], board: List[Card], num_opponents: int,
+                 opponent_ranges, exact: Optional[bool]) -> Optional[List[HandRange]]:
+        """
+        Ranges of the hero and each opponent, without combos that collide with the
+        board (or a known hero hand). None when every opponent is random and the hero
+        hand is known, which the faster dealing and exact paths handle.
+        """
+        if opponent_ranges is None and not isinstance(hero_hand, HandRange):
+            return None
+        if exact:
+            raise ValueError("Ranges can't be enumerated exactly; use exact=None or False")
+
+        if opponent_ranges is None or isinstance(opponent_ranges, (str, HandRange)):
+            opponent_ranges = [opponent_ranges] * num_opponents
+        elif len(opponent_ranges) != num_opponents:
+            raise ValueError(f"Got {len(opponent_ranges)} opponent ranges for {num_opponents} opponents")
+
+        dead = 0
+        for card in board:
+            dead |= card.bit
+        if isinstance(hero_hand, HandRange):
+            hero = hero_hand.without(dead)
+        else:
+            hero = HandRange.from_cards(hero_hand)
+            for card in hero_hand:
+                dead |= card.bit
+        return [hero] + [(as_range(r) or HandRange.random()).without(dead) for r in opponent_ranges]
+
+    def run_with_outs(self, hero_hand: List[Card], board: List[Card],
+                      num_opponents: int = 1) -> Tuple[Dict[str, float], Dict]:
+        """
+        Exact equity together with what every possible next card does for the hero,
+        from a single enumeration: the per-runout counts behind the equity are
+        regrouped by the card that comes next. Flop and turn only.
+
+        Returns:
+            (result, outs): result is the same as run(..., exact=True); outs has
+            'current' (hero's hand class now), 'next_cards' (a (Card, hand class,
+            equity %) tuple for every possible next card, best equity first), 'outs'
+            ({hand class: [Card]} for the next cards that improve the hero's class)
+            and 'by_river' ({hand class: % chance} of finishing with each improved
+            class once the board is complete; flop only, empty on the turn).
+            'distribution' is equity_distribution() over the next cards, with
+            'street' naming the street they deal ('turn' or 'river').
+        """
+        if len(board) not in (3, 4):
+            raise ValueError("Outs are computed on the flop and the turn")
+        hero_idx = [c.index for c in hero_hand]
+        board_idx = [c.index for c in board]
+
+        wins, ties, losses, runouts, final_scores, runout_wins, runout_ties, runout_deals = self._enumerate(
+            hero_idx, board_idx, num_opponents, per_runout=True)
         total = wins + ties + losses
-        return {
-            'win': (wins / total) * 100,
-            'tie': (ties / total) * 100,
-            'lose': (losses / total) * 100,
-            'equity': ((wins + (ties / 2)) / total) * 100
+        result = make_result(wins / total, ties / total, total, exact=True)
+
+        # Each runout counts towards every card in it: with the turn known, all rivers stay equally likely
+        card_wins, card_ties, card_deals = np.zeros(52), np.zeros(52), np.zeros(52)
+        for column in runouts.T:
+            np.add.at(card_wins, column, runout_wins)
+            np.add.at(card_ties, column, runout_ties)
+            np.add.at(card_deals, column, runout_deals)
+
+        next_cards = np.unique(runouts)
+        if len(board) == 4:
+            next_scores = final_scores  # the runouts are the single next cards
+        else:
+            next_scores = self._evaluate_with(hero_idx + board_idx, next_cards[:, None])
+        current = int(BatchEvaluator.get_rank_class(self._evaluate_with(hero_idx, np.array([board_idx])))[0])
+        next_classes = BatchEvaluator.get_rank_class(next_scores)
+        equities = (card_wins[next_cards] + card_ties[next_cards] / 2) / card_deals[next_cards] * 100
+
+        outs = {}
+        for card, rank_class in zip(next_cards.tolist(), next_classes.tolist()):
+            if rank_class < current:
+                outs.setdefault(rank_class, []).append(Card.from_index(card))
+        by_river = {}
+        if len(board) == 3:
+            final_classes = BatchEvaluator.get_rank_class(final_scores)
+            by_river = {c: float((final_classes == c).mean() * 100)
+                        for c in np.unique(final_classes).tolist() if c < current}
+
+        distribution = equity_distribution(equities)
+        distribution['street'] = 'turn' if len(board) == 3 else 'river'
+
+        order = np.argsort(-equities, kind='stable')
+        return result, {
+            'current': BatchEvaluator.class_to_string(current),
+            'next_cards': [(Card.from_index(int(next_cards[i])), BatchEvaluator.class_to_string(int(next_classes[i])),
+                            float(equities[i])) for i in order],
+            'outs': {BatchEvaluator.class_to_string(c): outs[c] for c in sorted(outs)},
+            'by_river': {BatchEvaluator.class_to_string(c): by_river[c] for c in sorted(by_river)},
+            'distribution': distribution,
         }
+
+    def equity_distribution(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1,
+                            runouts: bool = False) -> Dict:
+        """
+        How the hero's exact equity is spread over every possible next card, or with
+        runouts=True over every complete runout (on the flop, each turn and river).
+        Flop and turn only. A draw shows up as a wide, two-humped spread, a made hand
+        as a narrow one; the mean is the current equity.
+
+        Returns:
+            equity_distribution() of the scenarios' equities. The next-card one is the
+            same as run_with_outs' outs['distribution'].
+        """
+        if not runouts:
+            return self.run_with_outs(hero_hand, board, num_opponents)[1]['distribution']
+        if len(board) not in (3, 4):
+            raise ValueError("Equity distributions are computed on the flop and the turn")
+        *_, runout_wins, runout_ties, runout_deals = self._enumerate(
+            [c.index for c in hero_hand], [c.index for c in board], num_opponents, per_runout=True)
+        return equity_distribution((runout_wins + runout_ties / 2) / runout_deals * 100)
+
+    def _plan(self, hero_hand: List[Card], board: List[Card], num_opponents: int, iterations: int,
+              exact: Optional[bool]):
+        """
+        Decides how a spot is computed. Returns (table_result, hero_idx, board_idx, exact):
+        table_result is set when the preflop or flop table answers the spot.
+        """
+        if not board and exact is None and self.preflop_table is not None:
+            result = self.preflop_table.lookup(hero_hand, num_opponents)
+            if result is not None:
+                return result, None, None, False
+        if len(board) == 3 and num_opponents == 1 and exact is None and self.flop_table is not None:
+            result = self.flop_table.lookup(hero_hand, board)
+            if result is not None:
+                return result, None, None, False
+
+        # Convert our Card objects to card indices once
+        hero_idx = [c.index for c in hero_hand]
+        board_idx = [c.index for c in board]
+
+        if exact is None:
+            unknown = 52 - len(hero_idx) - len(board_idx)
+            cost = self.exact_cost(unknown, 5 - len(board_idx), num_opponents)
+            exact = cost <= iterations * (num_opponents + 1)
+        return None, hero_idx, board_idx, exact
+
+    @staticmethod
+    def exact_cost(unknown: int, cards_needed: int, num_opponents: int) -> int:
+        """
+        Estimates the work of an exact enumeration, in hand evaluations.
+
+        Every distinct board is scored once for the hero, and every distinct set of
+        (runout + hole cards) once for the opponents; each enumerated deal then only
+        costs a table lookup.
+        """
+        runouts = comb(unknown, cards_needed)
+        deals = runouts
+        for i in range(num_opponents):
+            deals *= comb(unknown - cards_needed - 2 * i, 2)
+        deals //= factorial(num_opponents)  # opponents are enumerated as unordered sets
+        evaluations = runouts + comb(unknown, cards_needed + 2)
+        return evaluations + deals // DEAL_COST_RATIO
+
+    @staticmethod
+    def _count(hero_scores: np.ndarray, best_opp_scores: np.ndarray) -> Tuple[int, int, int]:
+        """(wins, ties, losses) of the hero against the best opponent score of each deal."""
+        wins = int((hero_scores < best_opp_scores).sum())
+        ties = int((hero_scores == best_opp_scores).sum())
+        return wins, ties, len(hero_scores) - wins - ties
+
+    def _enumerate(self, hero: List[int], board: List[int], num_opponents: int, per_runout: bool = False):
+        """
+        Walks every runout and every unordered set of opponent holdings exactly once.
+        Returns (wins, ties, losses) counted over all deals. With per_runout, also
+        returns the runouts (card indices), the hero's score on each and the wins,
+        ties and deals of each runout: (wins, ties, losses, runouts, hero_scores, w, t, deals).
+        """
+        removed = set(hero + board)
+        remaining = np.array([c for c in range(52) if c not in removed], dtype=np.int64)
+        n = len(remaining)
+        cards_needed = 5 - len(board)
+        if self.exact_cost(n, cards_needed, num_opponents) > MAX_EXACT_COST:
+            raise ValueError("This spot is too large to enumerate exactly; sample it (exact=None or False)")
+        binom = np.array([[comb(i, j) for j in range(8)] for i in range(n + 1)], dtype=np.int64)
+
+        # An opponent's score only depends on the unknown cards in their 7-card hand,
+        # so score every (runout + hole cards) set once, indexed by its colex rank.
+        subsets = _combinations(n, cards_needed + 2)
+        opp_table = np.empty(len(subsets), dtype=np.int16)
+        opp_table[_colex_rank(subsets, binom)] = self._evaluate_with(board, remaining[subsets])
+
+        runouts = _combinations(n, cards_needed)
+        hero_scores = self._evaluate_with(hero + board, remaining[runouts])
+        runout_masks = (np.int64(1) << runouts).sum(axis=1)
+        pairs = _combinations(n, 2)
+        pair_masks = (np.int64(1) << pairs).sum(axis=1)
+
+        wins = ties = losses = 0
+        if per_runout:
+            runout_wins = np.zeros(len(runouts))
+            runout_ties = np.zeros(len(runouts))
+            runout_deals = np.zeros(len(runouts))
+        chunk = max(1, BATCH_SIZE // len(pairs))
+        for start in range(0, len(runouts), chunk):
+            stop = start + chunk
+            r_idx, p_idx = np.nonzero((runout_masks[start:stop, None] & pair_masks[None, :]) == 0)
+            r_idx += start
+            union = np.sort(np.hstack([runouts[r_idx], pairs[p_idx]]), axis=1)
+            hand_scores = opp_table[_colex_rank(union, binom)]
+
+            if num_opponents == 1:
+                w, t, l = self._count(hero_scores[r_idx], hand_scores)
+                if per_runout:
+                    size = len(runouts)
+                    runout_wins += np.bincount(r_idx, weights=hero_scores[r_idx] < hand_scores, minlength=size)
+                    runout_ties += np.bincount(r_idx, weights=hero_scores[r_idx] == hand_scores, minlength=size)
+                    runout_deals += np.bincount(r_idx, minlength=size)
+            else:
+                w = t = l = 0
+                bounds = np.searchsorted(r_idx, np.arange(start, min(stop, len(runouts)) + 1))
+                for r, lo, hi in zip(range(start, stop), bounds[:-1], bounds[1:]):
+                    best = self._multiway_best(pair_masks[p_idx[lo:hi]], hand_scores[lo:hi], num_opponents)
+                    dw, dt, dl = self._count(np.full(len(best), hero_scores[r]), best)
+                    w, t, l = w + dw, t + dt, l + dl
+                    if per_runout:
+                        runout_wins[r], runout_ties[r], runout_deals[r] = dw, dt, dw + dt + dl
+            wins, ties, losses = wins + w, ties + t, losses + l
+
+        if per_runout:
+            return (wins, ties, losses, remaining[runouts], hero_scores,
+                    runout_wins, runout_ties, runout_deals)
+        return wins, ties, losses
+
+    @staticmethod
+    def _multiway_best(masks: np.ndarray, scores: np.ndarray, num_opponents: int) -> np.ndarray:
+        """Best score of every unordered set of `num_opponents` disjoint hands."""
+        hands = np.arange(len(masks))
+        last, used, best = hands, masks, scores
+        for _ in range(num_opponents - 1):
+            parts = []
+            # Extend the partial sets in slices to bound the (sets x hands) matrix
+            step = max(1, BATCH_SIZE * 16 // len(hands))
+            for lo in range(0, len(last), step):
+                sl = slice(lo, lo + step)
+                ok = (hands[None, :] > last[sl, None]) & ((used[sl, None] & masks[None, :]) == 0)
+                s_idx, h_idx = np.nonzero(ok)
+                s_idx += lo
+                parts.append((h_idx, used[s_idx] | masks[h_idx], np.minimum(best[s_idx], scores[h_idx])))
+            last = np.concatenate([p[0] for p in parts])
+            used = np.concatenate([p[1] for p in parts])
+            best = np.concatenate([p[2] for p in parts])
+        return best
+
+    def _sample(self, hero: List[int], board: List[int], num_opponents: int, iterations: int,
+                seed: Optional[int] = None, workers: int = 1,
+                ranges: Optional[List[HandRange]] = None) -> Tuple[int, int, int]:
+        """
+        Draws `iterations` random deals. Returns (wins, ties, losses).
+
+        Deals are drawn in blocks of BATCH_SIZE, each from its own RNG stream keyed by
+        (seed, block number), so the counts only depend on the seed and never on how
+        blocks are spread over worker processes.
+        """
+        entropy = seed if seed is not None else np.random.SeedSequence().entropy
+        num_blocks = -(-iterations // BATCH_SIZE)
+        workers = max(1, min(workers, num_blocks))
+        if workers == 1:
+            return self._sample_range(hero, board, num_opponents, iterations, entropy, 0, num_blocks, ranges)
+
+        # Contiguous block ranges, one per worker
+        bounds = [num_blocks * i // workers for i in range(workers + 1)]
+        tasks = [(type(self), (hero, board, num_opponents, iterations, entropy, lo, hi, ranges))
+                 for lo, hi in zip(bounds[:-1], bounds[1:])]
+        # Imported here: only offline multi-worker runs need it, not every engine's start-up
+        from concurrent.futures import ProcessPoolExecutor
+        wins = ties = losses = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for w, t, l in pool.map(_sample_blocks, tasks):
+                wins, ties, losses = wins + w, ties + t, losses + l
+        return wins, ties, losses
+
+    def _iter_sample(self, hero: List[int], board: List[int], num_opponents: int, iterations: int,
+                     seed: Optional[int], target_stderr: Optional[float] = None,
+                     time_budget: Optional[float] = None,
+                     ranges: Optional[List[HandRange]] = None) -> Iterator[Tuple[int, int, int]]:
+        """
+        Samples block by block (same streams as _sample), yielding running (wins, ties, losses)
+        after each block, until the equity standard error reaches `target_stderr`,
+        `time_budget` seconds pass or `iterations` deals are drawn.
+        """
+        deadline = time.perf_counter() + time_budget if time_budget is not None else None
+        entropy = seed if seed is not None else np.random.SeedSequence().entropy
+        num_blocks = -(-iterations // BATCH_SIZE)
+
+        wins = ties = losses = 0
+        for block in range(num_blocks):
+            w, t, l = self._sample_range(hero, board, num_opponents, iterations, entropy, block, block + 1, ranges)
+            wins, ties, losses = wins + w, ties + t, losses + l
+            yield wins, ties, losses
+            total = wins + ties + losses
+            if target_stderr is not None and make_result(wins / total, ties / total, total)['stderr'] <= target_stderr:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+    def _sample_range(self, hero: List[int], board: List[int], num_opponents: int, iterations: int,
+                      entropy: int, first_block: int, last_block: int,
+                      ranges: Optional[List[HandRange]] = None) -> Tuple[int, int, int]:
+        """Counts for blocks [first_block, last_block) of a run of `iterations` deals."""
+        removed = set(hero + board)
+        remaining = np.array([c for c in range(52) if c not in removed], dtype=np.int64)
+
+        wins = ties = losses = 0
+        for block in range(first_block, last_block):
+            size = min(BATCH_SIZE, iterations - block * BATCH_SIZE)
+            rng = _block_rng(entropy, block)
+            if ranges is not None:
+                w, t, l = self._sample_ranges_batch(rng, board, ranges, size)
+            else:
+                w, t, l = self._sample_batch(rng, hero, board, remaining, num_opponents, size)
+            wins, ties, losses = wins + w, ties + t, losses + l
+        return wins, ties, losses
+
+    def _sample_batch(self, rng: np.random.Generator, hero: List[int], board: List[int], remaining: np.ndarray,
+                      num_opponents: int, size: int) -> Tuple[int, int, int]:
+        # Shuffle the remaining deck independently per row, then deal from the top:
+        # opponents' hole cards first, then the rest of the board.
+        cards_needed = 5 - len(board)
+        dealt = rng.permuted(np.tile(remaining, (size, 1)), axis=1)[:, :2 * num_opponents + cards_needed]
+        boards = np.hstack([np.tile(np.array(board, dtype=np.int64), (size, 1)), dealt[:, 2 * num_opponents:]])
+
+        hero_scores = self._evaluate_with(hero, boards)
+        best_opp = None
+        for i in range(num_opponents):
+            opp_scores = self.evaluator.evaluate(np.hstack([dealt[:, 2 * i:2 * i + 2], boards]))
+            best_opp = opp_scores if best_opp is None else np.minimum(best_opp, opp_scores)
+        return self._count(hero_scores, best_opp)
+
+    def _sample_ranges_batch(self, rng: np.random.Generator, board: List[int], ranges: List[HandRange],
+                             size: int) -> Tuple[int, int, int]:
+        """
+        Deals every player (hero first) a combo from their range, then the rest of the
+        board from the cards left in each deal. Deals where two players' combos overlap
+        are redrawn as a whole, so every valid deal stays weight-proportional.
+        """
+        hands = np.empty((size, len(ranges), 2), dtype=np.int64)
+        pending = np.arange(size)
+        for _ in range(MAX_REDRAWS):
+            used = np.zeros(len(pending), dtype=np.int64)
+            ok = np.ones(len(pending), dtype=bool)
+            for p, hand_range in enumerate(ranges):
+                picks = hand_range.sample(rng, len(pending))
+                masks = hand_range.masks[picks]
+                ok &= (used & masks) == 0
+                used |= masks
+                hands[pending, p] = hand_range.combos[picks]
+            pending = pending[~ok]
+            if not len(pending):
+                break
+        else:
+            raise ValueError("The ranges almost never leave a deal without shared cards")
+
+        # Random runout from each deal's remaining cards: the lowest random keys among live cards
+        cards_needed = 5 - len(board)
+        boards = np.tile(np.array(board, dtype=np.int64), (size, 1))
+        if cards_needed:
+            keys = rng.random((size, 52))
+            keys[:, board] = 2.0
+            np.put_along_axis(keys, hands.reshape(size, -1), 2.0, axis=1)
+            runouts = np.argpartition(keys, cards_needed - 1, axis=1)[:, :cards_needed]
+            boards = np.hstack([boards, runouts])
+
+        hero_scores = self.evaluator.evaluate(np.hstack([hands[:, 0], boards]))
+        best_opp = None
+        for p in range(1, len(ranges)):
+            opp_scores = self.evaluator.evaluate(np.hstack([hands[:, p], boards]))
+            best_opp = opp_scores if best_opp is None else np.minimum(best_opp, opp_scores)
+        return self._count(hero_scores, best_opp)
+
+    def _evaluate_with(self, fixed: List[int], rows: np.ndarray) -> np.ndarray:
+        """Evaluates `fixed` cards combined with every row of `rows`."""
+        fixed_block = np.tile(np.array(fixed, dtype=np.int64), (len(rows), 1))
+        return self.evaluator.evaluate(np.hstack([fixed_block, rows]))
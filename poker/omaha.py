@@ -0,0 +1,267 @@
+"""
+Pot Limit Omaha: 4 hole cards, of which a hand uses exactly 2, with exactly 3 of
+the board. Rather than scoring the 60 (6 hole pairs x 10 board triples) 5-card
+hands of a river one by one, each pair and each triple is reduced once to a rank
+code, a suit and rank bits, and every pair-triple combination is then a single
+lookup in a table indexed by the five ranks (or in the flush table when the pair
+and the triple share a suit). When every row has the same board (the analyzer,
+the river), the best score of each of the 169 rank pairs on it is found first,
+leaving 6 lookups per row.
+"""
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .analysis import HandAnalyzer, StrongerHands
+from .cache import LRUCache
+from .card import Card
+from .evaluator import PRIMES, shared_tables
+from .montecarlo import MonteCarloSimulation, _combinations
+
+HOLE_CARDS = 4
+
+# Positions of the 2 hole cards and 3 board cards a hand is made of
+HOLE_PAIRS = np.array(list(itertools.combinations(range(HOLE_CARDS), 2)))
+BOARD_TRIPLES = {k: np.array(list(itertools.combinations(range(k), 3))) for k in (3, 4, 5)}
+
+# Rows scored per step; bounds the (rows x 6 x 10) lookup arrays on the river
+CHUNK_ROWS = 8192
+
+# A PLO street holds ~150k holdings with their hole pairs (~7 MB), not ~1k like Hold'em
+OMAHA_STREET_CACHE_SIZE = 4
+
+
+class Subsets:
+    """
+    The hole pairs (or board triples) of N rows: the ranks as a base-13 code, the
+    suit when all the cards share one (else a negative value, different for pairs
+    and triples, so they never match) and the rank bits.
+    """
+
+    def __init__(self, codes: np.ndarray, suits: np.ndarray, bits: np.ndarray):
+        self.codes = codes
+        self.suits = suits
+        self.bits = bits
+
+    @classmethod
+    def pairs(cls, holes: np.ndarray) -> 'Subsets':
+        """The 6 two-card subsets of each row of (N, 4) hole cards."""
+        # Small dtypes: the analyzer holds these for ~150k holdings
+        cards = np.asarray(holes).astype(np.int16)[:, HOLE_PAIRS]
+        ranks, suits = cards >> 2, (cards & 3).astype(np.int8)
+        codes = (ranks[..., 0] * 13 + ranks[..., 1]).astype(np.int32)
+        same = suits[..., 0] == suits[..., 1]
+        return cls(codes, np.where(same, suits[..., 0], -1), (1 << ranks).sum(axis=-1, dtype=np.int16))
+
+    @classmethod
+    def triples(cls, boards: np.ndarray) -> 'Subsets':
+        """The three-card subsets of each row of (N, 3..5) boards (or of one (k,) board)."""
+        boards = np.atleast_2d(boards)
+        cards = boards.astype(np.int16)[:, BOARD_TRIPLES[boards.shape[1]]]
+        ranks, suits = cards >> 2, (cards & 3).astype(np.int8)
+        codes = ((ranks[..., 0] * 13 + ranks[..., 1]) * 13 + ranks[..., 2]).astype(np.int32)
+        same = (suits[..., 0] == suits[..., 1]) & (suits[..., 0] == suits[..., 2])
+        return cls(codes, np.where(same, suits[..., 0], -2), (1 << ranks).sum(axis=-1, dtype=np.int16))
+
+    def __getitem__(self, rows) -> 'Subsets':
+        return Subsets(self.codes[rows], self.suits[rows], self.bits[rows])
+
+    def __len__(self):
+        return len(self.codes)
+
+
+_rank_table: Optional[np.ndarray] = None
+# Positions of every 4-card holding in a deck of n cards, by n (~600 KB each)
+_holding_positions: Dict[int, np.ndarray] = {}
+
+
+def holdings(remaining: np.ndarray) -> np.ndarray:
+    """Every 4-card holding of the `remaining` cards, as an (N, 4) array."""
+    n = len(remaining)
+    if n not in _holding_positions:
+        _holding_positions[n] = _combinations(n, HOLE_CARDS).astype(np.int8)
+    return remaining[_holding_positions[n]]
+
+
+def rank_table() -> np.ndarray:
+    """
+    Non-flush score of every (hole rank, hole rank, board rank x 3) combination,
+    indexed by the 5 ranks as base-13 digits (13^5 entries, ~740 KB). Built from
+    the shared evaluator tables once per process.
+    """
+    global _rank_table
+    if _rank_table is None:
+        _, keys, values = shared_tables()
+        products = PRIMES[np.indices((13,) * 5).reshape(5, -1)].prod(axis=0)
+        # Five of a rank never happens; those entries just hold a neighbour's score
+        position = np.minimum(np.searchsorted(keys, products), len(keys) - 1)
+        _rank_table = np.ascontiguousarray(values[position])
+    return _rank_table
+
+
+class OmahaEvaluator:
+    """
+    Scores Omaha hands (best of exactly 2 hole and 3 board cards) in batches.
+    Scores are treys scores like BatchEvaluator's: lower is better.
+    """
+
+    def __init__(self):
+        self.flush_table = shared_tables()[0]
+        self.rank_table = rank_table()
+
+    def evaluate(self, holes: np.ndarray, boards: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            holes: (N, 4) card indices.
+            boards: (N, k) card indices, 3 <= k <= 5, or one (k,) board shared by every row.
+
+        Returns:
+            (N,) array of scores.
+        """
+        return self.score(Subsets.pairs(holes), Subsets.triples(boards))
+
+    def score(self, pairs: Subsets, triples: Subsets) -> np.ndarray:
+        """Best score of every row; either side may be a single row shared by all rows of the other."""
+        if len(triples) == 1:
+            return self._score_board(pairs, triples)
+        rows = max(len(pairs), len(triples))
+        scores = np.empty(rows, dtype=np.int16)
+        for lo in range(0, rows, CHUNK_ROWS):
+            sl = slice(lo, lo + CHUNK_ROWS)
+            scores[sl] = self._score_chunk(pairs if len(pairs) == 1 else pairs[sl], triples[sl])
+        return scores
+
+    def _score_chunk(self, pairs: Subsets, triples: Subsets) -> np.ndarray:
+        scores = self.rank_table[pairs.codes[:, :, None] * 13 ** 3 + triples.codes[:, None, :]]
+        flush = pairs.suits[:, :, None] == triples.suits[:, None, :]
+        if flush.any():
+            # Five cards of one suit are distinct ranks, so the flush table has their exact score
+            bits = pairs.bits[:, :, None] | triples.bits[:, None, :]
+            scores[flush] = self.flush_table[bits[flush]]
+        return scores.reshape(len(scores), -1).min(axis=1)
+
+    def _score_board(self, pairs: Subsets, triples: Subsets) -> np.ndarray:
+        """Every row on the same board: the best non-flush score of each rank pair on it is looked up once."""
+        pair_best = self.rank_table[np.arange(13 * 13)[:, None] * 13 ** 3 + triples.codes[0]].min(axis=1)
+        scores = pair_best[pairs.codes]
+        for suit in np.unique(triples.suits[0][triples.suits[0] >= 0]).tolist():
+            # Pairs of a suit the board has 3 of; the flush always beats the same ranks' non-flush score
+            rows, cols = np.nonzero(pairs.suits == suit)
+            if len(rows):
+                suited = triples.bits[0][triples.suits[0] == suit]
+                flush = self.flush_table[pairs.bits[rows, cols][:, None] | suited[None, :]].min(axis=1)
+                scores[rows, cols] = np.minimum(scores[rows, cols], flush)
+        return scores.min(axis=1)
+
+
+class OmahaSimulation(MonteCarloSimulation):
+    """
+    MonteCarloSimulation for PLO: hands are 4 cards and opponents are dealt 4.
+    River spots heads-up are enumerated exactly (every opponent holding), the rest
+    are sampled; opponent ranges (Hold'em notation), outs and equity distributions
+    aren't supported.
+    """
+
+    def __init__(self):
+        self.evaluator = OmahaEvaluator()
+        # The precomputed tables are Hold'em equities
+        self.preflop_table = None
+        self.flop_table = None
+
+    @staticmethod
+    def _players(hero_hand, board: List[Card], num_opponents: int, opponent_ranges, exact: Optional[bool]):
+        if opponent_ranges is not None or not isinstance(hero_hand, list):
+            raise ValueError("Ranges are Hold'em hands; PLO opponents are random")
+        return None
+
+    def _plan(self, hero_hand: List[Card], board: List[Card], num_opponents: int, iterations: int,
+              exact: Optional[bool]):
+        if len(hero_hand) != HOLE_CARDS:
+            raise ValueError(f"A PLO hand is {HOLE_CARDS} cards, got {len(hero_hand)}")
+        river_heads_up = len(board) == 5 and num_opponents == 1
+        if exact and not river_heads_up:
+            raise ValueError("PLO spots are only enumerated exactly on the river heads-up")
+        hero_idx = [c.index for c in hero_hand]
+        board_idx = [c.index for c in board]
+        # ~120k opponent holdings: cheaper than sampling to any useful precision
+        return None, hero_idx, board_idx, river_heads_up if exact is None else exact
+
+    def run_with_outs(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1):
+        raise ValueError("outs are not supported for Omaha")
+
+    def equity_distribution(self, hero_hand: List[Card], board: List[Card], num_opponents: int = 1,
+                            runouts: bool = False) -> Dict:
+        # Both modes need the per-card enumeration, which is Hold'em only
+        raise ValueError("Equity distributions are computed for Hold'em only")
+
+    def _enumerate(self, hero: List[int], board: List[int], num_opponents: int, per_runout: bool = False):
+        """Counts the river against every opponent holding (heads-up only, see _plan)."""
+        removed = set(hero + board)
+        remaining = np.array([c for c in range(52) if c not in removed], dtype=np.int64)
+        triples = Subsets.triples(np.array(board))
+        hero_score = self.evaluator.score(Subsets.pairs(np.array([hero])), triples)[0]
+        opp_scores = self.evaluator.score(Subsets.pairs(holdings(remaining)),
+                                          triples)
+        return self._count(np.full(len(opp_scores), hero_score), opp_scores)
+
+    def _sample_batch(self, rng: np.random.Generator, hero: List[int], board: List[int], remaining: np.ndarray,
+                      num_opponents: int, size: int) -> Tuple[int, int, int]:
+        # Same dealing as Hold'em with 4 hole cards; each board's triples are shared by all players
+        cards_needed = 5 - len(board)
+        dealt = rng.permuted(np.tile(remaining, (size, 1)), axis=1)[:, :HOLE_CARDS * num_opponents + cards_needed]
+        if cards_needed:
+            boards = np.hstack([np.tile(np.array(board, dtype=np.int64), (size, 1)),
+                                dealt[:, HOLE_CARDS * num_opponents:]])
+            triples = Subsets.triples(boards)
+        else:
+            triples = Subsets.triples(np.array(board))
+
+        hero_scores = self.evaluator.score(Subsets.pairs(np.array([hero])), triples)
+        hero_scores = np.broadcast_to(hero_scores, (size,))
+        best_opp = None
+        for i in range(num_opponents):
+            opp_scores = self.evaluator.score(Subsets.pairs(dealt[:, HOLE_CARDS * i:HOLE_CARDS * (i + 1)]), triples)
+            best_opp = opp_scores if best_opp is None else np.minimum(best_opp, opp_scores)
+        return self._count(hero_scores, best_opp)
+
+
+class OmahaAnalyzer(HandAnalyzer):
+    """HandAnalyzer for PLO: the opponent holdings (4 cards each) that beat the hero."""
+
+    hole_cards = HOLE_CARDS
+
+    def __init__(self):
+        super().__init__()
+        self.evaluator = OmahaEvaluator()
+        self._streets = LRUCache(OMAHA_STREET_CACHE_SIZE)
+
+    def analyze_indices(self, hero_idx: List[int], board_idx: List[int]) -> StrongerHands:
+        opp_hands, opp_pairs = self._street(tuple(hero_idx), tuple(board_idx))
+        triples = Subsets.triples(np.array(board_idx))
+        hero_score = self.evaluator.score(Subsets.pairs(np.array([hero_idx])), triples)[0]
+        opp_scores = self.evaluator.score(opp_pairs, triples)
+
+        stronger = opp_scores < hero_score
+        return StrongerHands(opp_hands[stronger], opp_scores[stronger])
+
+    def _street(self, hero: Tuple[int, ...], board: Tuple[int, ...]):
+        """Opponent holdings and their hole pairs; the next street drops the holdings with its card."""
+        key = (hero, board)
+        street = self._streets.get(key)
+        if street is not None:
+            return street
+
+        previous = self._streets.get((hero, board[:-1])) if len(board) > 3 else None
+        if previous is not None:
+            prev_hands, prev_pairs = previous
+            keep = (prev_hands != board[-1]).all(axis=1)
+            street = (prev_hands[keep], prev_pairs[keep])
+        else:
+            removed = set(hero) | set(board)
+            remaining = np.array([c for c in range(52) if c not in removed], dtype=np.int8)
+            opp_hands = holdings(remaining)
+            street = (opp_hands, Subsets.pairs(opp_hands))
+
+        self._streets.put(key, street)
+        return street
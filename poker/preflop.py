@@ -0,0 +1,149 @@
+"""
+Precomputed preflop equity of every canonical starting hand against 1-9 random opponents.
+
+The table lives next to this module in preflop_equity.bin and is rebuilt with:
+
+    python -m poker.preflop --samples 200000
+"""
+import argparse
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .card import Card, RANKS, SUITS
+
+TABLE_PATH = os.path.join(os.path.dirname(__file__), 'preflop_equity.bin')
+
+MAGIC = b'PKPF'
+VERSION = 1
+NUM_HANDS = 169
+MAX_OPPONENTS = 9
+# magic, version, hands, max opponents, samples per entry, crc32 of the payload
+HEADER = struct.Struct('<4sHHHII')
+
+
+def hand_class(hero_hand: List[Card]) -> int:
+    """
+    Index 0-168 of the canonical starting hand on a 13x13 grid:
+    pairs on the diagonal, suited hands at (high, low), offsuit at (low, high).
+    """
+    r1, r2 = (c.index >> 2 for c in hero_hand)
+    high, low = max(r1, r2), min(r1, r2)
+    if hero_hand[0].suit == hero_hand[1].suit:
+        return high * 13 + low
+    return low * 13 + high
+
+
+def hand_class_name(index: int) -> str:
+    """Standard notation of a hand class, e.g. 'AKs', 'T9o', '77'."""
+    row, col = divmod(index, 13)
+    if row == col:
+        return RANKS[row] * 2
+    if row > col:
+        return f"{RANKS[row]}{RANKS[col]}s"
+    return f"{RANKS[col]}{RANKS[row]}o"
+
+
+def representative_hand(index: int) -> List[Card]:
+    """Concrete two cards of a hand class (spades first, hearts for offsuit/pairs)."""
+    row, col = divmod(index, 13)
+    if row > col:
+        return [Card(RANKS[row], SUITS[0]), Card(RANKS[col], SUITS[0])]
+    return [Card(RANKS[max(row, col)], SUITS[0]), Card(RANKS[min(row, col)], SUITS[1])]
+
+
+class PreflopTable:
+    """Win/tie percentages indexed by [hand class, opponents - 1]."""
+
+    def __init__(self, win: np.ndarray, tie: np.ndarray, samples: int):
+        self.win = np.asarray(win, dtype=np.float32)
+        self.tie = np.asarray(tie, dtype=np.float32)
+        self.samples = samples
+
+    def lookup(self, hero_hand: List[Card], num_opponents: int) -> Optional[Dict[str, float]]:
+        """Returns the same dict as MonteCarloSimulation.run, or None if not covered."""
+        from .montecarlo import make_result
+        if len(hero_hand) != 2 or not 1 <= num_opponents <= MAX_OPPONENTS:
+            return None
+        idx = hand_class(hero_hand)
+        win = float(self.win[idx, num_opponents - 1])
+        tie = float(self.tie[idx, num_opponents - 1])
+        return make_result(win / 100, tie / 100, self.samples)
+
+    def save(self, path: str = TABLE_PATH):
+        payload = np.stack([self.win, self.tie], axis=-1).astype('<f4').tobytes()
+        header = HEADER.pack(MAGIC, VERSION, NUM_HANDS, MAX_OPPONENTS, self.samples, zlib.crc32(payload))
+        with open(path, 'wb') as f:
+            f.write(header + payload)
+
+    @classmethod
+    def load(cls, path: str = TABLE_PATH) -> 'PreflopTable':
+        """Reads a table file, raising ValueError if it is foreign, outdated or corrupt."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path}: truncated preflop table")
+        magic, version, hands, opponents, samples, checksum = HEADER.unpack_from(data)
+        payload = data[HEADER.size:]
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a preflop table")
+        if version != VERSION:
+            raise ValueError(f"{path}: table version {version}, expected {VERSION}")
+        if (hands, opponents) != (NUM_HANDS, MAX_OPPONENTS) or len(payload) != hands * opponents * 2 * 4:
+            raise ValueError(f"{path}: unexpected table shape")
+        if zlib.crc32(payload) != checksum:
+            raise ValueError(f"{path}: checksum mismatch")
+        values = np.frombuffer(payload, dtype='<f4').reshape(hands, opponents, 2)
+        return cls(values[..., 0], values[..., 1], samples)
+
+
+def load_default_table() -> Optional[PreflopTable]:
+    """The bundled table, or None if it is missing or unusable (callers fall back to simulating)."""
+    try:
+        return PreflopTable.load(TABLE_PATH)
+    except (OSError, ValueError):
+        return None
+
+
+def _compute_entry(args):
+    index, num_opponents, samples = args
+    from .montecarlo import MonteCarloSimulation
+    result = MonteCarloSimulation().run(representative_hand(index), [], num_opponents, samples, exact=False)
+    return index, num_opponents, result['win'], result['tie']
+
+
+def build(samples: int, workers: Optional[int] = None) -> PreflopTable:
+    """Simulates every (hand class, opponents) entry with `samples` deals each."""
+    win = np.zeros((NUM_HANDS, MAX_OPPONENTS), dtype=np.float32)
+    tie = np.zeros((NUM_HANDS, MAX_OPPONENTS), dtype=np.float32)
+    tasks = [(i, n, samples) for i in range(NUM_HANDS) for n in range(1, MAX_OPPONENTS + 1)]
+
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (i, n, w, t) in enumerate(pool.map(_compute_entry, tasks, chunksize=4), 1):
+            win[i, n - 1] = w
+            tie[i, n - 1] = t
+            if done % 100 == 0:
+                print(f"{done}/{len(tasks)} entries, {time.time() - start:.0f}s")
+    return PreflopTable(win, tie, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the preflop equity table.")
+    parser.add_argument('--samples', type=int, default=200000, help="deals per hand and opponent count")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--out', default=TABLE_PATH)
+    args = parser.parse_args()
+
+    table = build(args.samples, args.workers)
+    table.save(args.out)
+    print(f"Saved {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Opponent hand ranges in standard notation, e.g. "QQ+, AKs, ATo+, A5s-A2s, KhQh"
+or "top 15%", as weighted arrays of two-card combos.
+
+Tokens are comma separated, rank letters in either case, and may carry a weight: "AKo:0.5" deals AKo half as
+often as the other hands of the range. A later token overrides an earlier one
+for the combos they share.
+"""
+import hashlib
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .cache import LRUCache
+from .card import RANKS, SUITS, TREYS_SUITS, Card
+
+# Parsed ranges, keyed by their text; repeated queries don't parse again
+RANGE_CACHE_SIZE = 256
+_parsed = LRUCache(RANGE_CACHE_SIZE)
+
+NUM_COMBOS = 1326
+
+_SUIT_LETTERS = {letter: SUITS.index(suit) for suit, letter in TREYS_SUITS.items()}
+_SUIT_LETTERS.update({suit: i for i, suit in enumerate(SUITS)})
+
+_CLASS_RE = re.compile(r'^([2-9TJQKA])([2-9TJQKA])([so]?)(\+?)$')
+_SPAN_RE = re.compile(r'^([2-9TJQKA])([2-9TJQKA])([so]?)-([2-9TJQKA])([2-9TJQKA])([so]?)$')
+_COMBO_RE = re.compile(r'^([2-9TJQKA])([shdc♠♥♦♣])([2-9TJQKA])([shdc♠♥♦♣])$')
+_PERCENT_RE = re.compile(r'^(?:top\s*)?(\d+(?:\.\d+)?)\s*%$')
+# Lower-case rank letters; none of them is also a suit or a suited/offsuit letter
+_LOWER_RANK_RE = re.compile(r'[tjqka]')
+
+
+class HandRange:
+    """
+    Two-card combos with weights. Holds (M, 2) card index pairs, their deck
+    bitmasks and the cumulative weight used to draw from them.
+    """
+
+    def __init__(self, combos: np.ndarray, weights: np.ndarray, text: str):
+        self.combos = np.sort(np.asarray(combos, dtype=np.int64).reshape(-1, 2), axis=1)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.masks = (np.int64(1) << self.combos).sum(axis=1)
+        self.cdf = np.cumsum(self.weights)
+        self.text = text
+        self._identity = None
+
+    @classmethod
+    def from_cards(cls, cards: List[Card]) -> 'HandRange':
+        """A range holding exactly this hand."""
+        return cls(np.array([[c.index for c in cards]]), np.ones(1), ''.join(c.to_treys_str() for c in cards))
+
+    @classmethod
+    def random(cls) -> 'HandRange':
+        """Every combo with equal weight: a random opponent."""
+        return parse_range('random')
+
+    def without(self, dead_mask: int) -> 'HandRange':
+        """The combos that don't use any of the dead cards (e.g. the board)."""
+        keep = (self.masks & np.int64(dead_mask)) == 0
+        if keep.all():
+            return self
+        if not keep.any():
+            raise ValueError(f"Range '{self.text}' has no combos left with these cards dealt")
+        return HandRange(self.combos[keep], self.weights[keep], self.text)
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Indices of `size` combos drawn proportionally to their weights."""
+        return np.searchsorted(self.cdf, rng.random(size) * self.cdf[-1], side='right')
+
+    def __len__(self):
+        return len(self.combos)
+
+    def identity(self) -> Tuple[bytes, bytes]:
+        """
+        The combos in deck order and their weights relative to the largest: the same
+        for every way of writing a range ("QQ+" and "AA, KK, QQ"; "AKs:2" and "AKs").
+        """
+        if self._identity is None:
+            order = np.lexsort((self.combos[:, 1], self.combos[:, 0]))
+            weights = self.weights[order]
+            self._identity = (self.combos[order].astype(np.int8).tobytes(), (weights / weights.max()).tobytes())
+        return self._identity
+
+    @property
+    def key(self) -> str:
+        """Short stable digest of identity(), for cache keys (e.g. poker.store's)."""
+        return hashlib.blake2b(b''.join(self.identity()), digest_size=16).hexdigest()
+
+    def __eq__(self, other):
+        return isinstance(other, HandRange) and self.identity() == other.identity()
+
+    def __hash__(self):
+        return hash(self.identity())
+
+    def __repr__(self):
+        return f"HandRange('{self.text}', {len(self)} combos)"
+
+
+def parse_range(text: str) -> HandRange:
+    """
+    Parses range notation into a HandRange; the result is cached by text.
+    Raises ValueError for tokens it doesn't understand.
+    """
+    key = ' '.join(text.split())
+    parsed = _parsed.get(key)
+    if parsed is None:
+        parsed = _parse(key)
+        _parsed.put(key, parsed)
+    return parsed
+
+
+def as_range(value) -> Optional[HandRange]:
+    """A HandRange from range notation, a HandRange, or None (a random opponent)."""
+    if value is None or isinstance(value, HandRange):
+        return value
+    return parse_range(value)
+
+
+def _parse(text: str) -> HandRange:
+    weights = {}
+    for token in text.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        weight = 1.0
+        if ':' in token:
+            token, _, w = token.rpartition(':')
+            try:
+                weight = float(w)
+            except ValueError:
+                raise ValueError(f"Invalid weight in range token: {token}:{w}")
+            token = token.strip()
+        for combo in _token_combos(token):
+            weights[combo] = weight
+
+    combos = [c for c, w in weights.items() if w > 0]
+    if not combos:
+        raise ValueError(f"Empty range: '{text}'")
+    return HandRange(np.array(combos), np.array([weights[c] for c in combos]), text)
+
+
+def _token_combos(token: str) -> List[tuple]:
+    if token.lower() in ('random', 'any', '100%'):
+        return _all_combos()
+
+    match = _PERCENT_RE.match(token.lower())
+    if match:
+        return _top_percent(float(match.group(1)))
+
+    # "qq+" and "kqs" are QQ+ and KQs
+    token = _LOWER_RANK_RE.sub(lambda m: m.group().upper(), token)
+
+    match = _COMBO_RE.match(token)
+    if match:
+        r1, s1, r2, s2 = match.groups()
+        c1 = RANKS.index(r1) * 4 + _SUIT_LETTERS[s1]
+        c2 = RANKS.index(r2) * 4 + _SUIT_LETTERS[s2]
+        if c1 == c2:
+            raise ValueError(f"Invalid range token: {token}")
+        return [tuple(sorted((c1, c2)))]
+
+    match = _CLASS_RE.match(token)
+    if match:
+        high, low, kind, plus = match.groups()
+        high, low = RANKS.index(high), RANKS.index(low)
+        if high == low:
+            if kind:
+                raise ValueError(f"Invalid range token: {token}")
+            # QQ+ is every pair from QQ up
+            pairs = range(high, 13) if plus else [high]
+            return [c for r in pairs for c in _class_combos(r, r, '')]
+        high, low = max(high, low), min(high, low)
+        # ATo+ raises the kicker up to AKo
+        kickers = range(low, high) if plus else [low]
+        return [c for k in kickers for c in _class_combos(high, k, kind)]
+
+    match = _SPAN_RE.match(token)
+    if match:
+        h1, l1, k1, h2, l2, k2 = match.groups()
+        h1, l1, h2, l2 = (RANKS.index(r) for r in (h1, l1, h2, l2))
+        if k1 != k2:
+            raise ValueError(f"Invalid range token: {token}")
+        if h1 == l1 and h2 == l2:
+            # 99-66
+            return [c for r in range(min(h1, h2), max(h1, h2) + 1) for c in _class_combos(r, r, '')]
+        if h1 == h2 and l1 != h1 and l2 != h2:
+            # A5s-A2s: same top card, a span of kickers
+            return [c for k in range(min(l1, l2), max(l1, l2) + 1) for c in _class_combos(h1, k, k1)]
+
+    raise ValueError(f"Invalid range token: {token}")
+
+
+def _class_combos(high: int, low: int, kind: str) -> List[tuple]:
+    """Combos of a hand class: pair, suited ('s'), offsuit ('o') or both ('')."""
+    combos = []
+    for s1 in range(4):
+        for s2 in range(4):
+            if high == low and s2 <= s1:
+                continue
+            if high != low and ((kind == 's' and s1 != s2) or (kind == 'o' and s1 == s2)):
+                continue
+            combos.append(tuple(sorted((high * 4 + s1, low * 4 + s2))))
+    return combos
+
+
+def _all_combos() -> List[tuple]:
+    return [(a, b) for a in range(52) for b in range(a + 1, 52)]
+
+
+def _top_percent(percent: float) -> List[tuple]:
+    """The strongest hand classes (by heads-up preflop equity) covering `percent` of all combos."""
+    from .preflop import NUM_HANDS, load_default_table
+    table = load_default_table()
+    if table is None:
+        raise ValueError("Top-X% ranges need the preflop equity table")
+
+    equity = table.win[:, 0] + table.tie[:, 0] / 2
+    combos = []
+    for index in np.argsort(-equity, kind='stable')[:NUM_HANDS].tolist():
+        if len(combos) >= NUM_COMBOS * percent / 100:
+            break
+        row, col = divmod(index, 13)
+        if row == col:
+            combos += _class_combos(row, row, '')
+        elif row > col:
+            combos += _class_combos(row, col, 's')
+        else:
+            combos += _class_combos(col, row, 'o')
+    return combos
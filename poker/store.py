@@ -0,0 +1,130 @@
+"""
+Persistent equity cache in SQLite (WAL mode), shared by every process that opens
+the same file and kept across restarts.
+
+CachedSimulation and CachedAnalyzer consult it behind their in-memory LRU, with
+the same suit-canonical keys, so a spot computed once by any bot process is
+served from disk afterwards.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+# Bump when results for the same key change (engine fixes); older entries are dropped
+STORE_VERSION = 2
+
+# Hits refresh an entry's last-use time in batches, not with a write per lookup
+TOUCH_BATCH = 64
+# Puts between checks of the entry count
+EVICT_CHECK_EVERY = 256
+
+
+class DiskCache:
+    """
+    Key/value store of pickled results, evicting the least recently used entries
+    beyond max_entries. Safe to use from several processes at once; each process
+    (and thread) gets its own connection.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._touched = []
+        self._puts = 0
+        self._setup()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Connections must not cross a fork; open a fresh one per process and thread
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        conn.execute('CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, value BLOB, used REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+        row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is None or row[0] != STORE_VERSION:
+            with conn:
+                conn.execute('DELETE FROM entries')
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (STORE_VERSION,))
+
+    @staticmethod
+    def _encode_key(key: Hashable) -> bytes:
+        # Keys are tuples of ints, strings, floats and None, whose repr is stable
+        return repr(key).encode()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        encoded = self._encode_key(key)
+        row = self._connect().execute('SELECT value FROM entries WHERE key = ?', (encoded,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._touched.append(encoded)
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touched()
+        return pickle.loads(row[0])
+
+    def put(self, key: Hashable, value: Any):
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                     (self._encode_key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time()))
+        self._puts += 1
+        if self._puts % EVICT_CHECK_EVERY == 0:
+            self.evict()
+
+    def _flush_touched(self):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.executemany('UPDATE entries SET used = ? WHERE key = ?', [(now, k) for k in self._touched])
+        self._touched = []
+
+    def evict(self):
+        """Drops the least recently used entries down to 90% of max_entries once over the limit."""
+        conn = self._connect()
+        count = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        if count > self.max_entries:
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)',
+                         (excess,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM entries')
+        self._touched = []
+
+    def stats(self):
+        count = self._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'size': count, 'maxsize': self.max_entries}
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        if self._touched:
+            self._flush_touched()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def store_from_env() -> Optional[DiskCache]:
+    """The cache at EQUITY_DB (max entries from EQUITY_DB_MAX_ENTRIES), or None if not configured."""
+    path = os.getenv('EQUITY_DB')
+    if not path:
+        return None
+    return DiskCache(path, max_entries=int(os.getenv('EQUITY_DB_MAX_ENTRIES', 1000000)))
@@ -0,0 +1,69 @@
+from poker.batch import run_batch, _save_checkpoint
+from poker.card import CARDS
+import io
+import json
+import random
+
+
+def _write_input(path, count):
+    rng = random.Random(0)
+    with open(path, 'w') as f:
+        for i in range(count):
+            cards = [c.to_treys_str() for c in rng.sample(CARDS, 7)]
+            board = ''.join(cards[2:2 + rng.choice([0, 3, 4, 5])])
+            record = {'hero': ''.join(cards[:2]), 'board': board, 'opponents': rng.choice([1, 2])}
+            if i % 10 == 0:
+                record['range'] = 'QQ+, AK'
+            f.write(json.dumps(record) + '\n')
+        f.write(json.dumps({'hero': 'AsAs', 'board': ''}) + '\n')
+
+
+def test_batch_results_and_resume(tmp_path):
+    source = tmp_path / 'hands.jsonl'
+    _write_input(source, 60)
+    options = dict(workers=2, chunk_size=8, iterations=2000, seed=7, log=io.StringIO())
+
+    full = tmp_path / 'full.jsonl'
+    assert run_batch(str(source), str(full), **options) == 61
+    results = [json.loads(line) for line in full.read_text().splitlines()]
+    assert [r['line'] for r in results] == list(range(1, 62))
+    assert all(0 <= r['equity'] <= 100 for r in results[:-1])
+    assert 'error' in results[-1]
+    assert all('stronger' in r for r in results[:-1] if len(r['board']) >= 6)
+
+    # An interrupted run: 20 records checkpointed, then a partial line written after it
+    resumed = tmp_path / 'resumed.jsonl'
+    lines = full.read_text().splitlines(keepends=True)
+    resumed.write_text(''.join(lines[:20]) + lines[20][:15])
+    checkpoint = tmp_path / 'run.ckpt'
+    _save_checkpoint(str(checkpoint), 20, len(''.join(lines[:20]).encode()))
+
+    assert run_batch(str(source), str(resumed), checkpoint=str(checkpoint), **options) == 41
+    assert resumed.read_text() == full.read_text()
+    assert json.loads(checkpoint.read_text())['records'] == 61
+
+
+def test_batch_csv(tmp_path):
+    source = tmp_path / 'hands.csv'
+    source.write_text("hero,board,opponents,range\nAsKs,2h7dQc,1,\nA♥A♦,,2,\n")
+    output = tmp_path / 'out.csv'
+    assert run_batch(str(source), str(output), workers=1, iterations=2000, log=io.StringIO()) == 2
+    rows = output.read_text().splitlines()
+    assert rows[0].startswith('line,hero,board') and len(rows) == 3
+
+
+def test_bad_records_get_an_error_instead_of_stopping_the_run(tmp_path):
+    source = tmp_path / 'hands.jsonl'
+    source.write_text('{"hero": "AsKs", "board": "2h7dQc"}\n'
+                      '{"hero": "AsKs", "board": \n'
+                      '{"hero": "AsKs", "opponents": "x"}\n'
+                      '[1, 2]\n'
+                      '{"hero": 5}\n'
+                      '{"hero": "QhQd", "opponents": "2"}\n')
+    output = tmp_path / 'out.jsonl'
+    assert run_batch(str(source), str(output), workers=1, iterations=2000, log=io.StringIO()) == 6
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r['line'] for r in results] == list(range(1, 7))
+    assert ['error' in r for r in results] == [False, True, True, True, True, False]
+    assert 'invalid JSON' in results[1]['error']
+    assert results[5]['opponents'] == 2
@@ -0,0 +1,34 @@
+from benchmark import compare, measure, main
+import json
+
+
+def test_measure_reports_throughput_latency_and_memory():
+    result = measure(lambda i: len(bytearray(10000)), 5, 'bytes', min_time=0.01)
+    # Fast calls are repeated until each round lasts min_time
+    assert result['unit'] == 'bytes' and result['calls'] > 5
+    assert result['throughput'] > 0
+    assert 0 <= result['p50_ms'] <= result['p99_ms']
+    assert result['peak_kb'] >= 9
+
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    baseline = {'a': {'throughput': 1000.0}, 'b': {'throughput': 1000.0}, 'gone': {'throughput': 1.0}}
+    results = {
+        'a': {'throughput': 850.0, 'unit': 'hands'},   # -15%
+        'b': {'throughput': 700.0, 'unit': 'hands'},   # -30%
+        'new': {'throughput': 1.0, 'unit': 'hands'},
+    }
+    regressions = compare(results, baseline, threshold=20)
+    assert len(regressions) == 1 and regressions[0].startswith('b:')
+    assert compare(results, baseline, threshold=40) == []
+
+
+def test_main_fails_against_a_faster_baseline(tmp_path):
+    baseline = tmp_path / 'baseline.json'
+    assert main(['--only', 'cards/', '--quick', '--baseline', str(baseline), '--save-baseline']) == 0
+    assert main(['--only', 'cards/', '--quick', '--baseline', str(baseline), '--threshold', '90']) == 0
+
+    report = json.loads(baseline.read_text())
+    report['cases']['cards/convert']['throughput'] *= 100
+    baseline.write_text(json.dumps(report))
+    assert main(['--only', 'cards/', '--quick', '--baseline', str(baseline)]) == 1
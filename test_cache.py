@@ -0,0 +1,83 @@
+from poker.cache import LRUCache, CachedSimulation, CachedAnalyzer
+from poker.analysis import HandAnalyzer
+from poker.card import Card, canonicalize
+
+def test_canonicalize_suit_isomorphic_states():
+    key1, _ = canonicalize([Card('A', '♠'), Card('K', '♠')], [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')])
+    key2, _ = canonicalize([Card('K', '♥'), Card('A', '♥')], [Card('2', '♠'), Card('7', '♦'), Card('Q', '♣')])
+    key3, _ = canonicalize([Card('A', '♠'), Card('K', '♥')], [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')])
+    assert key1 == key2
+    assert key1 != key3
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2}
+
+def test_cached_simulation_hits_on_isomorphic_spot():
+    sim = CachedSimulation(maxsize=16)
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('K', '♥'), Card('3', '♠')]
+    first = sim.run([Card('A', '♠'), Card('K', '♠')], board)
+    swapped = [Card('2', '♠'), Card('7', '♦'), Card('Q', '♣'), Card('K', '♠'), Card('3', '♥')]
+    second = sim.run([Card('A', '♥'), Card('K', '♥')], swapped)
+    assert first == second
+    assert (sim.cache.hits, sim.cache.misses) == (1, 1)
+
+def test_cached_analyzer_maps_back_to_user_suits():
+    analyzer = HandAnalyzer()
+    cached = CachedAnalyzer(analyzer, maxsize=16)
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♠'), Card('7', '♠'), Card('Q', '♣')]
+    twin_hero = [Card('A', '♦'), Card('K', '♦')]
+    twin_board = [Card('2', '♦'), Card('7', '♦'), Card('Q', '♥')]
+
+    assert cached.analyze_stronger_hands(hero, board) == analyzer.analyze_stronger_hands(hero, board)
+    assert cached.analyze_stronger_hands(twin_hero, twin_board) == analyzer.analyze_stronger_hands(twin_hero, twin_board)
+    assert cached.cache.hits == 1
+
+
+def test_analyzer_extends_previous_street():
+    analyzer = HandAnalyzer()
+    hero = [Card('A', '♠'), Card('J', '♥')]
+    flop = [Card('K', '♠'), Card('Q', '♠'), Card('2', '♥')]
+    turn = flop + [Card('T', '♣')]
+    river = turn + [Card('5', '♠')]
+
+    analyzer.analyze_stronger_hands(hero, flop)
+    incremental_turn = analyzer.analyze_stronger_hands(hero, turn)
+    incremental_river = analyzer.analyze_stronger_hands(hero, river)
+
+    fresh = HandAnalyzer()
+    assert dict(incremental_turn) == dict(fresh.analyze_stronger_hands(hero, turn))
+    assert dict(incremental_river) == dict(fresh.analyze_stronger_hands(hero, river))
+    assert incremental_river.counts == {k: len(v) for k, v in incremental_river.items()}
+
+
+def test_cached_analyzer_extends_street_when_canonical_suits_change():
+    analyzer = HandAnalyzer()
+    cached = CachedAnalyzer(analyzer, maxsize=16)
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    flop = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+    turn = flop + [Card('3', '♣')]
+    # The clubs on the turn relabel the canonical suits of the flop
+    assert canonicalize(hero, flop)[1] != canonicalize(hero, turn)[1]
+
+    cached.analyze_stronger_hands(hero, flop)
+    hits = analyzer._streets.hits
+    stronger = cached.analyze_stronger_hands(hero, turn)
+    assert analyzer._streets.hits == hits + 1
+    assert dict(stronger) == dict(HandAnalyzer().analyze_stronger_hands(hero, turn))
+
+
+def test_cached_outs_map_back_to_user_suits():
+    cached = CachedSimulation()
+    spades = cached.run_with_outs([Card('A', '♠'), Card('K', '♠')], [Card('2', '♠'), Card('7', '♦'), Card('Q', '♠')])
+    hearts = cached.run_with_outs([Card('A', '♥'), Card('K', '♥')], [Card('2', '♥'), Card('7', '♦'), Card('Q', '♥')])
+    assert cached.cache.hits == 1
+    assert {c.suit for c in spades[1]['outs']['Flush']} == {'♠'}
+    assert {c.suit for c in hearts[1]['outs']['Flush']} == {'♥'}
+    assert spades[0] == hearts[0]
@@ -0,0 +1,154 @@
+from bot.compute import ComputeBackend, ComputeBusy
+from poker.card import Card
+import asyncio
+import time
+import pytest
+
+def test_event_loop_stays_responsive_and_overload_is_reported():
+    async def scenario():
+        backend = ComputeBackend(workers=1, max_pending=2)
+        try:
+            await backend.start()
+            hero = [Card('A', '♠'), Card('K', '♠')]
+            board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+            jobs = [asyncio.ensure_future(backend.compute_spot(hero, board, 1, 200000)) for _ in range(2)]
+            await asyncio.sleep(0)
+
+            with pytest.raises(ComputeBusy):
+                await backend.compute_spot(hero, board)
+
+            # Meanwhile the loop keeps serving other work with low latency
+            delays = []
+            while not all(job.done() for job in jobs):
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                delays.append(time.perf_counter() - start - 0.001)
+            delays.sort()
+            assert delays[int(len(delays) * 0.99) - 1] < 0.01
+
+            probs, analysis = jobs[0].result()
+            assert 50 < probs['equity'] < 60
+            assert backend.pending == 0
+        finally:
+            backend.shutdown()
+
+    asyncio.run(scenario())
+
+def test_stream_spot_yields_progress_before_final_result():
+    async def scenario():
+        backend = ComputeBackend(workers=1)
+        try:
+            await backend.start()
+            hero = [Card('A', '♠'), Card('K', '♠')]
+            board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+            events = []
+            start = time.perf_counter()
+            async for kind, payload in backend.stream_spot(hero, board, 2, 10 ** 7, report_interval=0.1,
+                                                           exact=False, time_budget=0.6):
+                events.append((kind, payload, time.perf_counter() - start))
+            return events
+        finally:
+            backend.shutdown()
+
+    events = asyncio.run(scenario())
+    kinds = [kind for kind, _, _ in events]
+    assert kinds[-1] == 'done' and kinds.count('progress') >= 3
+    first_progress = events[0]
+    assert first_progress[2] < 0.2
+    samples = [payload['samples'] for kind, payload, _ in events if kind == 'progress']
+    assert samples == sorted(samples)
+    assert events[-1][1][0]['samples'] >= samples[-1]
+
+def test_scheduler_supersedes_a_chats_stale_request_and_coalesces_identical_ones():
+    from bot.scheduler import ComputeScheduler, Superseded
+
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+    slow = dict(exact=False, time_budget=5.0, report_interval=0.1)
+
+    async def collect(scheduler, owner, *args, **options):
+        events = []
+        async for kind, payload in scheduler.stream_spot(owner, *args, **options):
+            events.append((kind, payload))
+        return events
+
+    async def scenario():
+        backend = ComputeBackend(workers=1)
+        scheduler = ComputeScheduler(backend)
+        try:
+            await backend.start()
+            start = time.perf_counter()
+            stale = asyncio.ensure_future(collect(scheduler, 'alice', hero, board, 2, 10 ** 7, **slow))
+            await asyncio.sleep(0.3)
+            # Alice taps again: her running 5 s job is cancelled in the worker
+            latest = asyncio.ensure_future(collect(scheduler, 'alice', hero, board[:0], 1, 1000))
+            with pytest.raises(Superseded):
+                await stale
+            assert (await latest)[-1][0] == 'done'
+            assert time.perf_counter() - start < 2.0
+
+            # Bob and Carol ask for the same spot: one job, both get its estimates
+            bob, carol = await asyncio.gather(collect(scheduler, 'bob', hero, board, 2, 10 ** 7, exact=False,
+                                                      time_budget=0.5, report_interval=0.1),
+                                              collect(scheduler, 'carol', hero, board, 2, 10 ** 7, exact=False,
+                                                      time_budget=0.5, report_interval=0.1))
+            assert bob[-1][1] is carol[-1][1] and len(bob) == len(carol) > 1
+            assert scheduler.pending == 0
+        finally:
+            backend.shutdown()
+
+    asyncio.run(scenario())
+
+def test_scheduler_takes_chats_in_turn():
+    from bot.scheduler import ComputeScheduler, Superseded
+
+    class FakeBackend:
+        workers = 1
+        max_pending = 4
+
+        def __init__(self):
+            self.started, self.cancelled, self.ids = [], set(), 0
+
+        def new_job_id(self):
+            self.ids += 1
+            return self.ids
+
+        def cancel(self, job_id):
+            self.cancelled.add(job_id)
+
+        async def stream_spot(self, hero, board, num_opponents, iterations, job_id=None, **options):
+            self.started.append(iterations)
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                if job_id in self.cancelled:
+                    yield 'done', None
+                    return
+            yield 'done', ({'equity': iterations}, '')
+
+    hero = [Card('A', '♠'), Card('K', '♠')]
+
+    async def request(scheduler, owner, tag):
+        try:
+            async for kind, payload in scheduler.stream_spot(owner, hero, [], 1, tag):
+                pass
+            return payload[0]['equity']
+        except Superseded:
+            return None
+
+    async def scenario():
+        backend = FakeBackend()
+        scheduler = ComputeScheduler(backend)
+        tasks = [asyncio.ensure_future(request(scheduler, 'alice', 1))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request(scheduler, 'bob', 100)))
+        await asyncio.sleep(0)
+        # Alice mashes buttons: each tap replaces her previous one, Bob keeps his place
+        for tag in range(2, 12):
+            tasks.append(asyncio.ensure_future(request(scheduler, 'alice', tag)))
+            await asyncio.sleep(0)
+        results = await asyncio.gather(*tasks)
+        return backend, results
+
+    backend, results = asyncio.run(scenario())
+    assert backend.started == [1, 100, 11]
+    assert results == [None, 100] + [None] * 9 + [11]
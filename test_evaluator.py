@@ -0,0 +1,75 @@
+from poker.evaluator import BatchEvaluator, treys_to_index
+from poker.card import Card, Deck, cards_mask, mask_cards
+from treys import Evaluator, Card as TreysCard, Deck as TreysDeck
+import numpy as np
+import pickle
+import pytest
+
+def test_batch_scores_match_treys():
+    batch = BatchEvaluator()
+    evaluator = Evaluator()
+    deck = TreysDeck.GetFullDeck()
+    rng = np.random.default_rng(7)
+
+    for size in (5, 6, 7):
+        cards = np.array([rng.permutation(52)[:size] for _ in range(3000)])
+        expected = [evaluator.evaluate([deck[i] for i in row[:2]], [deck[i] for i in row[2:]]) for row in cards]
+        assert batch.evaluate(cards).tolist() == expected
+
+def test_flush_heavy_hands_match_treys():
+    batch = BatchEvaluator()
+    evaluator = Evaluator()
+    deck = TreysDeck.GetFullDeck()
+    rng = np.random.default_rng(11)
+
+    # Five or more spades per hand, plus random extra cards
+    ranks = np.array([rng.choice(13, 7, replace=False) for _ in range(3000)])
+    cards = ranks * 4
+    cards[:, 5:] += rng.integers(0, 4, (3000, 2))
+    expected = [evaluator.evaluate([deck[i] for i in row[:2]], [deck[i] for i in row[2:]]) for row in cards]
+    scores = batch.evaluate(cards)
+    assert scores.tolist() == expected
+    assert batch.get_rank_class(scores).tolist() == [evaluator.get_rank_class(s) for s in expected]
+
+def test_card_index_matches_treys_deck_order():
+    deck = TreysDeck.GetFullDeck()
+    assert [treys_to_index(c) for c in deck] == list(range(52))
+    assert Card('A', '♥').to_index() == treys_to_index(deck[49])
+
+
+def test_cards_are_interned():
+    assert Card('A', '♥') is Card('A', '♥') is Card.from_index(49)
+    assert pickle.loads(pickle.dumps(Card('7', '♣'))) is Card('7', '♣')
+    assert Card('K', '♦').treys == TreysCard.new('Kd')
+    with pytest.raises(ValueError):
+        Card('1', '♠')
+
+
+def test_deck_mask():
+    deck = Deck()
+    deck.remove([Card('A', '♠'), Card('K', '♠')])
+    assert len(deck) == 50 and Card('A', '♠') not in deck
+    deck.shuffle()
+    dealt = deck.deal(5)
+    assert len(deck) == 45 and not any(c in deck for c in dealt)
+    assert cards_mask(mask_cards(deck.mask)) == deck.mask
+
+def test_tables_file_roundtrip_and_sharing(tmp_path):
+    from poker.evaluator import load_tables, save_tables
+
+    path = str(tmp_path / 'tables.bin')
+    save_tables(path)
+    loaded = load_tables(path)
+    for built, mapped in zip(BatchEvaluator.build_tables(), loaded):
+        assert np.array_equal(built, mapped)
+    assert not loaded[1].flags.writeable
+
+    # Every evaluator of a process uses the same mapped tables
+    a, b = BatchEvaluator(), BatchEvaluator()
+    assert a.unsuited_keys is b.unsuited_keys and a.flush_table is b.flush_table
+
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        f.write(b'\x7f')
+    with pytest.raises(ValueError):
+        load_tables(path)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from poker import flop_table
+from poker.card import Card, parse_cards
+from poker.flop_table import FlopTable, canonical_flops, write_table
+from poker.montecarlo import MonteCarloSimulation
+from poker.preflop import hand_class, representative_hand
+
+
+def test_canonical_flops_cover_every_suit_class_once():
+    # 1,286,792 spots over all 169 classes; pairs and offsuit hands share the count
+    assert len(canonical_flops(parse_cards('AsKs'))) == 4494
+    assert len(canonical_flops(parse_cards('7s7h'))) == 6212
+
+
+def test_built_chunk_matches_exact_enumeration(tmp_path, monkeypatch):
+    monkeypatch.setattr(flop_table, 'CHUNK_SIZE', 3)
+    hero = representative_hand(hand_class(parse_cards('AsKs')))
+    part, count = flop_table._compute_chunk((hand_class(hero), 5, 0, str(tmp_path)))
+    assert count == 3
+
+    saved = np.load(part)
+    path = str(tmp_path / 'flop.bin')
+    write_table(path, saved['keys'], saved['win'], saved['tie'], 0)
+    table = FlopTable.load(path)
+    assert len(table) == 3
+
+    sim = MonteCarloSimulation()
+    sim.flop_table = None
+    flops = [[Card.from_index(i) for i in flop] for flop in canonical_flops(hero)[15:18].tolist()]
+    for flop in flops:
+        # A suit-isomorphic spot hits the same entry
+        hero_swapped, board = swap_spades_hearts(hero), swap_spades_hearts(flop)
+        expected = sim.run(hero_swapped, board, 1, exact=True)
+        result = table.lookup(hero_swapped, board)
+        assert result['equity'] == pytest.approx(expected['equity'], abs=1e-3)
+        assert result['samples'] == expected['samples'] and result['stderr'] == 0
+
+    assert table.lookup(hero, parse_cards('2c3c4c')) is None
+    sim.flop_table = table
+    assert sim.run(hero, flops[0]) == table.lookup(hero, flops[0])
+    # A second opponent or forced sampling bypasses the table
+    assert sim.run(hero, flops[0], 2, iterations=500)['samples'] == 500
+    assert sim.run(hero, flops[0], iterations=500, exact=False)['samples'] == 500
+
+
+def swap_spades_hearts(cards):
+    swap = {'♠': '♥', '♥': '♠', '♦': '♦', '♣': '♣'}
+    return [Card(c.rank, swap[c.suit]) for c in cards]
+
+
+def test_load_rejects_foreign_and_truncated_files(tmp_path):
+    path = str(tmp_path / 'flop.bin')
+    write_table(path, np.array([5, 9], dtype=np.uint32), np.array([0.5, 0.25]), np.array([0.0, 0.1]), 1000)
+    assert FlopTable.load(path).samples == 1000
+
+    with open(path, 'r+b') as f:
+        f.truncate(100)
+    with pytest.raises(ValueError):
+        FlopTable.load(path)
+    with open(path, 'wb') as f:
+        f.write(b'PKPF' + bytes(200))
+    with pytest.raises(ValueError):
+        FlopTable.load(path)
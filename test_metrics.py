@@ -0,0 +1,67 @@
+from bot import compute, metrics
+from bot.compute import ComputeBackend
+from poker.card import Card
+import asyncio
+import urllib.request
+import pytest
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.enable()
+    yield
+    metrics.enabled = False
+
+
+def test_disabled_metrics_record_nothing():
+    hist = metrics.Histogram('test_disabled_seconds', "test", ('street',))
+    with hist.time(street='flop'):
+        pass
+    hist.observe(1.0, street='flop')
+    assert hist.render() == ["# HELP test_disabled_seconds test", "# TYPE test_disabled_seconds histogram"]
+
+
+def test_histogram_text_format(enabled_metrics):
+    hist = metrics.Histogram('test_latency_seconds', "test", ('street',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, street='turn')
+    assert hist.render()[2:] == [
+        'test_latency_seconds_bucket{street="turn",le="0.1"} 1',
+        'test_latency_seconds_bucket{street="turn",le="1"} 3',
+        'test_latency_seconds_bucket{street="turn",le="+Inf"} 4',
+        'test_latency_seconds_sum{street="turn"} 4.05',
+        'test_latency_seconds_count{street="turn"} 4',
+    ]
+
+
+def test_worker_timings_reach_the_endpoint(enabled_metrics):
+    server = metrics.serve(0)
+    port = server.server_address[1]
+
+    async def scenario():
+        backend = ComputeBackend(workers=1)
+        try:
+            hero = [Card('A', '♠'), Card('K', '♠')]
+            board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('T', '♥')]
+            await backend.compute_spot(hero, board, 1, 20000)
+            await asyncio.sleep(0.2)  # worker metrics arrive via the dispatcher thread
+
+            # While profiling, the worker samples its own stacks and sends them back
+            metrics.profiler.start()
+            await asyncio.sleep(2 * compute.PROFILE_POLL_INTERVAL)
+            await backend.compute_spot(hero, board[:3], 3, 200000, exact=False)
+            return metrics.profiler.stop()
+        finally:
+            backend.shutdown()
+
+    try:
+        worker_stacks = asyncio.run(scenario())
+        assert 'worker ' in worker_stacks and '_sample_batch' in worker_stacks
+        text = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        assert 'engine_simulation_seconds_count{street="turn"} 1' in text
+        assert 'engine_samples_total{street="turn"}' in text
+
+        stacks = urllib.request.urlopen(f"http://127.0.0.1:{port}/profile?seconds=0.1").read().decode()
+        assert 'serve_forever' in stacks
+    finally:
+        server.shutdown()
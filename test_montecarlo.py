@@ -0,0 +1,166 @@
+from poker.montecarlo import MonteCarloSimulation
+from poker.analysis import HandAnalyzer
+from poker.card import Card
+from treys import Evaluator, Card as TreysCard, Deck as TreysDeck
+import itertools
+import pytest
+
+def test_exact_river_matches_brute_force():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('K', '♥'), Card('3', '♠')]
+
+    evaluator = Evaluator()
+    hero_treys = [TreysCard.new(c.to_treys_str()) for c in hero]
+    board_treys = [TreysCard.new(c.to_treys_str()) for c in board]
+    remaining = [c for c in TreysDeck.GetFullDeck() if c not in hero_treys + board_treys]
+    hero_score = evaluator.evaluate(board_treys, hero_treys)
+    wins = ties = 0
+    for opp in itertools.combinations(remaining, 2):
+        opp_score = evaluator.evaluate(board_treys, list(opp))
+        wins += opp_score > hero_score
+        ties += opp_score == hero_score
+
+    result = sim.run(hero, board, iterations=15000)
+    assert result['win'] == wins / 990 * 100
+    assert result['tie'] == ties / 990 * 100
+
+def test_exact_turn_is_deterministic_and_close_to_sampling():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('K', '♥')]
+
+    exact = sim.run(hero, board, exact=True)
+    assert exact == sim.run(hero, board, exact=True)
+    sampled = sim.run(hero, board, iterations=20000, exact=False)
+    assert abs(exact['equity'] - sampled['equity']) < 2.0
+
+def test_exact_multiway_river():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('K', '♥'), Card('3', '♠')]
+
+    exact = sim.run(hero, board, num_opponents=2, exact=True)
+    sampled = sim.run(hero, board, num_opponents=2, iterations=20000, exact=False)
+    assert abs(sum(exact[k] for k in ('win', 'tie', 'lose')) - 100) < 1e-9
+    assert abs(exact['equity'] - sampled['equity']) < 2.0
+
+def test_exact_refuses_spots_too_large_to_enumerate():
+    sim = MonteCarloSimulation()
+    with pytest.raises(ValueError):
+        sim.run([Card('A', '♠'), Card('K', '♠')], [], exact=True)
+    with pytest.raises(ValueError):
+        sim.run_with_outs([Card('A', '♠'), Card('K', '♠')], [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')], 3)
+
+
+def test_preflop_table_roundtrip_and_checksum(tmp_path):
+    import numpy as np
+    import pytest
+    from poker.preflop import PreflopTable, hand_class, hand_class_name
+
+    win = np.random.default_rng(3).uniform(0, 90, (169, 9))
+    tie = np.full((169, 9), 1.5)
+    path = str(tmp_path / 'preflop.bin')
+    PreflopTable(win, tie, 1000).save(path)
+
+    table = PreflopTable.load(path)
+    hero = [Card('K', '♥'), Card('A', '♥')]
+    assert hand_class_name(hand_class(hero)) == 'AKs'
+    result = table.lookup(hero, 3)
+    assert result['win'] == pytest.approx(win[hand_class(hero), 2], rel=1e-6)
+    assert result['equity'] == pytest.approx(result['win'] + 0.75, rel=1e-6)
+
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        f.write(b'\x00')
+    with pytest.raises(ValueError):
+        PreflopTable.load(path)
+
+def test_preflop_uses_table_unless_sampling_is_forced():
+    from poker.preflop import PreflopTable
+    import numpy as np
+
+    sim = MonteCarloSimulation()
+    sim.preflop_table = PreflopTable(np.full((169, 9), 42.0), np.zeros((169, 9)), 1)
+    hero = [Card('7', '♣'), Card('2', '♦')]
+    assert sim.run(hero, [])['equity'] == 42.0
+    assert sim.run(hero, [], iterations=2000, exact=False)['equity'] < 40.0
+
+def test_seeded_sampling_is_identical_for_any_worker_count():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+
+    single = sim.run(hero, board, num_opponents=2, iterations=40000, seed=1234)
+    parallel = sim.run(hero, board, num_opponents=2, iterations=40000, seed=1234, workers=3)
+    assert single == parallel
+    assert sim.run(hero, board, num_opponents=2, iterations=40000, seed=4321) != single
+
+def test_adaptive_sampling_stops_at_target_precision():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+
+    result = sim.run(hero, board, iterations=500000, exact=False, target_stderr=0.5, seed=9)
+    assert result['stderr'] <= 0.5
+    assert result['samples'] < 500000
+    assert result['ci_low'] < result['equity'] < result['ci_high']
+
+    budgeted = sim.run(hero, board, iterations=10 ** 9, exact=False, time_budget=0.05)
+    assert 0 < budgeted['samples'] < 10 ** 9
+
+    exact = sim.run(hero, board + [Card('K', '♥'), Card('3', '♠')])
+    assert exact['stderr'] == 0 and exact['samples'] == 990
+
+def test_iter_run_ends_with_the_run_result():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+
+    estimates = list(sim.iter_run(hero, board, iterations=40000, exact=False, seed=5, report_interval=None))
+    assert len(estimates) == 10  # one per 4096-deal batch
+    assert estimates[-1] == sim.run(hero, board, iterations=40000, exact=False, seed=5, time_budget=60)
+
+
+def test_outs_match_equity_after_each_card():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♠'), Card('7', '♦'), Card('Q', '♠')]
+    result, outs = sim.run_with_outs(hero, board)
+
+    assert result == sim.run(hero, board, exact=True)
+    assert outs['current'] == 'High Card'
+    assert len(outs['next_cards']) == 47
+    assert len(outs['outs']['Flush']) == 9
+    by_card = {card: equity for card, _, equity in outs['next_cards']}
+    for card in (Card('T', '♠'), Card('7', '♥'), Card('3', '♦')):
+        assert abs(by_card[card] - sim.run(hero, board + [card], exact=True)['equity']) < 1e-9
+
+    _, turn_outs = sim.run_with_outs(hero, board + [Card('3', '♦')])
+    assert turn_outs['by_river'] == {}
+    assert len(turn_outs['next_cards']) == 46
+
+
+def test_equity_distribution_over_next_cards_and_runouts():
+    sim = MonteCarloSimulation()
+    hero = [Card('9', '♥'), Card('8', '♥')]
+    board = [Card('7', '♥'), Card('6', '♣'), Card('2', '♦')]
+    result, outs = sim.run_with_outs(hero, board)
+    distribution = outs['distribution']
+
+    # Every next card is equally likely, so the spread averages out to the equity
+    assert distribution['count'] == 47 and distribution['street'] == 'turn'
+    assert abs(distribution['mean'] - result['equity']) < 1e-9
+    assert abs(sum(distribution['histogram']) - 100) < 1e-9
+    percentiles = list(distribution['percentiles'].values())
+    assert percentiles == sorted(percentiles)
+    # A straight and flush draw: misses cluster low, hits high, nothing in between
+    assert distribution['std'] > 20 and distribution['histogram'][5] == 0
+
+    runouts = sim.equity_distribution(hero, board, runouts=True)
+    assert runouts['count'] == 1081
+    assert abs(runouts['mean'] - result['equity']) < 1e-9
+    assert runouts['std'] > distribution['std']
+
+    text = HandAnalyzer().format_distribution(distribution)
+    assert 'на терне' in text and text.count('%\n') >= 3
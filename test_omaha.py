@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+import pytest
+from treys import Evaluator
+
+from bot import session
+from bot.compute import _wants_outs, compute_spot
+from bot.handlers import get_current_stage
+from poker.card import CARDS, parse_cards
+from poker.omaha import OMAHA_STREET_CACHE_SIZE, OmahaAnalyzer, OmahaEvaluator, OmahaSimulation, holdings
+
+def _treys_best(hole, board, evaluator=Evaluator()):
+    return min(evaluator.evaluate([CARDS[c].treys for c in three], [CARDS[c].treys for c in two])
+               for two in itertools.combinations(hole, 2) for three in itertools.combinations(board, 3))
+
+def test_evaluator_uses_exactly_two_hole_and_three_board_cards():
+    evaluator = OmahaEvaluator()
+    rng = np.random.default_rng(0)
+    for board_size in (3, 4, 5):
+        cards = np.array([rng.choice(52, 4 + board_size, replace=False) for _ in range(300)])
+        expected = [_treys_best(row[:4], row[4:]) for row in cards]
+        assert evaluator.evaluate(cards[:, :4], cards[:, 4:]).tolist() == expected
+
+    # Four hearts on a four-heart board is no flush with a single heart in hand
+    hole = np.array([[c.index for c in parse_cards('Ah Ks Qd 2c')]])
+    board = np.array([c.index for c in parse_cards('3h 7h 9h Jh 2s')])
+    assert evaluator.evaluate(hole, board)[0] == _treys_best(hole[0], board)
+    # One board shared by many holdings takes the per-pair path; same scores
+    rest = np.setdiff1d(np.arange(52), board)
+    many = holdings(rest)[::50]
+    assert (evaluator.evaluate(many, board) == evaluator.evaluate(many, np.tile(board, (len(many), 1)))).all()
+
+def test_simulation_river_is_exact_and_sampling_agrees():
+    simulation = OmahaSimulation()
+    hero = parse_cards('As Ks Jh Td')
+    board = parse_cards('2h 7d Qc Th 5s')
+    exact = simulation.run(hero, board)
+    assert exact['samples'] == 123410 and exact['stderr'] == 0
+    sampled = simulation.run(hero, board, iterations=20000, exact=False, seed=1)
+    assert abs(sampled['equity'] - exact['equity']) < 4 * sampled['stderr']
+
+    assert 0 < simulation.run(hero, board[:3], num_opponents=3, iterations=4096, seed=1)['equity'] < 100
+    with pytest.raises(ValueError):
+        simulation.run(hero[:2], board)
+    with pytest.raises(ValueError):
+        simulation.run(hero, board, opponent_ranges='QQ+')
+    with pytest.raises(ValueError, match='outs'):
+        simulation.run_with_outs(hero, board[:3])
+    # The bot never asks for outs on a PLO hand
+    assert not _wants_outs(hero, board[:3], 1, {})
+    for runouts in (False, True):
+        with pytest.raises(ValueError, match="Hold'em only"):
+            simulation.equity_distribution(hero, board[:3], runouts=runouts)
+
+def test_analyzer_lists_four_card_holdings():
+    analyzer = OmahaAnalyzer()
+    hero = parse_cards('As Ks Jh Td')
+    board = parse_cards('2h 7d Qc')
+    stronger = analyzer.analyze_stronger_hands(hero, board)
+    # No pair: every holding that pairs up beats the hero
+    assert list(stronger)[-1] == 'Pair'
+    assert all(len(hand) == 8 for hand in stronger['Three of a Kind'])
+
+    turn = board + parse_cards('9s')
+    assert analyzer.analyze_stronger_hands(hero, turn) == OmahaAnalyzer().analyze_stronger_hands(hero, turn)
+    # J-T with Q-9-8 is the best hand on an unpaired board without three of a suit
+    assert not analyzer.analyze_stronger_hands(hero, turn + parse_cards('8c'))
+
+    # Each street holds ~150k holdings, so only a few are kept
+    for card in parse_cards('2c 3c 4c 5c 6c 8s'):
+        analyzer.analyze_stronger_hands(hero, board + [card])
+    assert len(analyzer._streets) <= OMAHA_STREET_CACHE_SIZE
+
+def test_plo_session_and_compute():
+    user_data = {}
+    session.set_game(user_data, 'plo')
+    for card in parse_cards('As Ks Jh Td 2h 7d Qc'):
+        assert session.add_card(user_data, card)
+    assert session.hero(user_data) == parse_cards('As Ks Jh Td')
+    assert session.board(user_data) == parse_cards('2h 7d Qc')
+    assert session.max_cards(user_data) == 9
+    assert get_current_stage(user_data) == 'Turn Card'
+
+    probs, text = compute_spot(session.hero(user_data), session.board(user_data), 1, 20000, opponent_ranges=None)
+    assert 0 < probs['equity'] < 100
+    assert 'Ауты' not in text
@@ -0,0 +1,81 @@
+from poker.ranges import parse_range
+from poker.montecarlo import MonteCarloSimulation
+from poker.card import Card
+from poker.cache import CachedSimulation
+from treys import Evaluator
+import pytest
+
+
+def test_parse_notation():
+    assert len(parse_range('QQ+')) == 18
+    assert len(parse_range('AKs')) == 4
+    assert len(parse_range('ATo+')) == 48
+    assert len(parse_range('A5s-A2s')) == 16
+    assert len(parse_range('99-66, AhKh')) == 25
+    assert len(parse_range('random')) == 1326
+    assert 132 <= len(parse_range('top 10%')) <= 150
+    # Parsed once, then served from the cache
+    assert parse_range('QQ+,  AKs') is parse_range('QQ+, AKs')
+    with pytest.raises(ValueError):
+        parse_range('QQ+, AKx')
+
+
+def test_ranges_compare_by_combos():
+    assert parse_range('qq+, aks') == parse_range('QQ+, AKs')
+    assert parse_range('QQ+') == parse_range('AA, KK, QQ') == parse_range('QQ-AA')
+    assert hash(parse_range('QQ+')) == hash(parse_range('AA, KK, QQ'))
+    assert parse_range('khqh') == parse_range('KhQh')
+    # Only relative weights matter; a different weight is a different range
+    assert parse_range('AKs:2') == parse_range('AKs')
+    assert parse_range('QQ+, AKs:0.5') != parse_range('QQ+, AKs')
+    assert parse_range('QQ+') != parse_range('JJ+')
+
+    sim = CachedSimulation(maxsize=16)
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    sim.run(hero, board, 1, 2000, seed=1, opponent_ranges='QQ+')
+    sim.run(hero, board, 1, 2000, seed=1, opponent_ranges='aa, kk, qq')
+    assert (sim.cache.hits, sim.cache.misses) == (1, 1)
+
+
+def test_weights_override_earlier_tokens():
+    hand_range = parse_range('AK, AKo:0.5')
+    assert len(hand_range) == 16
+    assert sorted(hand_range.weights.tolist()) == [0.5] * 12 + [1.0] * 4
+    assert len(parse_range('AK, AKs:0')) == 12
+
+
+def test_range_equity_matches_enumeration_on_the_river():
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣'), Card('T', '♥'), Card('5', '♠')]
+    villain = parse_range('QQ+, AQ, 77:0.5').without(sum(c.bit for c in hero + board))
+
+    evaluator = Evaluator()
+    treys_board = [c.treys for c in board]
+    hero_score = evaluator.evaluate([c.treys for c in hero], treys_board)
+    equity = 0.0
+    for (c1, c2), weight in zip(villain.combos.tolist(), villain.weights.tolist()):
+        score = evaluator.evaluate([Card.from_index(c1).treys, Card.from_index(c2).treys], treys_board)
+        equity += weight * (1.0 if hero_score < score else 0.5 if hero_score == score else 0.0)
+    equity = equity / villain.weights.sum() * 100
+
+    result = MonteCarloSimulation().run(hero, board, 1, 200000, opponent_ranges='QQ+, AQ, 77:0.5', seed=3)
+    assert abs(result['equity'] - equity) < 4 * result['stderr'] + 0.1
+
+
+def test_random_range_matches_uniform_opponent():
+    sim = MonteCarloSimulation()
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+    exact = sim.run(hero, board, 1, exact=True)['equity']
+    ranged = sim.run(hero, board, 1, 100000, opponent_ranges='random', seed=1)
+    assert abs(ranged['equity'] - exact) < 4 * ranged['stderr']
+
+
+def test_range_vs_range_is_symmetric():
+    sim = MonteCarloSimulation()
+    a = sim.run(parse_range('QQ'), [], 1, 60000, opponent_ranges='AKs', seed=5)
+    b = sim.run(parse_range('AKs'), [], 1, 60000, opponent_ranges='QQ', seed=6)
+    assert abs(a['equity'] + b['equity'] - 100) < 4 * (a['stderr'] + b['stderr'])
+    with pytest.raises(ValueError):
+        sim.run([Card('A', '♠'), Card('K', '♠')], [], 1, opponent_ranges='QQ', exact=True)
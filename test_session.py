@@ -0,0 +1,111 @@
+import asyncio
+import pickle
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram import Update
+
+from bot import session
+from bot.keyboards import get_rank_keyboard
+from poker.card import Card, cards_mask
+
+def test_session_state_is_small_ints():
+    user_data = {}
+    session.ensure(user_data)
+    for card in [Card('A', '♠'), Card('K', '♠'), Card('2', '♥'), Card('7', '♦')]:
+        assert session.add_card(user_data, card)
+    assert not session.add_card(user_data, Card('K', '♠'))
+
+    assert session.hero(user_data) == [Card('A', '♠'), Card('K', '♠')]
+    assert session.board(user_data) == [Card('2', '♥'), Card('7', '♦')]
+    assert session.undo(user_data) == Card('7', '♦')
+    assert session.used_mask(user_data) == cards_mask([Card('A', '♠'), Card('K', '♠'), Card('2', '♥')])
+    assert all(type(v) is int for v in user_data['cards'])
+    assert len(pickle.dumps(user_data)) < 80
+
+def test_rank_keyboards_are_shared_per_suit_pattern():
+    used = cards_mask([Card('A', '♠'), Card('K', '♠')])
+    keyboard = get_rank_keyboard('♠', used)
+    buttons = [b for row in keyboard.inline_keyboard for b in row]
+    assert [b.callback_data for b in buttons[-3:-1]] == ['ignore', 'ignore']
+    assert buttons[0].callback_data == 'rank:2:♠'
+    # Cards of other suits don't change the spade keyboard
+    assert get_rank_keyboard('♠', used | Card('2', '♥').bit) is keyboard
+    assert get_rank_keyboard('♠', Card('A', '♠').bit) is not keyboard
+
+def test_stale_keyboard_tap_does_not_add_a_card_twice():
+    from bot import handlers
+
+    def update(data):
+        mock = MagicMock(spec=Update)
+        mock.callback_query = AsyncMock()
+        mock.callback_query.data = data
+        return mock
+
+    context = MagicMock(user_data={})
+    for data in ['action:reset', 'rank:A:♠', 'rank:A:♠', 'action:undo', 'rank:Q:♥']:
+        asyncio.run(handlers.handle_callback(update(data), context))
+    assert session.hero(context.user_data) == [Card('Q', '♥')]
+
+def test_reset_or_undo_during_a_calculation_drops_its_result():
+    from bot import handlers
+    from bot.scheduler import ComputeScheduler
+
+    class SlowBackend:
+        workers = 1
+        max_pending = 4
+
+        def __init__(self):
+            self.cancelled = set()
+
+        def new_job_id(self):
+            return len(self.cancelled) + 1000
+
+        def cancel(self, job_id):
+            self.cancelled.add(job_id)
+
+        async def stream_spot(self, hero, board, num_opponents, iterations, job_id=None, **options):
+            yield 'progress', {'win': 60.0, 'tie': 0.0, 'lose': 40.0, 'equity': 60.0}
+            await asyncio.sleep(0.2)
+            yield 'done', ({'win': 61.0, 'tie': 0.0, 'lose': 39.0, 'equity': 61.0}, "old analysis")
+
+    edits = []
+
+    def update(data):
+        mock = MagicMock(spec=Update)
+        mock.callback_query = AsyncMock()
+        mock.callback_query.data = data
+        mock.callback_query.edit_message_text.side_effect = lambda text, **kw: edits.append(text)
+        mock.effective_chat.id = 42
+        return mock
+
+    async def tap(context, data):
+        await handlers.handle_callback(update(data), context)
+
+    async def scenario(interrupt):
+        context = MagicMock(user_data={})
+        for data in ['action:reset', 'rank:A:♠']:
+            await tap(context, data)
+        calculation = asyncio.ensure_future(tap(context, 'rank:K:♠'))
+        await asyncio.sleep(0.05)
+        if interrupt:
+            await tap(context, interrupt)
+        await calculation
+        return context.user_data
+
+    scheduler = handlers.scheduler
+    handlers.scheduler = ComputeScheduler(SlowBackend())
+    try:
+        for interrupt in ('action:reset', 'action:undo'):
+            edits.clear()
+            asyncio.run(scenario(interrupt))
+            assert "Выберите Карту Героя" in edits[-1]
+            assert "Эквити" not in edits[-1] and "old analysis" not in edits[-1]
+            assert handlers.scheduler.pending == 0
+
+        # Uninterrupted: the session keeps only its cards, the message is rebuilt from the results
+        user_data = asyncio.run(scenario(None))
+        assert set(user_data) <= set(session.SESSION_KEYS)
+        assert "61.0%" in edits[-1] and "old analysis" in edits[-1]
+        assert "61.0%" in asyncio.run(handlers.format_game_state(user_data))
+    finally:
+        handlers.scheduler = scheduler
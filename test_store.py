@@ -0,0 +1,66 @@
+from poker.store import DiskCache
+from poker.cache import CachedSimulation, CachedAnalyzer
+from poker.card import Card
+from concurrent.futures import ProcessPoolExecutor
+from bot.warm import flop_spots
+import time
+
+
+def _writer(args):
+    path, worker = args
+    store = DiskCache(path)
+    for i in range(200):
+        store.put(('spot', worker, i), {'equity': float(i)})
+    return len(store)
+
+
+def test_persists_and_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'equity.db')
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        list(pool.map(_writer, [(path, w) for w in range(4)]))
+
+    store = DiskCache(path)
+    assert len(store) == 800
+    assert store.get(('spot', 3, 150)) == {'equity': 150.0}
+    assert store.get(('spot', 9, 0)) is None
+
+    start = time.perf_counter()
+    for i in range(1000):
+        store.get(('spot', i % 4, i % 200))
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = DiskCache(str(tmp_path / 'equity.db'), max_entries=100)
+    for i in range(100):
+        store.put(i, i)
+    for _ in range(64):
+        store.get(0)  # a full batch of hits refreshes entry 0
+    for i in range(100, 150):
+        store.put(i, i)
+    store.evict()
+    assert len(store) == 90
+    assert store.get(0) == 0 and store.get(1) is None and store.get(149) == 149
+
+
+def test_cached_engines_read_through_the_store(tmp_path):
+    path = str(tmp_path / 'equity.db')
+    hero = [Card('A', '♠'), Card('K', '♠')]
+    board = [Card('2', '♥'), Card('7', '♦'), Card('Q', '♣')]
+    first = CachedSimulation(store=DiskCache(path))
+    result = first.run(hero, board, 1, 5000, exact=False, seed=1)
+    CachedAnalyzer(store=DiskCache(path)).analyze_stronger_hands(hero, board)
+
+    # A fresh process-like setup: empty memory caches, same file
+    second = CachedSimulation(store=DiskCache(path))
+    suited = [Card('A', '♥'), Card('K', '♥')]
+    assert second.run(suited, [Card('2', '♠'), Card('7', '♦'), Card('Q', '♣')], 1, 5000, exact=False, seed=1) == result
+    assert second.cache.hits == 1
+    analyzer = CachedAnalyzer(store=DiskCache(path))
+    assert analyzer.analyze_stronger_hands(hero, board).counts and analyzer.cache.hits == 1
+
+
+def test_warm_spots_are_suit_distinct():
+    spots = flop_spots('AKs', 0)
+    assert 1000 < len(spots) < 19600
+    assert len(flop_spots('AA, KK', 50)) == 100
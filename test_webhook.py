@@ -0,0 +1,155 @@
+import asyncio
+import os
+import signal
+import socket
+import sys
+
+import httpx
+import pytest
+
+from bot.fake_telegram import FakeBotAPI, callback_update, play, session_taps
+from bot.remote import ComputeServer, RemoteScheduler, _read_frame, _write_frame
+from bot.webhook import MAX_HEADER_LINES, SECRET_HEADER, WebhookServer, reuse_port_socket
+from poker.card import CARDS, parse_cards
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_webhook_frontends_share_sessions_and_drain_on_stop(tmp_path):
+    async def scenario():
+        api = FakeBotAPI()
+        await api.start()
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}/telegram"
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'bot.webhook', '--host', '127.0.0.1', '--port', str(port), '--frontends', '2',
+            '--workers', '1', '--secret', 's3cret', '--api-url', api.url,
+            '--compute-socket', str(tmp_path / 'compute.sock'), '--session-db', str(tmp_path / 'sessions.db'),
+            cwd=ROOT, env=dict(os.environ, TELEGRAM_BOT_TOKEN='123:TEST'))
+        try:
+            async with httpx.AsyncClient(timeout=60) as client:
+                for _ in range(600):
+                    try:
+                        if (await client.post(url, json={})).status_code == 403:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.1)
+
+                # Each user's taps land on either front-end; the shared sessions keep every card
+                await play(url, users=3, secret='s3cret')
+                for user_id in (1000, 1001, 1002):
+                    taps = session_taps(user_id)
+                    final = api.calls_for(user_id)[-1]['text']
+                    for data in taps[2::2]:
+                        _, rank, suit = data.split(':')
+                        assert rank + suit in final
+                    assert 'Эквити' in final
+
+                # Stopping while a flop is calculated: the update is still handled and acknowledged
+                headers = {'x-telegram-bot-api-secret-token': 's3cret'}
+                taps = ['action:reset'] + [f"rank:{c.rank}:{c.suit}" for c in (CARDS[51], CARDS[47], CARDS[0], CARDS[9])]
+                for i, data in enumerate(taps):
+                    await client.post(url, json=callback_update(100 + i, 2000, data), headers=headers)
+                flop = asyncio.ensure_future(client.post(url, json=callback_update(200, 2000, 'rank:7:♦'),
+                                                         headers=headers))
+                await asyncio.sleep(0.05)
+                process.send_signal(signal.SIGTERM)
+                assert (await flop).status_code == 200
+                assert 'Эквити' in api.calls_for(2000)[-1]['text']
+            assert await asyncio.wait_for(process.wait(), 60) == 0
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await api.close()
+
+    asyncio.run(scenario())
+
+class _EchoScheduler:
+    """Stands in for the ComputeScheduler: echoes what reached the server."""
+
+    def __init__(self):
+        self.superseded = []
+
+    def supersede(self, owner):
+        self.superseded.append(owner)
+
+    async def stream_spot(self, owner, hero, board, num_opponents=1, iterations=15000, **options):
+        if options.get('fail'):
+            raise ValueError("bad spot")
+        yield 'progress', {'equity': 50.0, 'samples': 1}
+        yield 'done', ({'equity': 50.0}, f"{owner} {hero + board} {num_opponents} {options}")
+
+def test_webhook_refuses_on_the_head_before_reading_the_body():
+    async def scenario():
+        sock = reuse_port_socket('127.0.0.1', 0)
+        port = sock.getsockname()[1]
+        server = WebhookServer(None, '/hook', secret='s3cret')
+        await server.start(sock)
+
+        async def send(head):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(head)  # A body is promised but never sent: only the head may be read
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response.split(b'\r\n', 1)[0]
+
+        try:
+            huge = b'Content-Length: 10000000000\r\n'
+            assert await send(b'POST /other HTTP/1.1\r\n' + huge + b'\r\n') == b'HTTP/1.1 404 Not Found'
+            assert await send(b'POST /hook HTTP/1.1\r\n' + huge + b'\r\n') == b'HTTP/1.1 403 Forbidden'
+            secret = f'{SECRET_HEADER}: s3cret\r\n'.encode()
+            assert await send(b'POST /hook HTTP/1.1\r\n' + secret + huge + b'\r\n') == b'HTTP/1.1 413 Payload Too Large'
+            # Endless headers just close the connection
+            assert await send(b'POST /hook HTTP/1.1\r\n' + b'X: y\r\n' * (MAX_HEADER_LINES + 1)) == b''
+        finally:
+            await server.drain(timeout=1)
+
+    asyncio.run(scenario())
+
+def test_remote_frames_are_json_and_the_socket_private(tmp_path):
+    async def scenario():
+        path = str(tmp_path / 'compute.sock')
+        server = ComputeServer(_EchoScheduler(), path)
+        await server.start()
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        remote = RemoteScheduler(path)
+        try:
+            events = [e async for e in remote.stream_spot(7, parse_cards('As Kd'), parse_cards('2h 7d Qc'), 2,
+                                                          target_stderr=0.5)]
+            assert events == [('progress', {'equity': 50.0, 'samples': 1}),
+                              ('done', ({'equity': 50.0}, "7 [A♠, K♦, 2♥, 7♦, Q♣] 2 {'target_stderr': 0.5}"))]
+            with pytest.raises(ValueError, match='bad spot'):
+                [e async for e in remote.stream_spot(object(), parse_cards('As Kd'), [], fail=True)]
+            remote.supersede(7)
+            await asyncio.sleep(0.05)
+            assert server.scheduler.superseded == [7]
+
+            # A malformed spot is answered on the connection; a frame that isn't JSON drops it
+            reader, writer = await asyncio.open_unix_connection(path)
+            _write_frame(writer, ('spot', 3, 7, ([99], [], 1, 10), {}))
+            assert await asyncio.wait_for(_read_frame(reader), 5) == [3, 'error', ['ValueError', 'Bad frame: Bad card indices: [99]']]
+            writer.write(b'\x00\x00\x00\x05cos\nsystem')
+            assert await asyncio.wait_for(reader.read(), 5) == b''
+            writer.close()
+
+            # A lost connection is reopened by the next request, and fails fast once the server is gone
+            for task in list(server._connections):
+                task.cancel()
+            await asyncio.sleep(0.05)
+            assert len([e async for e in remote.stream_spot(7, parse_cards('As Kd'), [], 1)]) == 2
+            await server.drain(timeout=1)
+            for task in list(server._connections):
+                task.cancel()
+            await asyncio.sleep(0.05)
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(remote.stream_spot(7, parse_cards('As Kd'), [], 1).__anext__(), 1)
+        finally:
+            remote.shutdown()
+            await server.drain(timeout=1)
+
+    asyncio.run(scenario())